@@ -0,0 +1,471 @@
+# api_server.py
+"""
+Headless HTTP/JSON API for OCR, solving, explanations and animation renders.
+
+Run with:  python api_server.py  (GEMINI_API_KEY must be set for /solve and /explain;
+OCR_BACKEND=int8 and OCR_INTRA_OP_THREADS pick the OCR backend, see helpers.ocr_backend)
+
+Endpoints:
+POST /ocr                 image upload (multipart field "image" or raw body) -> {"latex"}
+                          422 with the reason for blurry, dark or blank photos
+POST /solve               {"latex"} -> {"solution", "source", "latency_ms"}
+POST /explain             {"latex"} -> {"explanation"}
+POST /render              {"latex", "explanation", ...} -> 202 {"job_id", "status_url"}
+                          "explanation" may be omitted for equations derived locally;
+                          optional "quality", "target_duration", "encoding", "renderer"
+                          and "parallel" are validated (400 on bad values)
+GET  /jobs/{job_id}       render status; "video_url" once done
+GET  /jobs/{job_id}/video rendered video, streamed with Range support
+GET  /health              load, queue depths, cache hit rates and OCR worker memory
+"""
+import io
+import os
+import time
+import hashlib
+import uuid
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+from PIL import Image
+
+from helpers.latex_validator import LatexValidationError
+from helpers.quality_controller import choose_render_quality, schedule_upgrade, MAX_QUEUE_DEPTH
+from helpers.video_encoder import ENCODING_PRESETS
+from helpers.renderer_select import RENDERERS
+from helpers.solver_core import (load_ocr_model, extract_latex, configure_gemini, gemini_response,
+                                 solution_prompt, explanation_prompt, ocr_worker_report)
+from helpers.local_solver import solve_locally
+from helpers.storage_manager import start_background_sweeper
+from helpers.local_derivation import derive_steps
+from helpers.equation_index import shared_index, content_digest
+from helpers.image_hash import fingerprint, shared_image_index
+from helpers.ocr_preprocess import prepare_for_ocr, normalize_mode, UnusableImage
+from helpers.ocr_workers import OCR_WORKERS
+import helpers.manim_animator
+
+API_HOST = os.environ.get("API_HOST", "0.0.0.0")
+API_PORT = int(os.environ.get("API_PORT", "8080"))
+
+# Seconds an idle keep-alive connection stays open (e.g. behind a load balancer)
+KEEPALIVE_TIMEOUT = 75
+
+# Largest accepted request body (image uploads)
+MAX_BODY_BYTES = 10 * 1024 ** 2
+
+# Concurrent calls per kind of work, and how many more may wait before we
+# answer 429. In-process OCR runs one at a time since the model already uses
+# every core; with forked OCR workers, one call per worker.
+OCR_CONCURRENCY = max(1, OCR_WORKERS)
+OCR_QUEUE = 8
+LLM_CONCURRENCY = 8
+LLM_QUEUE = 32
+RENDER_CONCURRENCY = MAX_QUEUE_DEPTH
+RENDER_QUEUE = 4 * MAX_QUEUE_DEPTH
+
+# Manim processes one parallel render may use: its share of the cores, so
+# RENDER_CONCURRENCY parallel jobs don't oversubscribe the machine
+RENDER_WORKERS_PER_JOB = max(1, (os.cpu_count() or 1) // RENDER_CONCURRENCY)
+
+# Accepted /render settings; durations match the app's slider
+RENDER_QUALITIES = ("low", "medium", "high")
+MIN_TARGET_DURATION = 10
+MAX_TARGET_DURATION = 120
+
+# Seconds clients are asked to wait after a 429
+RETRY_AFTER = 5
+
+# Finished render jobs remembered for polling
+MAX_JOBS = 1000
+
+
+class Overloaded(Exception):
+    """Raised when a limiter's queue is full."""
+
+
+class Limiter:
+    """Caps concurrent work and rejects callers once the wait queue is full."""
+
+    def __init__(self, name, concurrency, queue_size):
+        self.name = name
+        self.capacity = concurrency + queue_size
+        self.pending = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def reserve(self):
+        """
+        Claim a place in the queue without waiting; raises Overloaded when full.
+        Only called from the event loop thread, so no lock is needed.
+        """
+        if self.pending >= self.capacity:
+            raise Overloaded(self.name)
+        self.pending += 1
+
+    def release(self):
+        """
+        Give back a place claimed with reserve() that will not be used.
+        """
+        self.pending -= 1
+
+    @asynccontextmanager
+    async def slot(self, reserved=False):
+        if not reserved:
+            self.reserve()
+        try:
+            async with self._semaphore:
+                yield
+        finally:
+            self.pending -= 1
+
+
+class RenderJobState:
+    """Status of one /render request."""
+
+    def __init__(self, job_id, quality):
+        self.job_id = job_id
+        self.quality = quality
+        self.status = "queued"
+        self.video_path = None
+        self.error = None
+        self.created = time.time()
+        self.upgrade = None
+
+    def to_json(self):
+        body = {"job_id": self.job_id, "status": self.status, "quality": self.quality}
+        if self.video_path:
+            body["video_url"] = f"/jobs/{self.job_id}/video"
+        if self.error:
+            body["error"] = self.error
+        if self.upgrade is not None:
+            body["upgrade_pending"] = not self.upgrade.done()
+        return body
+
+
+def error_response(status, message, **headers):
+    return web.json_response({"error": message}, status=status, headers=headers)
+
+
+@web.middleware
+async def errors_middleware(request, handler):
+    try:
+        return await handler(request)
+    except Overloaded as e:
+        return error_response(429, f"Too many pending {e} requests; retry later",
+                              **{"Retry-After": str(RETRY_AFTER)})
+    except LatexValidationError as e:
+        return error_response(422, f"LaTeX cannot be rendered: {str(e)}")
+    except UnusableImage as e:
+        return error_response(422, str(e))
+    except web.HTTPException:
+        raise
+    except Exception as e:
+        print(f"API error on {request.path}: {str(e)}")
+        return error_response(500, str(e))
+
+
+async def run_blocking(request, func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(request.app["executor"], func, *args)
+
+
+async def read_latex(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="Expected a JSON body")
+    if not isinstance(body, dict) or not isinstance(body.get("latex") or "", str):
+        raise web.HTTPBadRequest(text='Expected a JSON object with a "latex" string')
+    latex = (body.get("latex") or "").strip()
+    if not latex:
+        raise web.HTTPBadRequest(text='Missing "latex"')
+    return body, latex
+
+
+def gemini_model(request):
+    model = request.app["gemini"]
+    if model is None:
+        raise web.HTTPServiceUnavailable(text="GEMINI_API_KEY is not configured")
+    return model
+
+
+async def handle_ocr(request):
+    if request.content_type.startswith("multipart/"):
+        form = await request.post()
+        upload = form.get("image")
+        if upload is None or not hasattr(upload, "file"):
+            raise web.HTTPBadRequest(text='Missing "image" file field')
+        data = upload.file.read()
+    else:
+        data = await request.read()
+    if not data:
+        raise web.HTTPBadRequest(text="Empty image")
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception:
+        raise web.HTTPBadRequest(text="Unreadable image")
+    # GIFs decode to palette images, fax TIFFs to bilevel and scans to 16-bit ones
+    image = normalize_mode(image)
+
+    # The same upload, or another photo of an already processed page, reuses its result
+    digest = hashlib.sha256(data).hexdigest()
+    cached = request.app["image_index"].get(digest)
+    if not cached:
+        page_fingerprint = await run_blocking(request, fingerprint, image)
+        cached = request.app["image_index"].find(page_fingerprint)
+    if cached:
+        raw_latex, latex = cached
+        return web.json_response({"latex": latex, "raw_latex": raw_latex, "cached": True})
+    # Unreadable photos are rejected here rather than queueing for an OCR slot
+    image = await run_blocking(request, prepare_for_ocr, image)
+    async with request.app["ocr_limiter"].slot():
+        raw_latex, latex = await run_blocking(request, lambda: extract_latex(image, prepared=True))
+    request.app["image_index"].add(page_fingerprint, (raw_latex, latex), digest)
+    return web.json_response({"latex": latex, "raw_latex": raw_latex, "cached": False})
+
+
+async def handle_solve(request):
+    _, latex = await read_latex(request)
+    index = request.app["equation_index"]
+    start = time.perf_counter()
+    cached = index.get(latex, "solution")
+    if cached:
+        return web.json_response(dict(cached, latex=latex, cached=True,
+                                      latency_ms=round((time.perf_counter() - start) * 1000, 1)))
+    # Try SymPy first; it answers tractable equations without a network call
+    local = await run_blocking(request, solve_locally, latex)
+    if local:
+        index.put(latex, "solution", {"solution": local.answer, "source": "sympy"})
+        return web.json_response({"latex": latex, "solution": local.answer, "source": "sympy",
+                                  "cached": False, "latency_ms": round(local.seconds * 1000, 1)})
+    model = gemini_model(request)
+    async with request.app["llm_limiter"].slot():
+        solution = await run_blocking(request, gemini_response, solution_prompt(latex), model)
+    if solution:
+        index.put(latex, "solution", {"solution": solution, "source": "gemini"})
+    return web.json_response({"latex": latex, "solution": solution, "source": "gemini", "cached": False,
+                              "latency_ms": round((time.perf_counter() - start) * 1000, 1)})
+
+
+async def handle_explain(request):
+    _, latex = await read_latex(request)
+    index = request.app["equation_index"]
+    explanation = index.get(latex, "explanation")
+    if explanation:
+        return web.json_response({"latex": latex, "explanation": explanation, "cached": True})
+    model = gemini_model(request)
+    async with request.app["llm_limiter"].slot():
+        explanation = await run_blocking(request, gemini_response, explanation_prompt(latex), model)
+    if explanation:
+        index.put(latex, "explanation", explanation)
+    return web.json_response({"latex": latex, "explanation": explanation, "cached": False})
+
+
+def read_render_options(body):
+    """
+    Validate the settings of a /render body.
+    Returns:
+    tuple: (quality, explanation, options for create_solution_animation)
+    Raises:
+    web.HTTPBadRequest: Naming the first invalid field
+    """
+    def invalid(message):
+        return web.HTTPBadRequest(text=message)
+
+    quality = body.get("quality", "medium")
+    if not isinstance(quality, str) or quality.lower() not in RENDER_QUALITIES:
+        raise invalid(f'"quality" must be one of {", ".join(RENDER_QUALITIES)}')
+    explanation = body.get("explanation") or ""
+    if not isinstance(explanation, str):
+        raise invalid('"explanation" must be a string')
+    duration = body.get("target_duration")
+    if duration is not None:
+        if isinstance(duration, bool) or not isinstance(duration, (int, float)) \
+                or not MIN_TARGET_DURATION <= duration <= MAX_TARGET_DURATION:
+            raise invalid(f'"target_duration" must be a number of seconds from '
+                          f'{MIN_TARGET_DURATION} to {MAX_TARGET_DURATION}')
+        duration = float(duration)
+    encoding = body.get("encoding")
+    if encoding is not None and (not isinstance(encoding, str) or encoding not in ENCODING_PRESETS):
+        raise invalid(f'"encoding" must be one of {", ".join(ENCODING_PRESETS)}')
+    renderer = body.get("renderer")
+    if renderer is not None and renderer not in RENDERERS:
+        raise invalid(f'"renderer" must be one of {", ".join(RENDERERS)}')
+    parallel = body.get("parallel", False)
+    if not isinstance(parallel, bool):
+        raise invalid('"parallel" must be true or false')
+    options = {
+        "target_duration": duration,
+        "encoding": encoding,
+        "renderer": renderer,
+        # A parallel job only gets its share of the cores
+        "parallel": RENDER_WORKERS_PER_JOB if parallel and RENDER_WORKERS_PER_JOB > 1 else False,
+    }
+    return quality.lower(), explanation, options
+
+
+async def handle_render(request):
+    body, latex = await read_latex(request)
+    requested, explanation, options = read_render_options(body)
+    limiter = request.app["render_limiter"]
+    # Claim the queue place before any blocking work, as /ocr does, so a burst
+    # of requests is turned away before it ties up the executor; the render
+    # task takes it over, and every other way out of here gives it back
+    limiter.reserve()
+    started = False
+    try:
+        # Locally derived steps need no explanation and no Gemini call
+        steps = await run_blocking(request, derive_steps, latex)
+        if not steps and not explanation.strip():
+            raise web.HTTPBadRequest(text='Missing "explanation" (no local derivation for this equation)')
+        options["solution_steps"] = steps
+        jobs = request.app["jobs"]
+        index = request.app["equation_index"]
+        # Same equation with a different explanation or derivation is a different video
+        variant = (requested, options["target_duration"], options["encoding"], options["renderer"],
+                   content_digest(explanation, steps))
+
+        # An equivalent equation was already rendered with these settings
+        cached_path = index.get(latex, "video", variant)
+        if cached_path and os.path.exists(cached_path):
+            job = RenderJobState(uuid.uuid4().hex, requested)
+            job.video_path = cached_path
+            job.status = "done"
+            add_job(jobs, job)
+            return web.json_response(dict(job.to_json(), status_url=f"/jobs/{job.job_id}", cached=True))
+
+        # Degrade to a fast preview under load, upgrading in the background
+        decision = choose_render_quality(requested)
+        job = RenderJobState(uuid.uuid4().hex, decision.quality)
+
+        async def run():
+            try:
+                async with limiter.slot(reserved=True):
+                    job.status = "running"
+                    video_path = await run_blocking(
+                        request, lambda: helpers.manim_animator.create_solution_animation(
+                            latex, explanation, quality=decision.quality, fps=decision.fps, **options))
+                if video_path:
+                    job.video_path = video_path
+                    job.status = "done"
+                    index.put(latex, "video", video_path, (decision.quality,) + variant[1:])
+                    if decision.upgrade:
+                        job.upgrade = schedule_upgrade(
+                            helpers.manim_animator.create_solution_animation,
+                            latex, explanation, quality=requested, **options)
+                        job.upgrade.add_done_callback(lambda f: upgrade_done(job, f, index, latex, variant))
+                else:
+                    job.status = "failed"
+                    job.error = "Animation could not be generated"
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+
+        task = asyncio.ensure_future(run())
+        started = True
+    finally:
+        if not started:
+            limiter.release()
+    add_job(jobs, job)
+    request.app["tasks"].add(task)
+    task.add_done_callback(request.app["tasks"].discard)
+    return web.json_response(
+        dict(job.to_json(), status_url=f"/jobs/{job.job_id}"),
+        status=202
+    )
+
+
+def add_job(jobs, job):
+    jobs[job.job_id] = job
+    while len(jobs) > MAX_JOBS:
+        jobs.popitem(last=False)
+
+
+def upgrade_done(job, future, index, latex, variant):
+    # Runs on the upgrade thread; a plain attribute swap is enough
+    if not future.cancelled() and future.exception() is None and future.result():
+        job.video_path = future.result()
+        index.put(latex, "video", job.video_path, variant)
+
+
+def find_job(request):
+    job = request.app["jobs"].get(request.match_info["job_id"])
+    if job is None:
+        raise web.HTTPNotFound(text="Unknown job")
+    return job
+
+
+async def handle_job(request):
+    return web.json_response(find_job(request).to_json())
+
+
+async def handle_job_video(request):
+    job = find_job(request)
+    if not job.video_path or not os.path.exists(job.video_path):
+        raise web.HTTPConflict(text=f"Job is {job.status}")
+    # FileResponse streams from disk in chunks and honours Range requests
+    return web.FileResponse(job.video_path)
+
+
+async def handle_health(request):
+    app = request.app
+    return web.json_response({
+        "status": "ok",
+        "pending": {name: app[f"{name}_limiter"].pending for name in ("ocr", "llm", "render")},
+        "jobs": len(app["jobs"]),
+        "equation_index": app["equation_index"].stats(),
+        "image_index": app["image_index"].stats(),
+        "ocr_workers": ocr_worker_report(),
+    })
+
+
+async def on_startup(app):
+    app["ocr_limiter"] = Limiter("ocr", OCR_CONCURRENCY, OCR_QUEUE)
+    app["llm_limiter"] = Limiter("llm", LLM_CONCURRENCY, LLM_QUEUE)
+    app["render_limiter"] = Limiter("render", RENDER_CONCURRENCY, RENDER_QUEUE)
+    api_key = os.environ.get("GEMINI_API_KEY")
+    app["gemini"] = configure_gemini(api_key) if api_key else None
+    if app["gemini"] is None:
+        print("GEMINI_API_KEY not set; /solve and /explain are disabled")
+    # Load the OCR model now so the first /ocr request isn't slow
+    try:
+        await asyncio.get_running_loop().run_in_executor(app["executor"], load_ocr_model)
+    except Exception as e:
+        print(f"Could not preload the OCR model: {str(e)}")
+    # Keep uploads, animations/ and temp_manim/ within quota, as the Streamlit app does
+    start_background_sweeper()
+
+
+async def on_cleanup(app):
+    for task in app["tasks"]:
+        task.cancel()
+    app["executor"].shutdown(wait=False)
+
+
+def create_app():
+    app = web.Application(middlewares=[errors_middleware], client_max_size=MAX_BODY_BYTES)
+    app["executor"] = ThreadPoolExecutor(
+        max_workers=OCR_CONCURRENCY + LLM_CONCURRENCY + RENDER_CONCURRENCY,
+        thread_name_prefix="api-worker"
+    )
+    app["jobs"] = OrderedDict()
+    app["tasks"] = set()
+    # Solutions, explanations and videos shared by equivalent equations
+    app["equation_index"] = shared_index()
+    app["image_index"] = shared_image_index()
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_post("/ocr", handle_ocr)
+    app.router.add_post("/solve", handle_solve)
+    app.router.add_post("/explain", handle_explain)
+    app.router.add_post("/render", handle_render)
+    app.router.add_get("/jobs/{job_id}", handle_job)
+    app.router.add_get("/jobs/{job_id}/video", handle_job_video)
+    app.router.add_get("/health", handle_health)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host=API_HOST, port=API_PORT, keepalive_timeout=KEEPALIVE_TIMEOUT)
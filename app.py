@@ -9,7 +9,10 @@ import streamlit as st
 import io
 import time
 import sys
+import hashlib
+import importlib
 import traceback
+from functools import partial
 
 # Import PIL before PyTorch-related imports
 from PIL import Image
@@ -21,58 +24,186 @@ st.set_page_config(
     layout="wide"
 )
 
+# Start of this rerun; the elapsed time is shown in debug mode
+RERUN_START = time.perf_counter()
+
+# Reruns kept for the rerun latency readout
+RERUN_HISTORY = 50
+
+# Streamlit re-executes this script on every interaction, so anything that
+# doesn't change between reruns is cached. Resources (clients, probes) are
+# shared as-is; data (decoded uploads, OCR results) is keyed by upload hash.
+@st.cache_resource(show_spinner=False)
+def probe_dependencies():
+    """
+    Try importing each heavy dependency once per process.
+    Returns a list of (name, error message or None).
+    """
+    results = []
+    for name, module in [("pix2tex", "pix2tex.cli"),
+                         ("google.generativeai", "google.generativeai"),
+                         ("helpers.manim_animator", "helpers.manim_animator")]:
+        try:
+            importlib.import_module(module)
+            results.append((name, None))
+        except Exception as e:
+            results.append((name, str(e)))
+    return results
+
 # Debug versions section
 with st.expander("Debug Information"):
     st.write(f"Python version: {sys.version}")
     st.write(f"PIL version: {Image.__version__}")
     
-    # Try importing each dependency with error handling
-    try:
-        from pix2tex.cli import LatexOCR
-        st.write("✅ pix2tex successfully imported")
-    except Exception as e:
-        st.error(f"❌ Error importing pix2tex: {str(e)}")
-        
-    try:
-        import google.generativeai as genai
-        st.write("✅ google.generativeai successfully imported")
-    except Exception as e:
-        st.error(f"❌ Error importing google.generativeai: {str(e)}")
-        
-    try:
-        import helpers.manim_animator
-        st.write("✅ helpers.manim_animator successfully imported")
-    except Exception as e:
-        st.error(f"❌ Error importing helpers.manim_animator: {str(e)}")
+    # Import probes run on the first rerun only
+    for name, error in probe_dependencies():
+        if error is None:
+            st.write(f"✅ {name} successfully imported")
+        else:
+            st.error(f"❌ Error importing {name}: {error}")
 
 # Now import the dependencies for actual use
 try:
     from pix2tex.cli import LatexOCR
     import google.generativeai as genai
     import helpers.manim_animator
+    from helpers.quality_controller import choose_render_quality, schedule_upgrade
+    from helpers.storage_manager import shared_storage_manager, start_background_sweeper
+    from helpers.latex_validator import normalize_latex, LatexValidationError
+    from helpers.renderer_select import DEFAULT_RENDERER
+    from helpers.render_executor import render_stats
+    from helpers.session_store import SessionStore, session_memory_report
+    from helpers.local_solver import solve_locally
+    from helpers.local_derivation import derive_steps
+    from helpers.equation_index import shared_index, content_digest
+    from helpers.image_hash import fingerprint, shared_image_index
+    from helpers.ocr_preprocess import prepare_for_ocr, normalize_mode, UnusableImage
+    from helpers.ingestion import ingest, is_document, page_count
+    from helpers.solver_core import (load_ocr_model, extract_latex, configure_gemini, gemini_response,
+                                     solution_prompt, explanation_prompt)
 except Exception as e:
     st.error(f"Failed to import required dependencies: {str(e)}")
     st.stop()
 
+@st.cache_resource(show_spinner=False)
+def get_gemini_model(api_key):
+    """
+    One Gemini client per API key, shared across reruns and sessions.
+    """
+    return configure_gemini(api_key)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def decode_upload(upload_hash, _data):
+    """
+    Decode an uploaded image once per distinct upload, as "L" or "RGB"
+    (GIFs decode to palette images and fax TIFFs to bilevel ones).
+    """
+    image = Image.open(io.BytesIO(_data))
+    image.load()
+    return normalize_mode(image)
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def ocr_upload(upload_hash, _image):
+    """
+    OCR result for an upload already through prepare_for_ocr; rejected
+    LaTeX raises and is not cached.
+    """
+    return extract_latex(_image, prepared=True)
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def cached_derivation(latex_code):
+    """
+    SymPy derivation for an equation; raises LookupError instead of returning
+    None, so a miss (possibly a timeout on a busy machine) is not cached.
+    """
+    steps = derive_steps(latex_code)
+    if steps is None:
+        raise LookupError(latex_code)
+    return steps
+
+def derive_locally(latex_code):
+    """
+    Step-by-step derivation built with SymPy, or None for equations it can't handle.
+    """
+    try:
+        return cached_derivation(latex_code)
+    except LookupError:
+        return None
+
+def remember_video(latex_code, variant, future):
+    """
+    Index a background upgrade's video once it finishes (runs on its thread).
+    """
+    if not future.cancelled() and future.exception() is None and future.result():
+        equation_index.put(latex_code, "video", future.result(), variant)
+
+def clear_caches():
+    """
+    Drop every cached upload, OCR result, client and import probe.
+    """
+    st.cache_data.clear()
+    get_gemini_model.clear()
+    probe_dependencies.clear()
+    equation_index.clear()
+    image_index.clear()
+
+# Keep temp_manim/, animations/ and temp uploads within quota; the manager and
+# its sweeper thread are created once per process no matter how often the script reruns
+storage_manager = shared_storage_manager()
+start_background_sweeper(storage_manager)
+
+# Solutions, explanations and videos keyed by canonical equation, so OCR
+# variants like "5+2x=15" and "2x + 5 = 15" share results across sessions
+equation_index = shared_index()
+
+# OCR results found again for other photos of the same page
+image_index = shared_image_index()
+
 # Initialize session state variables
 if "latex_model" not in st.session_state:
     st.session_state.latex_model = None
 if "latex_code" not in st.session_state:
     st.session_state.latex_code = ""
-if "history" not in st.session_state:
-    st.session_state.history = []
-if "explanation_text" not in st.session_state:
-    st.session_state.explanation_text = ""
+if "session_store" not in st.session_state:
+    # Follow-up history and explanations, size-capped in memory and spilled to disk
+    st.session_state.session_store = SessionStore()
 if "animation_path" not in st.session_state:
     st.session_state.animation_path = None
+if "animation_upgrade" not in st.session_state:
+    st.session_state.animation_upgrade = None
 if "debug_mode" not in st.session_state:
     st.session_state.debug_mode = False
+if "rerun_timings" not in st.session_state:
+    st.session_state.rerun_timings = []
+if "page_results" not in st.session_state:
+    # (page, LaTeX or None, error) per page of the last processed document
+    st.session_state.page_results = None
+
+# Sidebar video formats mapped to helpers.video_encoder presets (None keeps Manim's MP4)
+VIDEO_FORMATS = {
+    "MP4": None,
+    "MP4 (smaller file)": "standard",
+    "WebM": "webm",
+    "GIF": "gif",
+}
+
+# Sidebar renderers mapped to helpers.renderer_select names
+RENDERER_OPTIONS = {
+    "Cairo": "cairo",
+    "OpenGL (headless)": "opengl",
+}
+
+# Display names for the "source" of cached solutions (shared with api_server)
+SOLUTION_SOURCES = {
+    "sympy": "SymPy",
+    "gemini": "Gemini",
+}
 
 # Function to initialize the LatexOCR model
 def load_latex_model():
     try:
         with st.spinner("Loading OCR model (this may take a moment)..."):
-            st.session_state.latex_model = LatexOCR()
+            st.session_state.latex_model = load_ocr_model()
             if st.session_state.debug_mode:
                 st.write(f"DEBUG: LaTeX model type: {type(st.session_state.latex_model)}")
         return True
@@ -85,8 +216,7 @@ def load_latex_model():
 # Function to configure Gemini API
 def configure_gemini_api(api_key):
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-1.5-flash")
+        model = get_gemini_model(api_key)
         if st.session_state.debug_mode:
             st.write(f"DEBUG: Gemini model configured successfully")
         return model
@@ -100,48 +230,54 @@ def sanitize_latex(latex_code):
     if not latex_code:
         return ""
     
-    # Remove excessive spacing commands
-    latex_code = latex_code.replace('\\!', '')
-    
-    # Limit the length to prevent rendering issues
-    if len(latex_code) > 500:
-        latex_code = latex_code[:500] + "..."
-    
-    # Replace non-standard commands
-    latex_code = latex_code.replace('\\given', '\\text{given}')
-    
-    # Ensure balanced brackets
-    open_brackets = latex_code.count('\\left')
-    close_brackets = latex_code.count('\\right')
-    if open_brackets > close_brackets:
-        for _ in range(open_brackets - close_brackets):
-            latex_code += '\\right.'
-    
-    # Ensure proper environment closure for common environments
-    for env in ['equation', 'align', 'matrix', 'bmatrix', 'cases']:
-        if f"\\begin{{{env}}}" in latex_code and f"\\end{{{env}}}" not in latex_code:
-            latex_code += f"\\end{{{env}}}"
-    
-    return latex_code
+    # Validate and canonicalize in one pass; raises LatexValidationError
+    # for input that would only fail later inside the Manim LaTeX compile
+    return normalize_latex(latex_code)
 
-# Function to process image and extract LaTeX
-def process_image(image):
+# Function to process image and extract LaTeX; upload_hash reuses earlier
+# OCR results for the same image
+def process_image(image, upload_hash=None):
     try:
-        if st.session_state.latex_model is None:
-            if not load_latex_model():
+        # The same upload was already read; no need to fingerprint it again
+        cached = image_index.get(upload_hash) if upload_hash else None
+        if not cached:
+            # Another photo of the same page (resized, recompressed, at a slight
+            # angle) was already read; reuse its result instead of running OCR
+            page_fingerprint = fingerprint(image)
+            cached = image_index.find(page_fingerprint)
+            if cached:
+                st.caption("Reused the result of a near-identical upload")
+        if cached:
+            raw_latex, latex_code = cached
+        else:
+            # Blurry, dark or empty photos are rejected before loading the model;
+            # the rest are cropped and preprocessed as much as they need
+            try:
+                image = prepare_for_ocr(image)
+            except UnusableImage as e:
+                st.error(f"{str(e)} Please try another photo.")
                 return None
-        
-        # Extract LaTeX from image
-        latex_code = st.session_state.latex_model(image)
-        
-        if st.session_state.debug_mode:
-            st.write(f"DEBUG: Raw LaTeX: {latex_code}")
-            st.write(f"DEBUG: LaTeX type: {type(latex_code)}")
-        
-        # Sanitize LaTeX code
-        latex_code = sanitize_latex(latex_code)
+            if st.session_state.debug_mode:
+                st.image(image, caption="DEBUG: Image sent to OCR")
+
+            if st.session_state.latex_model is None:
+                if not load_latex_model():
+                    return None
+            
+            # Extract LaTeX from image, validated and canonicalized in one pass
+            try:
+                if upload_hash:
+                    raw_latex, latex_code = ocr_upload(upload_hash, image)
+                else:
+                    raw_latex, latex_code = extract_latex(image, st.session_state.latex_model, prepared=True)
+            except LatexValidationError as e:
+                st.error(f"Extracted LaTeX cannot be rendered: {str(e)}")
+                return None
+            image_index.add(page_fingerprint, (raw_latex, latex_code), upload_hash)
         
         if st.session_state.debug_mode:
+            st.write(f"DEBUG: Raw LaTeX: {raw_latex}")
+            st.write(f"DEBUG: LaTeX type: {type(raw_latex)}")
             st.write(f"DEBUG: Sanitized LaTeX: {latex_code}")
         
         st.session_state.latex_code = latex_code
@@ -152,14 +288,60 @@ def process_image(image):
             st.write(f"DEBUG: Full traceback: {traceback.format_exc()}")
         return None
 
+# Make an extracted equation the one the tabs work on
+def select_equation(latex_code):
+    st.session_state.latex_code = latex_code
+    st.session_state.session_store.clear()  # Reset history and explanation
+    st.session_state.animation_path = None  # Reset animation path
+    st.session_state.animation_upgrade = None  # Drop any pending upgrade
+
+def show_page_result(page, latex_code, error):
+    if latex_code:
+        st.caption(f"Page {page}")
+        st.latex(latex_code)
+        if st.button(f"Work on page {page}", key=f"use_page_{page}"):
+            select_equation(latex_code)
+    else:
+        st.caption(f"Page {page}: {error or 'no equation found'}")
+
+# Function to process a multi-page upload (PDF, TIFF). Pages are rasterized
+# and read one at a time and shown as they finish, so a long packet never
+# sits in memory whole; the results are kept for later reruns
+def process_document(name, upload_data, upload_hash):
+    try:
+        pages = page_count(upload_data)
+    except Exception as e:
+        st.error(f"Could not open {name}: {str(e)}")
+        return
+    st.caption(f"{name}: {pages} page{'s' if pages != 1 else ''}")
+    
+    if st.button("Process All Pages"):
+        # Reading pages is OCR only; Gemini is needed later, to solve them
+        if st.session_state.latex_model is None and not load_latex_model():
+            return
+        results = []
+        progress = st.progress(0.0, text="Reading pages...")
+        extract = partial(extract_latex, model=st.session_state.latex_model)
+        for result in ingest([(name, upload_data)], extract=extract, index=image_index):
+            page = (result.page, result.latex if result.ok else None, result.error)
+            show_page_result(*page)
+            results.append(page)
+            progress.progress(min(1.0, result.page / pages), text=f"Read page {result.page} of {pages}")
+        progress.empty()
+        st.session_state.page_results = {"upload_hash": upload_hash, "pages": results}
+        found = sum(1 for _, latex_code, _ in results if latex_code)
+        st.success(f"Found equations on {found} of {len(results)} pages")
+    elif st.session_state.page_results and st.session_state.page_results["upload_hash"] == upload_hash:
+        for page in st.session_state.page_results["pages"]:
+            show_page_result(*page)
+
 # Function to get response from Gemini
 def get_gemini_response(prompt, gemini_model):
     try:
         if st.session_state.debug_mode:
             st.write(f"DEBUG: Sending prompt to Gemini: {prompt[:100]}...")
         
-        response = gemini_model.generate_content(prompt)
-        return response.text
+        return gemini_response(prompt, gemini_model)
     except Exception as e:
         st.error(f"Error getting response from Gemini: {str(e)}")
         if st.session_state.debug_mode:
@@ -192,7 +374,7 @@ def main():
         st.markdown("""
         1. Enter your Gemini API key
         2. Initialize the models
-        3. Upload an image with a math equation
+        3. Upload an image with a math equation, or a PDF worksheet
         4. Review the extracted LaTeX
         5. Get solutions and explanations
         6. Generate visual animations
@@ -203,21 +385,53 @@ def main():
         st.divider()
         st.header("Animation Settings")
         st.radio("Animation Quality", ["Low", "Medium", "High"], index=1, key="animation_quality")
+        st.slider("Target Length (seconds)", min_value=10, max_value=120, value=30, step=5, key="animation_duration")
+        st.selectbox("Video Format", ["MP4", "MP4 (smaller file)", "WebM", "GIF"], key="animation_format")
+        st.selectbox("Renderer", list(RENDERER_OPTIONS), key="animation_renderer",
+                     index=list(RENDERER_OPTIONS.values()).index(DEFAULT_RENDERER)
+                     if DEFAULT_RENDERER in RENDERER_OPTIONS.values() else 0)
+        st.checkbox("Render pages in parallel", key="animation_parallel",
+                    help="Split long animations by page and render them on all CPU cores")
         
         # Debug mode toggle
         st.divider()
         st.checkbox("Enable Debug Mode", key="debug_mode")
+        if st.button("Clear Cached Data"):
+            clear_caches()
+            st.success("Caches cleared")
+        if st.session_state.debug_mode:
+            st.caption("Storage usage")
+            st.json(storage_manager.usage())
+            st.caption("Render resource usage")
+            st.json(render_stats())
+            st.caption("Session memory (this session, then all sessions)")
+            st.json(st.session_state.session_store.memory_usage())
+            st.json(session_memory_report())
+            st.caption("Equation index hit rates")
+            st.json(equation_index.stats())
+            st.caption("Near-duplicate uploads")
+            st.json(image_index.stats())
+            if hasattr(st.session_state.latex_model, "report"):
+                st.caption("OCR workers (memory in MB, shared copy-on-write)")
+                st.json(st.session_state.latex_model.report())
 
     # Create two columns for the main content
     col1, col2 = st.columns([1, 1.2])
     
     with col1:
         st.subheader("Upload Equation Image")
-        uploaded_file = st.file_uploader("Select image file (JPG, PNG, JPEG)", type=["jpg", "png", "jpeg"])
+        uploaded_file = st.file_uploader("Select image or PDF file (JPG, PNG, TIFF, GIF, PDF)",
+                                         type=["jpg", "png", "jpeg", "tif", "tiff", "gif", "pdf"])
         
-        if uploaded_file:
-            # Display the uploaded image
-            image = Image.open(uploaded_file)
+        # PDFs and multi-frame TIFFs/GIFs are read page by page
+        if uploaded_file and is_document(uploaded_file.getvalue()):
+            upload_data = uploaded_file.getvalue()
+            process_document(uploaded_file.name, upload_data, hashlib.sha256(upload_data).hexdigest())
+        elif uploaded_file:
+            # Display the uploaded image, decoded once per distinct upload
+            upload_data = uploaded_file.getvalue()
+            upload_hash = hashlib.sha256(upload_data).hexdigest()
+            image = decode_upload(upload_hash, upload_data)
             st.image(image, caption="Uploaded Image", use_column_width=True)
             
             # Process button
@@ -225,13 +439,11 @@ def main():
                 with st.spinner("Processing image..."):
                     gemini_model = configure_gemini_api(api_key)
                     if gemini_model:
-                        latex_code = process_image(image)
+                        latex_code = process_image(image, upload_hash)
                         
                         if latex_code:
                             st.success("Equation extracted successfully!")
-                            st.session_state.history = []  # Reset history with new equation
-                            st.session_state.animation_path = None  # Reset animation path
-                            st.session_state.explanation_text = ""  # Reset explanation
+                            select_equation(latex_code)
                         else:
                             st.error("Could not extract equation. Please try a clearer image.")
     
@@ -261,58 +473,146 @@ def main():
             with tab1:
                 if st.button("Get Solution", key="solution_button"):
                     with st.spinner("Solving..."):
-                        solution_prompt = f"Solve this equation and provide the final numerical or algebraic answer: {st.session_state.latex_code}"
-                        solution = get_gemini_response(solution_prompt, gemini_model)
-                        if solution:
+                        cached = equation_index.get(st.session_state.latex_code, "solution")
+                        if cached:
                             st.markdown("### Solution")
-                            st.markdown(solution)
+                            st.markdown(cached["solution"])
+                            st.caption(f"Cached {SOLUTION_SOURCES.get(cached['source'], cached['source'])} "
+                                       "solution for an equivalent equation")
+                        else:
+                            # Exact answers for tractable equations come from SymPy in
+                            # milliseconds; everything else goes to Gemini
+                            start = time.perf_counter()
+                            local = solve_locally(st.session_state.latex_code)
+                            local_seconds = time.perf_counter() - start
+                            if local:
+                                equation_index.put(st.session_state.latex_code, "solution",
+                                                   {"solution": local.answer, "source": "sympy"})
+                                st.markdown("### Solution")
+                                st.markdown(local.answer)
+                                st.caption(f"Solved locally with SymPy in {local.seconds * 1000:.0f} ms")
+                            else:
+                                start = time.perf_counter()
+                                solution = get_gemini_response(solution_prompt(st.session_state.latex_code), gemini_model)
+                                if solution:
+                                    equation_index.put(st.session_state.latex_code, "solution",
+                                                       {"solution": solution, "source": "gemini"})
+                                    st.markdown("### Solution")
+                                    st.markdown(solution)
+                                    st.caption(f"Solved by Gemini in {time.perf_counter() - start:.2f} s "
+                                               f"(local solver gave up after {local_seconds * 1000:.0f} ms)")
             
             with tab2:
                 if st.button("Get Explanation", key="explanation_button"):
                     with st.spinner("Generating explanation..."):
-                        explanation_prompt = f"""
-                        Explain step by step how to solve this equation: {st.session_state.latex_code}
-                        
-                        Format each step as a clear equation on its own line.
-                        After each equation step, briefly explain the operation performed.
-                        Make sure each step follows logically from the previous one.
-                        """
-                        explanation = get_gemini_response(explanation_prompt, gemini_model)
+                        explanation = equation_index.get_or_compute(
+                            st.session_state.latex_code, "explanation",
+                            lambda: get_gemini_response(explanation_prompt(st.session_state.latex_code), gemini_model)
+                        )
                         if explanation:
-                            st.session_state.explanation_text = explanation
+                            st.session_state.session_store.set_artifact("explanation_text", explanation)
                             st.markdown("### Step-by-Step Explanation")
                             st.markdown(explanation)
             
             with tab3:
                 st.markdown("### Animation")
                 
-                if st.session_state.explanation_text:
+                explanation_text = st.session_state.session_store.get_artifact("explanation_text", "")
+                # Linear, quadratic, 2x2 systems and simple derivatives are derived
+                # locally, so they animate without waiting on (or reaching) Gemini
+                local_steps = derive_locally(st.session_state.latex_code)
+                if local_steps:
+                    st.caption(f"Steps derived locally ({len(local_steps)} steps)")
+                if explanation_text or local_steps:
                     if st.button("Generate Animation", key="animation_button"):
                         with st.spinner("Generating animation (this may take a while)..."):
-                            # Get animation quality setting
+                            # Get animation settings
                             quality = st.session_state.animation_quality.lower()
+                            duration = st.session_state.animation_duration
+                            encoding = VIDEO_FORMATS[st.session_state.animation_format]
+                            renderer = RENDERER_OPTIONS[st.session_state.animation_renderer]
+                            # Same equation with a different explanation or derivation is a different video
+                            variant = (quality, duration, encoding, renderer,
+                                       content_digest(explanation_text, local_steps))
                             
-                            # Generate animation
-                            try:
-                                animation_path = helpers.manim_animator.create_solution_animation(
-                                    st.session_state.latex_code,
-                                    st.session_state.explanation_text,
-                                    quality=quality
-                                )
+                            cached_path = equation_index.get(st.session_state.latex_code, "video", variant)
+                            if cached_path and os.path.exists(cached_path):
+                                # An equivalent equation was already rendered with these settings
+                                st.session_state.animation_path = cached_path
+                                st.session_state.animation_upgrade = None
+                                st.success("Reused the animation of an equivalent equation")
+                            else:
+                                # Degrade to a fast preview under load
+                                decision = choose_render_quality(quality)
                                 
-                                if animation_path:
-                                    st.session_state.animation_path = animation_path
-                                    st.success("Animation generated successfully!")
-                                else:
-                                    st.error("Failed to generate animation.")
-                            except Exception as e:
-                                st.error(f"Error during animation generation: {str(e)}")
-                                if st.session_state.debug_mode:
-                                    st.write(f"DEBUG - Animation error: {traceback.format_exc()}")
+                                # Generate animation
+                                try:
+                                    animation_path = helpers.manim_animator.create_solution_animation(
+                                        st.session_state.latex_code,
+                                        explanation_text,
+                                        quality=decision.quality,
+                                        target_duration=duration,
+                                        fps=decision.fps,
+                                        encoding=encoding,
+                                        renderer=renderer,
+                                        parallel=st.session_state.animation_parallel,
+                                        solution_steps=local_steps
+                                    )
+                                    
+                                    if animation_path:
+                                        equation_index.put(st.session_state.latex_code, "video", animation_path,
+                                                           (decision.quality,) + variant[1:])
+                                        st.session_state.animation_path = animation_path
+                                        st.session_state.animation_upgrade = None
+                                        st.success("Animation generated successfully!")
+                                        
+                                        # Render the requested quality once the node has capacity
+                                        if decision.upgrade:
+                                            upgrade = schedule_upgrade(
+                                                helpers.manim_animator.create_solution_animation,
+                                                st.session_state.latex_code,
+                                                explanation_text,
+                                                quality=quality,
+                                                target_duration=duration,
+                                                encoding=encoding,
+                                                renderer=renderer,
+                                                parallel=st.session_state.animation_parallel,
+                                                solution_steps=local_steps
+                                            )
+                                            upgrade.add_done_callback(
+                                                partial(remember_video, st.session_state.latex_code, variant))
+                                            st.session_state.animation_upgrade = upgrade
+                                            st.info("The server is busy, so this is a quick preview. "
+                                                    f"The {quality} quality version is rendering in the background.")
+                                    else:
+                                        st.error("Failed to generate animation.")
+                                except Exception as e:
+                                    st.error(f"Error during animation generation: {str(e)}")
+                                    if st.session_state.debug_mode:
+                                        st.write(f"DEBUG - Animation error: {traceback.format_exc()}")
+                
+                # Swap in the full-quality render once the background upgrade finishes
+                upgrade = st.session_state.animation_upgrade
+                if upgrade is not None and upgrade.done():
+                    st.session_state.animation_upgrade = None
+                    # A failed upgrade keeps the preview; don't re-raise it on every rerun
+                    error = upgrade.exception() if not upgrade.cancelled() else None
+                    if upgrade.cancelled() or error is not None or not upgrade.result():
+                        st.warning("The higher quality version could not be rendered; showing the preview.")
+                        if error is not None and st.session_state.debug_mode:
+                            st.write(f"DEBUG: Upgrade failed: {str(error)}")
+                    else:
+                        st.session_state.animation_path = upgrade.result()
+                elif upgrade is not None:
+                    st.caption("Higher quality version still rendering...")
+                    st.button("Check for higher quality", key="upgrade_check_button")
                 
                 # Display animation if available
                 if st.session_state.animation_path and os.path.exists(st.session_state.animation_path):
-                    st.video(st.session_state.animation_path)
+                    if st.session_state.animation_path.endswith(".gif"):
+                        st.image(st.session_state.animation_path)
+                    else:
+                        st.video(st.session_state.animation_path)
                 elif st.session_state.animation_path:
                     st.error("Animation file not found. It may have been deleted or moved.")
             
@@ -326,7 +626,7 @@ def main():
                         Equation: {st.session_state.latex_code}
                         
                         Previous explanation:
-                        {st.session_state.explanation_text}
+                        {st.session_state.session_store.get_artifact("explanation_text", "")}
                         
                         Question: {user_question}
                         """
@@ -334,23 +634,39 @@ def main():
                         answer = get_gemini_response(context, gemini_model)
                         if answer:
                             # Add to history
-                            st.session_state.history.append({
-                                "question": user_question,
-                                "answer": answer
-                            })
+                            st.session_state.session_store.add_turn(user_question, answer)
                 
-                # Show conversation history
-                if st.session_state.history:
+                # Show conversation history; older turns are loaded from disk on request
+                store = st.session_state.session_store
+                history = store.history
+                if history:
                     st.markdown("### Conversation History")
-                    for i, item in enumerate(st.session_state.history):
-                        st.markdown(f"**Q: {item['question']}**")
-                        st.markdown(f"A: {item['answer']}")
-                        if i < len(st.session_state.history) - 1:
+                    if store.spilled_turn_count and st.checkbox(f"Show {store.spilled_turn_count} earlier questions"):
+                        history = store.spilled_turns() + history
+                    for i, item in enumerate(history):
+                        st.markdown(f"**Q: {item.question}**")
+                        st.markdown(f"A: {item.answer}")
+                        if i < len(history) - 1:
                             st.divider()
 
+def report_rerun_latency():
+    """
+    Show how long this rerun took next to recent ones (debug mode only).
+    """
+    timings = st.session_state.rerun_timings
+    timings.append(time.perf_counter() - RERUN_START)
+    del timings[:-RERUN_HISTORY]
+    if st.session_state.debug_mode:
+        recent = sorted(timings)
+        st.sidebar.caption(
+            f"Rerun: {timings[-1] * 1000:.0f} ms "
+            f"(median {recent[len(recent) // 2] * 1000:.0f} ms over {len(recent)} reruns)"
+        )
+
 # Run the application
 if __name__ == "__main__":
     main()
+    report_rerun_latency()
 # from pix2tex.cli import LatexOCR
 # from PIL import Image
 # import google.generativeai as genai
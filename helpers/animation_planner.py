@@ -0,0 +1,147 @@
+# animation_planner.py
+from dataclasses import dataclass, field
+from helpers.step_parser import SolutionStep
+
+# Default length of a solution video in seconds
+DEFAULT_TARGET_DURATION = 30.0
+
+# Equations that fit below the headings before the frame overflows
+STEPS_PER_PAGE = 4
+
+# Explanations longer than this are cut to their first sentence
+MAX_EXPLANATION_CHARS = 60
+
+# Natural timings (seconds) used when the budget allows it
+WRITE_TIME = 1.0
+STEP_HOLD = 1.0
+EXPLANATION_TIME = 1.0
+EXPLANATION_HOLD = 1.0
+PAGE_TRANSITION_TIME = 0.5
+
+# Fixed intro/outro cost: title, original equation, move, heading, final box
+INTRO_DURATION = 1.0 + 0.5 + 1.0 + 1.0 + 1.0 + 0.5 + 1.0 + 0.5
+OUTRO_DURATION = 1.0 + 2.0
+
+# Timings are never scaled below this fraction of their natural value
+MIN_TIME_SCALE = 0.5
+
+
+@dataclass
+class AnimationPlan:
+    """Steps split into pages plus the timings the script generator uses."""
+    pages: list = field(default_factory=list)
+    write_time: float = WRITE_TIME
+    step_hold: float = STEP_HOLD
+    explanation_time: float = EXPLANATION_TIME
+    explanation_hold: float = EXPLANATION_HOLD
+    page_transition_time: float = PAGE_TRANSITION_TIME
+
+    @property
+    def steps(self):
+        return [step for page in self.pages for step in page]
+
+    @property
+    def estimated_duration(self):
+        total = INTRO_DURATION + OUTRO_DURATION
+        total += self.page_transition_time * max(len(self.pages) - 1, 0)
+        for step in self.steps:
+            total += self.write_time + self.step_hold
+            if step.explanation:
+                total += self.explanation_time + self.explanation_hold
+        return total
+
+
+def _summarize(text):
+    """
+    Shorten an explanation to something that fits beside its equation.
+    """
+    text = " ".join(text.split())
+    if len(text) <= MAX_EXPLANATION_CHARS:
+        return text
+    sentence = text.split(". ")[0].rstrip(".")
+    if len(sentence) > MAX_EXPLANATION_CHARS:
+        sentence = sentence[:MAX_EXPLANATION_CHARS - 3].rsplit(" ", 1)[0] + "..."
+    return sentence
+
+
+def _merge(steps, max_steps):
+    """
+    Merge consecutive intermediate steps so at most max_steps remain.
+    The first and last steps are kept (only the last when one step fits, since
+    it holds the answer the outro highlights); each merged group shows its
+    last equation and the first explanation of the group.
+    """
+    if len(steps) <= max_steps:
+        return list(steps)
+    if max_steps <= 1:
+        return [steps[-1]]
+    if max_steps == 2:
+        return [steps[0], steps[-1]]
+
+    middle = steps[1:-1]
+    groups = max_steps - 2
+    merged = []
+    for g in range(groups):
+        group = middle[g * len(middle) // groups:(g + 1) * len(middle) // groups]
+        explanation = next((s.explanation for s in group if s.explanation), "")
+        merged.append(SolutionStep(group[-1].equation, explanation, group[-1].number))
+    return [steps[0]] + merged + [steps[-1]]
+
+
+def _step_cost(plan, with_explanation):
+    cost = plan.write_time + plan.step_hold
+    if with_explanation:
+        cost += plan.explanation_time + plan.explanation_hold
+    return cost
+
+
+def plan_animation(solution_steps, target_duration=None, frame_budget=None, fps=30,
+                   steps_per_page=STEPS_PER_PAGE):
+    """
+    Fit solution steps into a bounded animation.
+    Args:
+    solution_steps: SolutionStep objects from parse_solution_steps
+    target_duration: Desired video length in seconds
+    frame_budget: Alternative to target_duration, in frames at the given fps
+    fps: Frame rate used to convert frame_budget to seconds
+    steps_per_page: Equations shown before the scene is cleared
+    Returns:
+    AnimationPlan: Paginated steps and scaled timings
+    """
+    if frame_budget:
+        target_duration = frame_budget / float(fps)
+    if not target_duration:
+        target_duration = DEFAULT_TARGET_DURATION
+
+    steps = [
+        SolutionStep(step.equation, _summarize(step.explanation), step.number)
+        for step in solution_steps if step.equation.strip()
+    ]
+    plan = AnimationPlan()
+    available = max(target_duration - INTRO_DURATION - OUTRO_DURATION, 0)
+
+    # Cap the step count at what fits when every timing (page transitions
+    # included) is at its minimum
+    cheapest = _step_cost(plan, with_explanation=True) * MIN_TIME_SCALE
+    max_steps = max(int(available // cheapest), 1)
+    while max_steps > 1:
+        pages = -(-max_steps // steps_per_page)
+        if max_steps * cheapest + PAGE_TRANSITION_TIME * MIN_TIME_SCALE * (pages - 1) <= available:
+            break
+        max_steps -= 1
+    steps = _merge(steps, max_steps)
+
+    # Scale timings down uniformly until the steps fit the budget
+    page_count = -(-len(steps) // steps_per_page) if steps else 0
+    transitions = PAGE_TRANSITION_TIME * max(page_count - 1, 0)
+    natural = sum(_step_cost(plan, bool(step.explanation)) for step in steps) + transitions
+    if natural > available and natural > 0:
+        scale = max(available / natural, MIN_TIME_SCALE)
+        plan.write_time *= scale
+        plan.step_hold *= scale
+        plan.explanation_time *= scale
+        plan.explanation_hold *= scale
+        plan.page_transition_time *= scale
+
+    plan.pages = [steps[i:i + steps_per_page] for i in range(0, len(steps), steps_per_page)]
+    return plan
@@ -0,0 +1,226 @@
+# equation_index.py
+import re
+import time
+import hashlib
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+from helpers.latex_validator import normalize_latex, LatexValidationError
+from helpers.local_solver import latex_to_sympy, SYMPY_AVAILABLE
+
+# Equations remembered by a shared index; each holds a few results
+MAX_ENTRIES = 2048
+
+# Spellings of the same construct, unified (whole commands only) for the
+# textual fallback
+TEXT_SYNONYMS = {
+    "\\times": "\\cdot",
+    "\\dfrac": "\\frac",
+    "\\tfrac": "\\frac",
+    "\\left": "",
+    "\\right": "",
+}
+
+_TOKEN_RE = re.compile(r"\\[A-Za-z]+|\\.|\s+|.", re.DOTALL)
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _structure(expr):
+    """
+    Serialize a SymPy tree with the arguments of + and * sorted, so the
+    written order of terms and factors doesn't matter.
+    """
+    if not expr.args:
+        return repr(expr)
+    children = [_structure(arg) for arg in expr.args]
+    if expr.is_Add or expr.is_Mul:
+        children.sort()
+    return f"{type(expr).__name__}({','.join(children)})"
+
+
+def _textual_form(latex_code):
+    """
+    LaTeX with synonyms unified and spacing dropped, except the one space a
+    command needs before a letter (\\cdot x must not become \\cdotx).
+    """
+    out = []
+    for token in _TOKEN_RE.findall(latex_code):
+        if token.isspace():
+            continue
+        token = TEXT_SYNONYMS.get(token, token)
+        if not token:
+            continue
+        if out and re.fullmatch(r"\\[A-Za-z]+", out[-1]) and token[0].isalpha():
+            out.append(" ")
+        out.append(token)
+    return "".join(out)
+
+
+@lru_cache(maxsize=4096)
+def canonical_form(latex_code):
+    """
+    Normal form of an equation: equal for LaTeX that differs only in spacing,
+    the order of terms, factors or sides, or \\cdot versus \\times.
+    Nothing is expanded or simplified, so 3(x-2) and 3x-6 stay distinct.
+    Args:
+    latex_code: LaTeX as written or as returned by OCR
+    Returns:
+    str: A structural form, or normalized text if SymPy can't parse it
+    """
+    try:
+        latex_code = normalize_latex(latex_code)
+    except LatexValidationError:
+        latex_code = latex_code.strip()
+    text = _textual_form(latex_code)
+    if not SYMPY_AVAILABLE:
+        return "text:" + text
+    try:
+        # The parser already reads every synonym; give it the LaTeX as normalized
+        lhs, rhs = latex_to_sympy(latex_code, evaluate=False)
+    except Exception:
+        return "text:" + text
+    if rhs is None:
+        return "expr:" + _structure(lhs)
+    return "eq:" + "=".join(sorted([_structure(lhs), _structure(rhs)]))
+
+
+def canonical_key(latex_code):
+    """
+    Short cache key for an equation, shared by every equivalent spelling.
+    """
+    return hashlib.sha1(canonical_form(latex_code).encode("utf-8")).hexdigest()[:16]
+
+
+def content_digest(explanation="", steps=None):
+    """
+    Short digest of what a render shows besides the equation, so videos of
+    the same equation with a different explanation or derivation don't
+    share a cache entry.
+    Args:
+    explanation: Explanation text the video was rendered from
+    steps: Optional SolutionStep list derived locally
+    """
+    hasher = hashlib.sha1((explanation or "").encode("utf-8"))
+    for step in steps or []:
+        hasher.update(f"\0{step.equation}\0{step.explanation}".encode("utf-8"))
+    return hasher.hexdigest()[:16]
+
+
+class EquationIndex:
+    """
+    Results (solutions, explanations, videos, ...) keyed by canonical equation,
+    least recently used equations evicted first.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._hits = {}
+        self._misses = {}
+
+    def get(self, latex_code, kind, variant=None, default=None):
+        """
+        Look up a result for this equation.
+        Args:
+        latex_code: The equation in any equivalent spelling
+        kind: Result type, e.g. "solution", "explanation" or "video"
+        variant: Hashable options the result depends on (e.g. render settings)
+        Returns:
+        The stored result, or default
+        """
+        key = canonical_key(latex_code)
+        with self._lock:
+            results = self._entries.get(key)
+            if results is not None and (kind, variant) in results:
+                self._entries.move_to_end(key)
+                self._hits[kind] = self._hits.get(kind, 0) + 1
+                return results[(kind, variant)]
+            self._misses[kind] = self._misses.get(kind, 0) + 1
+            return default
+
+    def put(self, latex_code, kind, value, variant=None):
+        key = canonical_key(latex_code)
+        with self._lock:
+            self._entries.setdefault(key, {})[(kind, variant)] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, latex_code, kind, compute, variant=None):
+        """
+        Return the stored result, or call compute() and store what it returns.
+        None and empty results are not stored. compute runs without the lock,
+        so concurrent misses may both compute; the last result wins.
+        """
+        value = self.get(latex_code, kind, variant)
+        if value is None:
+            value = compute()
+            if value:
+                self.put(latex_code, kind, value, variant)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._hits.clear()
+            self._misses.clear()
+
+    def stats(self):
+        """
+        Returns:
+        dict: Equations held, and hits, misses and hit rate per result kind
+        """
+        with self._lock:
+            kinds = sorted(set(self._hits) | set(self._misses))
+            report = {"equations": len(self._entries)}
+            for kind in kinds:
+                hits, misses = self._hits.get(kind, 0), self._misses.get(kind, 0)
+                report[kind] = {"hits": hits, "misses": misses,
+                                "hit_rate": round(hits / (hits + misses), 3)}
+            return report
+
+
+def shared_index():
+    """
+    The EquationIndex for this process, shared by every session and request.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = EquationIndex()
+        return _index
+
+
+# Example usage: OCR variants of the same problems collapse to one key
+if __name__ == "__main__":
+    variants = [
+        ("2x+5=15", "5+2x=15", "2x + 5 = 15", "15=2x+5", "5 + 2 x = 15"),
+        ("3\\times4x=24", "3\\cdot4x=24", "4x\\cdot3=24"),
+        ("3\\times x=6", "x\\cdot 3=6", "3x=6"),
+        ("\\pi r^{2}=A", "A=\\pi  r^2"),
+        ("\\frac{x}{3}+2=\\frac{1}{2}", "2+\\dfrac{x}{3}=\\frac{1}{2}", "\\left(2+\\frac{x}{3}\\right)=\\frac{1}{2}"),
+        ("x^{2}-5x+6=0", "x^2 - 5x + 6 = 0", "6-5x+x^{2}=0"),
+    ]
+    for group in variants:
+        keys = {canonical_key(latex) for latex in group}
+        assert len(keys) == 1, group
+        print(f"{canonical_key(group[0])}  {canonical_form(group[0])}")
+    # Different problems must not collide
+    distinct = ["3(x-2)=2x+7", "3x-6=2x+7", "2x+5=15", "2x=10", "x-2=0", "2-x=0",
+                "a\\leftarrow b", "a\\rightarrow b", "a\\Leftarrow b"]
+    assert len({canonical_key(latex) for latex in distinct}) == len(distinct)
+
+    index = EquationIndex()
+    index.put("2x+5=15", "solution", "$x = 5$")
+    start = time.perf_counter()
+    for latex in variants[0] * 200:
+        assert index.get(latex, "solution") == "$x = 5$"
+    elapsed = (time.perf_counter() - start) / (len(variants[0]) * 200)
+    print(f"{elapsed * 1e6:.1f} us per lookup; {index.stats()}")
+
+    # Videos of one equation differ by what they explain
+    assert content_digest("Subtract 5.") != content_digest("Divide by 2.")
+    assert content_digest("Subtract 5.") == content_digest("Subtract 5.", [])
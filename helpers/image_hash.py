@@ -0,0 +1,376 @@
+# image_hash.py
+import time
+import threading
+from collections import namedtuple
+import numpy as np
+from PIL import Image, ImageOps, ImageFilter
+
+# Side of the hash grid; hashes are HASH_SIZE ** 2 = 64 bits
+HASH_SIZE = 8
+
+# pHash works on the low frequencies of a DCT of this size
+PHASH_IMAGE_SIZE = 32
+
+# Skew angles (degrees) tried when straightening a photo
+DESKEW_ANGLES = np.arange(-6.0, 6.01, 0.25)
+
+# Width the skew search runs at; the angle doesn't need full resolution
+DESKEW_WIDTH = 400
+
+# Pixels darker than this (after contrast stretching) count as ink
+INK_THRESHOLD = 128
+
+# Height per line of text of the thumbnail used to verify a candidate
+# match; its width follows the aspect ratio, so characters keep roughly
+# the same resolution however long or tall the content is
+THUMBNAIL_LINE_HEIGHT = 32
+
+# Largest thumbnail kept; content that would need more (a dense page)
+# can't be verified and is never reused
+MAX_THUMBNAIL_PIXELS = 128 * 1024
+
+# Ink bands shorter than this fraction of the tallest one (fraction bars,
+# dots, specks) are not counted as lines of text
+MIN_LINE_FRACTION = 0.25
+
+# Candidate search radii. Hashes find photos of the same page, but a single
+# changed character (5 vs 6) moves them less than rescaling does, so every
+# candidate is confirmed against its thumbnail before it is reused.
+PHASH_THRESHOLD = 16
+DHASH_THRESHOLD = 20
+
+# Largest mean difference in any THUMBNAIL_WINDOW square of the thumbnails.
+# Rescaled, recompressed and re-photographed pages stay below ~0.24; a
+# changed character makes one window differ by ~0.33 or more, on one line
+# or a page of them.
+MAX_LOCAL_DIFFERENCE = 0.28
+THUMBNAIL_WINDOW = 8
+
+# Blur (radius in thumbnail pixels) that absorbs sub-pixel misalignment
+THUMBNAIL_BLUR = 1.5
+
+# Largest relative difference in aspect ratio of the written content
+MAX_ASPECT_DIFFERENCE = 0.15
+
+# Uploads remembered by a shared index (each keeps a thumbnail of 6 KB for
+# one line of text, up to MAX_THUMBNAIL_PIXELS bytes for a page)
+MAX_IMAGES = 2048
+
+Fingerprint = namedtuple("Fingerprint", "phash dhash aspect thumbnail")
+
+_dct_matrices = {}
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+_index = None
+_index_lock = threading.Lock()
+
+
+def normalize_page(image):
+    """
+    Grayscale, contrast-stretched, straightened and cropped to the ink, so
+    photos of one page taken at different sizes, angles and margins line up.
+    Args:
+    image: PIL image
+    Returns:
+    PIL.Image: Mode "L" image of the written content
+    """
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA", "P"):
+        # Transparent regions are treated as white paper
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    ink = ImageOps.invert(ImageOps.autocontrast(image.convert("L")))
+
+    # Text lines give the sharpest row profile when they are horizontal
+    height = max(1, round(DESKEW_WIDTH * ink.height / ink.width))
+    small = ink.resize((DESKEW_WIDTH, height), Image.BILINEAR)
+    angle = max(DESKEW_ANGLES,
+                key=lambda a: np.asarray(small.rotate(a, resample=Image.BILINEAR), dtype=np.float64).sum(axis=1).var())
+    if angle:
+        ink = ink.rotate(angle, resample=Image.BICUBIC, expand=True)
+
+    rows, columns = np.nonzero(np.asarray(ink) > 255 - INK_THRESHOLD)
+    if len(rows):
+        ink = ink.crop((columns.min(), rows.min(), columns.max() + 1, rows.max() + 1))
+    return ImageOps.invert(ink)
+
+
+def _bits_to_int(bits):
+    return int("".join("1" if bit else "0" for bit in bits.ravel()), 2)
+
+
+def _dct_matrix(n):
+    if n not in _dct_matrices:
+        k = np.arange(n)[:, None]
+        i = np.arange(n)[None, :]
+        matrix = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+        matrix[0] /= np.sqrt(2.0)
+        _dct_matrices[n] = matrix
+    return _dct_matrices[n]
+
+
+def dhash(page, hash_size=HASH_SIZE):
+    """
+    Difference hash of a normalized page: whether each pixel is brighter
+    than its right neighbour.
+    Returns:
+    int: A hash_size ** 2 bit hash
+    """
+    pixels = np.asarray(page.resize((hash_size + 1, hash_size), Image.LANCZOS), dtype=np.float64)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(page, hash_size=HASH_SIZE, image_size=PHASH_IMAGE_SIZE):
+    """
+    Perceptual hash of a normalized page: the sign of the lowest DCT
+    frequencies against their median.
+    Returns:
+    int: A hash_size ** 2 bit hash
+    """
+    pixels = np.asarray(page.resize((image_size, image_size), Image.LANCZOS), dtype=np.float64)
+    matrix = _dct_matrix(image_size)
+    low = (matrix @ pixels @ matrix.T)[:hash_size, :hash_size]
+    # The DC term only measures overall brightness, so leave it out of the median
+    return _bits_to_int(low > np.median(low.ravel()[1:]))
+
+
+def line_height(page):
+    """
+    Height in pixels of a line of text on a normalized page: the median
+    band of rows holding ink, ignoring bands much shorter than the tallest
+    (fraction bars, dots, specks).
+    """
+    rows = (np.asarray(page) < INK_THRESHOLD).any(axis=1)
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], rows.astype(np.int8), [0]))))
+    heights = edges[1::2] - edges[::2]
+    if not len(heights):
+        return page.height
+    return float(np.median(heights[heights >= MIN_LINE_FRACTION * heights.max()]))
+
+
+def thumbnail_size(page):
+    """
+    Size (w, h) of the verification thumbnail for a normalized page, or
+    None when it would exceed MAX_THUMBNAIL_PIXELS.
+    """
+    scale = THUMBNAIL_LINE_HEIGHT / line_height(page)
+    width = max(THUMBNAIL_WINDOW, round(page.width * scale))
+    height = max(THUMBNAIL_WINDOW, round(page.height * scale))
+    if width * height > MAX_THUMBNAIL_PIXELS:
+        return None
+    return width, height
+
+
+def fingerprint(image):
+    """
+    Hashes and a verification thumbnail for an uploaded image. The thumbnail
+    is None for content too dense to verify at THUMBNAIL_LINE_HEIGHT.
+    """
+    page = normalize_page(image)
+    size = thumbnail_size(page)
+    thumbnail = None
+    if size:
+        thumbnail = np.asarray(page.resize(size, Image.BOX).filter(ImageFilter.GaussianBlur(THUMBNAIL_BLUR)), dtype=np.uint8)
+    return Fingerprint(phash(page), dhash(page), page.width / page.height, thumbnail)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def local_difference(a, b, window=THUMBNAIL_WINDOW):
+    """
+    Largest mean absolute difference (0-1) over any window x window square
+    of two thumbnails, so one changed character isn't averaged away.
+    """
+    if b.shape != a.shape:
+        # Slightly different crops give slightly different widths
+        b = np.asarray(Image.fromarray(b).resize((a.shape[1], a.shape[0]), Image.BILINEAR))
+    difference = np.abs(a.astype(np.float64) - b.astype(np.float64)) / 255.0
+    sums = np.pad(difference.cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+    windows = (sums[window:, window:] - sums[:-window, window:]
+               - sums[window:, :-window] + sums[:-window, :-window])
+    return windows.max() / (window * window)
+
+
+def is_same_page(a, b, max_local_difference=MAX_LOCAL_DIFFERENCE):
+    if a.thumbnail is None or b.thumbnail is None:
+        return False
+    if abs(a.aspect - b.aspect) > MAX_ASPECT_DIFFERENCE * max(a.aspect, b.aspect):
+        return False
+    return local_difference(a.thumbnail, b.thumbnail) <= max_local_difference
+
+
+def _popcount(values):
+    if hasattr(np, "bitwise_count"):  # NumPy 2.0+
+        return np.bitwise_count(values)
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def hamming_distances(hashes, key):
+    """
+    Hamming distance from key to every hash in a uint64 array, vectorized.
+    """
+    return _popcount(hashes ^ np.uint64(key))
+
+
+class NearDuplicateIndex:
+    """
+    Results for processed images, found again for near-duplicate photos of
+    the same page (rescaled, recompressed, slightly rotated or re-framed).
+    Candidates come from a vectorized Hamming scan of both hashes, then are
+    confirmed against their thumbnails. Byte-identical uploads are found by
+    digest, without fingerprinting them again.
+    """
+
+    def __init__(self, max_images=MAX_IMAGES, phash_threshold=PHASH_THRESHOLD,
+                 dhash_threshold=DHASH_THRESHOLD):
+        self.max_images = max_images
+        self.phash_threshold = phash_threshold
+        self.dhash_threshold = dhash_threshold
+        self._lock = threading.Lock()
+        self._phashes = np.zeros(0, dtype=np.uint64)
+        self._dhashes = np.zeros(0, dtype=np.uint64)
+        self._entries = []
+        self._digests = {}
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, fingerprint, result, digest=None):
+        """
+        Remember result for an image; digest (e.g. SHA-256 of the upload
+        bytes) lets get() find the same upload again without a fingerprint.
+        """
+        with self._lock:
+            self._entries.append((fingerprint, result, digest))
+            self._phashes = np.append(self._phashes, np.uint64(fingerprint.phash))
+            self._dhashes = np.append(self._dhashes, np.uint64(fingerprint.dhash))
+            if digest is not None:
+                self._digests[digest] = result
+            if len(self._entries) > self.max_images:
+                # Forget the oldest half at once, so eviction is rare
+                keep = len(self._entries) // 2
+                self._entries = self._entries[-keep:]
+                self._phashes = self._phashes[-keep:]
+                self._dhashes = self._dhashes[-keep:]
+                self._digests = {digest: result for _, result, digest in self._entries if digest is not None}
+
+    def get(self, digest):
+        """
+        Result stored for a byte-identical upload, or None.
+        """
+        with self._lock:
+            result = self._digests.get(digest)
+        if result is not None:
+            self.hits += 1
+        return result
+
+    def find(self, fingerprint):
+        """
+        Result stored for the closest verified near-duplicate, or None.
+        """
+        with self._lock:
+            phash_distances = hamming_distances(self._phashes, fingerprint.phash)
+            dhash_distances = hamming_distances(self._dhashes, fingerprint.dhash)
+            close = np.nonzero((phash_distances <= self.phash_threshold)
+                               & (dhash_distances <= self.dhash_threshold))[0]
+            order = close[np.argsort(phash_distances[close] + dhash_distances[close], kind="stable")]
+            candidates = [self._entries[i] for i in order]
+        for candidate, result, _ in candidates:
+            if is_same_page(candidate, fingerprint):
+                self.hits += 1
+                return result
+        self.misses += 1
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._phashes = np.zeros(0, dtype=np.uint64)
+            self._dhashes = np.zeros(0, dtype=np.uint64)
+            self._entries = []
+            self._digests = {}
+
+    def stats(self):
+        return {"images": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def shared_image_index():
+    """
+    The NearDuplicateIndex for this process, shared by every session and request.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = NearDuplicateIndex()
+        return _index
+
+
+# Example usage: which photo variants are reused, and lookup speed
+if __name__ == "__main__":
+    import io
+    import random
+    from PIL import ImageDraw, ImageFont
+
+    def page(text, size=(640, 200), offset=(40, 60), font_size=64):
+        image = Image.new("RGB", size, "white")
+        try:
+            font = ImageFont.truetype("DejaVuSans.ttf", font_size)
+        except OSError:
+            font = ImageFont.load_default()
+        ImageDraw.Draw(image).multiline_text(offset, text, fill="black", font=font, spacing=font_size // 2)
+        return image
+
+    def jpeg(image, quality):
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=quality)
+        return Image.open(buffer)
+
+    original = page("2x + 5 = 15")
+    variants = {
+        "half size": original.resize((320, 100)),
+        "jpeg q=30": jpeg(original, 30),
+        "rotated 2 deg": original.rotate(2, fillcolor="white"),
+        "shifted 10px": page("2x + 5 = 15", offset=(50, 65)),
+        "darker": original.point(lambda v: v * 0.7),
+        "phone-like": jpeg(original.resize((500, 160)).rotate(-1, fillcolor="white"), 50),
+        "2x + 6 = 15": page("2x + 6 = 15"),
+        "2x + 5 = 16": page("2x + 5 = 16"),
+        "2y + 5 = 15": page("2y + 5 = 15"),
+        "x^2 + 1 = 0": page("x^2 + 1 = 0"),
+    }
+    start = time.perf_counter()
+    base = fingerprint(original)
+    print(f"fingerprint: {(time.perf_counter() - start) * 1000:.1f} ms")
+    index = NearDuplicateIndex()
+    index.add(base, "2x+5=15", digest="upload-sha256")
+    assert index.get("upload-sha256") == "2x+5=15"
+    for name, image in variants.items():
+        other = fingerprint(image)
+        print(f"{name:>14}: pHash {hamming(base.phash, other.phash):2d}  dHash {hamming(base.dhash, other.dhash):2d}"
+              f"  local {local_difference(base.thumbnail, other.thumbnail):.3f}  -> {index.find(other)}")
+
+    # One changed character on a long line or a page of lines is still caught
+    sheet = "\n".join(f"{i + 2}x + {3 * i + 1} = {5 * i + 7} - y" for i in range(7))
+    for text, changed, size in [
+        ("3x^2 + 12x - 7 = 2x^2 - 5x + 19 + 4y - 8z", "3x^2 + 12x - 7 = 2x^2 - 5x + 18 + 4y - 8z", (1100, 120)),
+        (sheet, sheet.replace("13 =", "18 ="), (700, 500)),
+    ]:
+        original = page(text, size, (40, 40), 40)
+        base = fingerprint(original)
+        smaller = (size[0] * 7 // 10, size[1] * 7 // 10)
+        assert is_same_page(base, fingerprint(original.resize((size[0] // 2, size[1] // 2))))
+        assert is_same_page(base, fingerprint(jpeg(original.resize(smaller).rotate(-1, fillcolor="white"), 50)))
+        assert not is_same_page(base, fingerprint(page(changed, size, (40, 40), 40)))
+    # A page too dense to verify is never reused
+    dense = "\n".join(f"{i}x + {i}y + {i}z = {7 * i} and {i}a - {i}b = {i}" for i in range(30))
+    assert fingerprint(page(dense, (1200, 1900), (40, 40), 40)).thumbnail is None
+
+    # Lookup cost with a full index of unrelated uploads
+    rng = random.Random(0)
+    index = NearDuplicateIndex(max_images=100000)
+    for _ in range(100000):
+        index.add(base._replace(phash=rng.getrandbits(64), dhash=rng.getrandbits(64)), None)
+    start = time.perf_counter()
+    for _ in range(100):
+        index.find(base)
+    print(f"100k images: {(time.perf_counter() - start) * 10:.2f} ms per lookup")
@@ -1,8 +1,11 @@
 import io
 import tempfile
-import numpy as np
-from PIL import Image, ImageEnhance, ImageFilter
+from PIL import Image
 import streamlit as st
+from helpers.storage_manager import UPLOAD_PREFIX
+# Preprocessing lives in ocr_preprocess (no Streamlit import); this name
+# predates the move and is kept for existing callers
+from helpers.ocr_preprocess import preprocess_handwritten_image
 
 def create_temp_file(text_file):
     """
@@ -10,9 +13,9 @@ def create_temp_file(text_file):
     Args:
     text_file: The file uploaded through Streamlit
     Returns:
-    str: Path to the temporary file
+    str: Path to the temporary file (swept by the storage manager)
     """
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_file:
+    with tempfile.NamedTemporaryFile(delete=False, prefix=UPLOAD_PREFIX, suffix=".jpg") as temp_file:
         temp_file.write(text_file.getbuffer())
         return temp_file.name
 
@@ -34,44 +37,6 @@ def get_image_bytes(image_file):
     image_bytes = io.BytesIO()
     image.save(image_bytes, format=image.format or "JPEG")
     return image_bytes.getvalue()
-
-def preprocess_handwritten_image(img):
-    """
-    Optimize handwritten image for better OCR results
-    Args:
-    img: PIL Image object
-    Returns:
-    PIL Image: Processed image
-    """
-    # Convert to grayscale
-    if img.mode != 'L':
-        img = img.convert('L')
-    
-    # Enhance contrast
-    enhancer = ImageEnhance.Contrast(img)
-    img = enhancer.enhance(2.0)  # Increase contrast
-    
-    # Apply adaptive thresholding
-    img_array = np.array(img)
-    
-    # Calculate adaptive threshold
-    from scipy.ndimage import gaussian_filter
-    blur_radius = 20
-    blurred = gaussian_filter(img_array, sigma=blur_radius)
-    threshold = blurred - 10  # Offset
-    
-    # Apply threshold
-    binary = np.where(img_array > threshold, 255, 0).astype(np.uint8)
-    img = Image.fromarray(binary)
-    
-    # Reduce noise with a median filter
-    img = img.filter(ImageFilter.MedianFilter(size=3))
-    
-    # Sharpen edges
-    enhancer = ImageEnhance.Sharpness(img)
-    img = enhancer.enhance(1.5)
-    
-    return img
 # import io
 # import tempfile
 # from PIL import Image
@@ -111,4 +76,4 @@ def preprocess_handwritten_image(img):
 #     image_bytes = io.BytesIO()
 #     image.save(image_bytes, format=image.format or "JPEG")
     
-#     return image_bytes.getvalue()
\ No newline at end of file
+#     return image_bytes.getvalue()
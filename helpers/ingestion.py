@@ -0,0 +1,280 @@
+# ingestion.py
+import io
+import sys
+import time
+import queue
+import threading
+from dataclasses import dataclass
+from PIL import Image, ImageSequence
+from helpers.image_hash import fingerprint
+from helpers.ocr_preprocess import UnusableImage, normalize_mode
+from helpers.latex_validator import LatexValidationError
+from helpers.solver_core import extract_latex
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+# PDF rasterizer in use: pypdfium2 if installed, else PyMuPDF, else none
+PDF_BACKEND = "pdfium" if pdfium else "pymupdf" if fitz else None
+
+# Resolution PDF pages are rasterized at; handwriting and typeset math are
+# legible to OCR well below this, and an A4 page comes out at ~4 MP
+PDF_DPI = 200
+
+# Pages larger than this (posters, scans embedded at full size) are
+# rasterized at a lower DPI so one page can't exhaust memory
+MAX_PAGE_PIXELS = 16_000_000
+
+# Pages read from one upload at most
+MAX_PAGES = 200
+
+# Pages rasterized ahead of OCR; bounds memory to a few pages at a time
+PREFETCH_PAGES = 2
+
+PDF_MAGIC = b"%PDF-"
+
+# Neither rasterizer is safe to call from several threads at once
+_pdf_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class PageResult:
+    """OCR result for one page of an upload."""
+    source: str
+    page: int
+    latex: str = ""
+    raw_latex: str = ""
+    error: str = None
+    cached: bool = False
+    seconds: float = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None and bool(self.latex)
+
+
+def is_pdf(data):
+    return data[:len(PDF_MAGIC)] == PDF_MAGIC
+
+
+def is_document(data):
+    """
+    Whether an upload has pages to read one by one: a PDF or a multi-frame
+    image (TIFF, GIF). Unreadable data is left to the single-image path.
+    """
+    if is_pdf(data):
+        return True
+    try:
+        return page_count(data) > 1
+    except Exception:
+        return False
+
+
+def _require_pdf_backend():
+    if PDF_BACKEND is None:
+        raise RuntimeError("PDF support needs pypdfium2 (pip install pypdfium2) or PyMuPDF")
+
+
+def _page_scale(width_points, height_points, dpi):
+    """
+    Points-to-pixels scale for a page at dpi, lowered to fit MAX_PAGE_PIXELS.
+    """
+    scale = dpi / 72
+    pixels = width_points * height_points * scale * scale
+    if pixels > MAX_PAGE_PIXELS:
+        scale *= (MAX_PAGE_PIXELS / pixels) ** 0.5
+    return scale
+
+
+def page_count(data):
+    """
+    Number of pages (or frames, for multi-frame images) in an upload.
+    """
+    if not is_pdf(data):
+        with Image.open(io.BytesIO(data)) as image:
+            return getattr(image, "n_frames", 1)
+    _require_pdf_backend()
+    with _pdf_lock:
+        if PDF_BACKEND == "pdfium":
+            document = pdfium.PdfDocument(data)
+            try:
+                return len(document)
+            finally:
+                document.close()
+        with fitz.open(stream=data, filetype="pdf") as document:
+            return document.page_count
+
+
+def _pdfium_pages(data, dpi, max_pages):
+    with _pdf_lock:
+        document = pdfium.PdfDocument(data)
+    try:
+        for index in range(min(len(document), max_pages)):
+            with _pdf_lock:
+                page = document[index]
+                bitmap = page.render(scale=_page_scale(*page.get_size(), dpi))
+                # convert() copies out of PDFium's buffer before it is freed
+                image = bitmap.to_pil().convert("RGB")
+                bitmap.close()
+                page.close()
+            yield index + 1, image
+    finally:
+        with _pdf_lock:
+            document.close()
+
+
+def _pymupdf_pages(data, dpi, max_pages):
+    with _pdf_lock:
+        document = fitz.open(stream=data, filetype="pdf")
+    try:
+        for index in range(min(document.page_count, max_pages)):
+            with _pdf_lock:
+                page = document[index]
+                scale = _page_scale(page.rect.width, page.rect.height, dpi)
+                pixmap = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+                image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+                del pixmap
+            yield index + 1, image
+    finally:
+        with _pdf_lock:
+            document.close()
+
+
+def iter_pages(data, dpi=PDF_DPI, max_pages=MAX_PAGES):
+    """
+    Rasterize the pages of an upload one at a time, as they are requested.
+    Args:
+    data: Bytes of a PDF, an image, or a multi-frame image (TIFF, GIF)
+    dpi: Resolution for PDF pages
+    max_pages: Pages to read at most
+    Yields:
+    tuple: (page number from 1, RGB PIL image)
+    """
+    if is_pdf(data):
+        _require_pdf_backend()
+        pages = _pdfium_pages if PDF_BACKEND == "pdfium" else _pymupdf_pages
+        yield from pages(data, dpi, max_pages)
+        return
+    with Image.open(io.BytesIO(data)) as image:
+        for index, frame in enumerate(ImageSequence.Iterator(image)):
+            if index >= max_pages:
+                break
+            # convert() copies the frame before the iterator moves on; 16-bit
+            # and transparent pages are normalized first instead of clipped
+            yield index + 1, normalize_mode(frame).convert("RGB")
+
+
+def prefetch(iterator, depth=PREFETCH_PAGES):
+    """
+    Run an iterator on a background thread, at most depth items ahead of
+    the consumer, so rasterizing the next page overlaps OCR of this one.
+    Errors are re-raised in the consumer; closing the generator early stops
+    the background thread.
+    """
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    return
+        except Exception as e:
+            put((None, e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+        put((done, None))
+
+    thread = threading.Thread(target=produce, name="page-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def ingest(sources, extract=extract_latex, index=None, dpi=PDF_DPI, max_pages=MAX_PAGES):
+    """
+    Stream uploads page by page through preprocessing and OCR, yielding
+    each page's result as soon as it is read. Only a few pages are held in
+    memory at once, however long the document.
+    Args:
+    sources: (name, bytes) pairs: PDFs, images or multi-frame images
+    extract: Called with a page image; returns (raw LaTeX, normalized LaTeX)
+    index: Optional NearDuplicateIndex; pages seen before skip OCR
+    dpi: Resolution for PDF pages
+    max_pages: Pages to read at most per source
+    Yields:
+    PageResult: One per page, in order. A source that can't be opened
+    yields one result for page 0 with the error.
+    """
+    for name, data in sources:
+        pages = prefetch(iter_pages(data, dpi, max_pages))
+        try:
+            for page, image in pages:
+                start = time.perf_counter()
+                try:
+                    page_fingerprint = fingerprint(image) if index is not None else None
+                    cached = index.find(page_fingerprint) if index is not None else None
+                    if cached:
+                        raw_latex, latex = cached
+                    else:
+                        raw_latex, latex = extract(image)
+                        if index is not None:
+                            index.add(page_fingerprint, (raw_latex, latex))
+                    yield PageResult(name, page, latex, raw_latex, cached=bool(cached),
+                                     seconds=time.perf_counter() - start)
+                except (UnusableImage, LatexValidationError) as e:
+                    yield PageResult(name, page, error=str(e), seconds=time.perf_counter() - start)
+                except Exception as e:
+                    # One bad page shouldn't cost the rest of the packet
+                    print(f"OCR failed on {name} page {page}: {str(e)}")
+                    yield PageResult(name, page, error=f"OCR failed: {str(e)}",
+                                     seconds=time.perf_counter() - start)
+        except Exception as e:
+            print(f"Could not read {name}: {str(e)}")
+            yield PageResult(name, 0, error=f"Could not read {name}: {str(e)}")
+        finally:
+            pages.close()
+
+
+# Example usage: python -m helpers.ingestion worksheet.pdf [more files]
+if __name__ == "__main__":
+    import resource
+
+    if len(sys.argv) < 2:
+        sys.exit("Usage: python -m helpers.ingestion FILE [FILE ...]")
+    print(f"PDF backend: {PDF_BACKEND}")
+    sources = ((path, open(path, "rb").read()) for path in sys.argv[1:])
+    start = time.perf_counter()
+    for result in ingest(sources):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"{result.source} p{result.page:<3} {result.seconds * 1000:7.0f} ms  peak {peak:5.0f} MB  "
+              f"{result.latex if result.ok else result.error}")
+    print(f"Total: {time.perf_counter() - start:.1f} s")
@@ -0,0 +1,262 @@
+# latex_preflight.py
+import os
+import re
+import shutil
+import tempfile
+import subprocess
+from helpers.latex_validator import normalize_latex, LatexValidationError
+
+# MathTex typesets every expression inside this environment
+MATHTEX_ENVIRONMENT = "align*"
+
+# Seconds allowed for one batched TeX run
+PREFLIGHT_TIMEOUT = 30
+
+_MARKER = "PREFLIGHT-EXPRESSION"
+_MARKER_RE = re.compile(_MARKER + r":(\d+)")
+
+
+def _tex_template():
+    """
+    Return Manim's active TeX template, or None if Manim is unavailable.
+    """
+    try:
+        from manim import config
+        return config["tex_template"]
+    except Exception:
+        return None
+
+
+def _manim_svg_path(expression, tex_template, tex_dir):
+    """
+    Path where Manim's tex_to_svg_file looks for the compiled expression.
+    """
+    from manim.utils.tex_file_writing import tex_hash
+    tex_code = tex_template.get_texcode_for_expression_in_env(expression, MATHTEX_ENVIRONMENT)
+    return os.path.join(tex_dir, tex_hash(tex_code) + ".svg")
+
+
+def _build_batch_document(expressions, tex_template):
+    """
+    Build one TeX document that typesets every expression on its own page.
+    """
+    preamble = tex_template.preamble if tex_template is not None else (
+        "\\usepackage[english]{babel}\n\\usepackage{amsmath}\n\\usepackage{amssymb}"
+    )
+    lines = [
+        "\\documentclass[preview,multi=preflightpage]{standalone}",
+        preamble,
+        "\\newenvironment{preflightpage}{}{}",
+        "\\begin{document}",
+    ]
+    for index, expression in enumerate(expressions):
+        lines.extend([
+            f"\\typeout{{{_MARKER}:{index}}}",
+            "\\begin{preflightpage}",
+            f"\\begin{{{MATHTEX_ENVIRONMENT}}}",
+            expression,
+            f"\\end{{{MATHTEX_ENVIRONMENT}}}",
+            "\\end{preflightpage}",
+        ])
+    lines.append("\\end{document}")
+    return "\n".join(lines)
+
+
+def _failed_indices(log_text, count):
+    """
+    Map TeX errors in the log back to expression indices.
+    Returns (failed, reached) where reached is the number of expressions
+    TeX got to before stopping.
+    """
+    failed = set()
+    current = None
+    reached = 0
+    for line in log_text.splitlines():
+        marker = _MARKER_RE.search(line)
+        if marker:
+            current = int(marker.group(1))
+            reached = current + 1
+        elif line.startswith("!") and current is not None:
+            failed.add(current)
+    if reached < count and current is not None:
+        # TeX gave up part way through, so the expression it was on is bad
+        failed.add(current)
+    return failed, reached
+
+
+def _compile_batch(expressions, tex_template, work_dir):
+    """
+    Run latex once over all expressions.
+    Returns (failed indices, reached count, dvi path or None).
+    """
+    tex_path = os.path.join(work_dir, "preflight.tex")
+    with open(tex_path, "w") as f:
+        f.write(_build_batch_document(expressions, tex_template))
+
+    subprocess.run(
+        ["latex", "-interaction=nonstopmode", "-no-shell-escape", "preflight.tex"],
+        cwd=work_dir,
+        capture_output=True,
+        text=True,
+        timeout=PREFLIGHT_TIMEOUT
+    )
+
+    log_path = os.path.join(work_dir, "preflight.log")
+    log_text = ""
+    if os.path.exists(log_path):
+        with open(log_path, errors="replace") as f:
+            log_text = f.read()
+    failed, reached = _failed_indices(log_text, len(expressions))
+
+    dvi_path = os.path.join(work_dir, "preflight.dvi")
+    return failed, reached, dvi_path if os.path.exists(dvi_path) else None
+
+
+def _cache_svgs(expressions, failed, dvi_path, tex_template, tex_dir, work_dir):
+    """
+    Split the batched DVI into one SVG per page and store each passing
+    expression under the name Manim will look for, so the real render
+    skips those compiles.
+    """
+    if tex_template is None or not tex_dir:
+        return 0
+    result = subprocess.run(
+        ["dvisvgm", dvi_path, "--page=1-", "-n", "-v", "0", "-o",
+         os.path.join(work_dir, "page-%p.svg")],
+        capture_output=True,
+        timeout=PREFLIGHT_TIMEOUT
+    )
+    if result.returncode != 0:
+        return 0
+
+    pages = sorted(
+        (name for name in os.listdir(work_dir) if name.startswith("page-") and name.endswith(".svg")),
+        key=lambda name: int(re.sub(r"\D", "", name))
+    )
+    # Only trust the page order if every expression produced exactly one page
+    if len(pages) != len(expressions):
+        return 0
+
+    os.makedirs(tex_dir, exist_ok=True)
+    cached = 0
+    for index, (expression, page) in enumerate(zip(expressions, pages)):
+        if index in failed:
+            continue
+        target = _manim_svg_path(expression, tex_template, tex_dir)
+        if not os.path.exists(target):
+            shutil.move(os.path.join(work_dir, page), target)
+            cached += 1
+    return cached
+
+
+def check_expressions(expressions, tex_dir=None):
+    """
+    Compile a list of MathTex strings in as few TeX runs as possible.
+    Args:
+    expressions: LaTeX strings exactly as they will be passed to MathTex
+    tex_dir: Manim's Tex directory; compiled SVGs for passing expressions
+    are cached there when given
+    Returns:
+    dict: stripped expression -> True if it compiled, False otherwise, or
+    None if no working TeX installation is available
+    """
+    unique = list(dict.fromkeys(expr.strip() for expr in expressions if expr and expr.strip()))
+    if not unique:
+        return {}
+    if shutil.which("latex") is None:
+        return None
+
+    tex_template = _tex_template()
+    results = {}
+    pending = unique
+    while pending:
+        with tempfile.TemporaryDirectory(prefix="preflight_") as work_dir:
+            try:
+                failed, reached, dvi_path = _compile_batch(pending, tex_template, work_dir)
+            except subprocess.TimeoutExpired:
+                print("LaTeX pre-flight timed out; treating remaining expressions as failed")
+                results.update({expr: False for expr in pending})
+                break
+
+            if reached == 0:
+                # TeX never reached the first expression: broken toolchain
+                print("LaTeX pre-flight could not run; skipping it")
+                return None
+
+            # A fatal error stops TeX early; retry whatever it never reached
+            checked = pending[:reached]
+            for index, expression in enumerate(checked):
+                results[expression] = index not in failed
+
+            if reached == len(pending) and dvi_path:
+                try:
+                    cached = _cache_svgs(pending, failed, dvi_path, tex_template, tex_dir, work_dir)
+                    print(f"LaTeX pre-flight cached {cached} compiled SVGs")
+                except Exception as e:
+                    print(f"Could not cache pre-flight SVGs: {str(e)}")
+            pending = pending[reached:]
+
+    return results
+
+
+def _repair(expression):
+    """
+    Return a normalized candidate for a failing expression, or None.
+    """
+    try:
+        repaired = normalize_latex(expression)
+    except LatexValidationError:
+        return None
+    return repaired if repaired != expression.strip() else None
+
+
+def preflight_solution(latex_expression, solution_steps, tex_dir=None):
+    """
+    Check every equation of an animation before rendering it.
+    Failing step equations are repaired when normalization fixes them and
+    dropped otherwise.
+    Args:
+    latex_expression: The original equation shown at the top of the scene
+    solution_steps: Steps from parse_solution_steps
+    tex_dir: Manim's Tex directory used to cache compiled SVGs
+    Returns:
+    tuple: (latex_expression or None if it cannot compile, usable steps)
+    """
+    equations = [latex_expression] + [step.equation for step in solution_steps]
+    results = check_expressions(equations, tex_dir)
+    if results is None:
+        # No TeX toolchain here; let Manim report problems itself
+        return latex_expression, solution_steps
+
+    repairs = {}
+    for equation, ok in results.items():
+        if not ok:
+            repaired = _repair(equation)
+            if repaired:
+                repairs[equation] = repaired
+    if repairs:
+        repaired_results = check_expressions(list(repairs.values()), tex_dir) or {}
+        for equation, repaired in list(repairs.items()):
+            if not repaired_results.get(repaired):
+                del repairs[equation]
+
+    def usable(equation):
+        if results.get(equation.strip(), True):
+            return equation
+        return repairs.get(equation.strip())
+
+    latex_expression = usable(latex_expression)
+    if latex_expression is None:
+        return None, []
+
+    checked_steps = []
+    for step in solution_steps:
+        equation = step.equation
+        if not equation.strip():
+            continue
+        fixed = usable(equation)
+        if fixed is None:
+            print(f"Dropping step that does not compile: {equation}")
+            continue
+        checked_steps.append(step.with_equation(fixed))
+    return latex_expression, checked_steps
@@ -0,0 +1,263 @@
+# latex_validator.py
+import re
+import time
+import random
+
+# Longest expression we are willing to hand to a LaTeX compile
+MAX_LATEX_LENGTH = 500
+
+# Commands OCR models emit that MathTex cannot typeset as-is
+COMMAND_REPLACEMENTS = {
+    "\\given": "\\text{given}",
+}
+
+# Spacing commands that only add noise (and cache misses)
+DROPPED_COMMANDS = {"\\!"}
+
+# Commands whose argument is typeset in text mode, where spaces matter
+TEXT_COMMANDS = {"\\text", "\\textrm", "\\textit", "\\textbf", "\\mbox", "\\operatorname"}
+
+# Display environments that cannot be nested inside MathTex's align*;
+# when they wrap the whole expression we unwrap them instead
+DISPLAY_ENVIRONMENTS = {
+    "equation", "equation*", "align", "align*", "displaymath",
+    "gather", "gather*", "multline", "multline*",
+}
+
+# Environments that are valid inside align*
+INNER_ENVIRONMENTS = {
+    "matrix", "pmatrix", "bmatrix", "Bmatrix", "vmatrix", "Vmatrix", "smallmatrix",
+    "cases", "array", "aligned", "gathered", "split", "subarray",
+}
+
+_TOKEN_RE = re.compile(r"""
+    (?P<env>\\(?:begin|end)(?![A-Za-z])\s*\{[^{}]*\})      # \begin{name} / \end{name}
+  | (?P<delim>\\(?:left|right)(?![A-Za-z])\s*(?:\\[A-Za-z]+|\\.|[()\[\]|./<>]))  # \left( / \right.
+  | (?P<word>\\[A-Za-z]+)                                 # control word
+  | (?P<symbol>\\.)                                       # control symbol
+  | (?P<space>\s+)
+  | (?P<char>.)
+""", re.VERBOSE | re.DOTALL)
+
+_ENV_NAME_RE = re.compile(r"\\(begin|end)\s*\{\s*([^{}]*?)\s*\}")
+_DELIM_RE = re.compile(r"\\(left|right)\s*(.+)", re.DOTALL)
+
+
+class LatexValidationError(ValueError):
+    """Raised when a LaTeX string cannot be rendered by MathTex."""
+
+
+def normalize_latex(latex_code):
+    """
+    Validate and canonicalize a LaTeX math expression in a single pass.
+    Args:
+    latex_code: Raw LaTeX, e.g. from the OCR model
+    Returns:
+    str: Canonical LaTeX with balanced braces, \\left/\\right pairs and
+    environments, and insignificant whitespace removed
+    Raises:
+    LatexValidationError: If the expression cannot be rendered
+    """
+    if not latex_code or not latex_code.strip():
+        raise LatexValidationError("Empty LaTeX expression")
+
+    out = []
+    # Each entry is (kind, name, text_mode, out_index) where kind is
+    # "brace", "left" or "env"; out_index is used to unwrap display envs
+    stack = []
+    pending_text = False
+    # Whether the last emitted token was a control word, so a following
+    # letter needs a separating space
+    after_word = False
+    saw_space = False
+
+    def in_text_mode():
+        return bool(stack) and stack[-1][2]
+
+    for match in _TOKEN_RE.finditer(latex_code.strip()):
+        kind = match.lastgroup
+        token = match.group()
+
+        # Dropped tokens separate their neighbours just like whitespace;
+        # math shifts are invalid inside align* so they only survive in text
+        if kind == "space" or token in DROPPED_COMMANDS or (token == "$" and not in_text_mode()):
+            saw_space = True
+            continue
+
+        text_argument = pending_text
+        pending_text = False
+        if in_text_mode() and saw_space and out and out[-1] != "{":
+            out.append(" ")
+        elif after_word and saw_space and token[0].isalpha():
+            out.append(" ")
+        saw_space = False
+        after_word = False
+
+        if kind == "env":
+            action, name = _ENV_NAME_RE.match(token).groups()
+            if action == "begin":
+                if name in DISPLAY_ENVIRONMENTS and not stack and not out:
+                    stack.append(("env", name, False, None))
+                    continue
+                if name not in INNER_ENVIRONMENTS:
+                    raise LatexValidationError(f"Unsupported environment: {name}")
+                stack.append(("env", name, False, len(out)))
+                out.append(f"\\begin{{{name}}}")
+            else:
+                if not stack or stack[-1][0] != "env" or stack[-1][1] != name:
+                    raise LatexValidationError(f"Unmatched \\end{{{name}}}")
+                _, _, _, index = stack.pop()
+                if index is not None:
+                    out.append(f"\\end{{{name}}}")
+            continue
+
+        if kind == "delim":
+            action, delimiter = _DELIM_RE.match(token).groups()
+            if action == "left":
+                stack.append(("left", None, False, len(out)))
+            elif not stack or stack[-1][0] != "left":
+                raise LatexValidationError("\\right without matching \\left")
+            else:
+                stack.pop()
+            out.append(f"\\{action}{delimiter}")
+            after_word = delimiter[-1].isalpha()
+            continue
+
+        if kind == "word":
+            if token in ("\\left", "\\right"):
+                raise LatexValidationError(f"{token} without a delimiter")
+            if token in ("\\begin", "\\end"):
+                raise LatexValidationError(f"{token} without an environment name")
+            token = COMMAND_REPLACEMENTS.get(token, token)
+            pending_text = token in TEXT_COMMANDS
+            out.append(token)
+            after_word = token[-1].isalpha()
+            continue
+
+        if kind == "symbol":
+            out.append(token)
+            continue
+
+        # Plain characters
+        if token == "{":
+            stack.append(("brace", None, text_argument or in_text_mode(), len(out)))
+            out.append(token)
+        elif token == "}":
+            if not stack or stack[-1][0] != "brace":
+                raise LatexValidationError("Unbalanced closing brace")
+            _, _, text_group, _ = stack.pop()
+            # Spacing before a closing brace only matters inside \text{...}
+            if out[-1] == " " and not text_group:
+                out.pop()
+            out.append(token)
+        elif token == "\\":
+            raise LatexValidationError("Dangling backslash at end of expression")
+        elif token in "%#":
+            out.append("\\" + token)
+        else:
+            out.append(token)
+
+    # Close anything the OCR model left open, innermost first
+    while stack:
+        kind, name, _, index = stack.pop()
+        if kind == "brace":
+            out.append("}")
+        elif kind == "left":
+            out.append("\\right.")
+        elif index is not None:
+            out.append(f"\\end{{{name}}}")
+
+    result = "".join(out).strip()
+    if not result:
+        raise LatexValidationError("Empty LaTeX expression")
+    if len(result) > MAX_LATEX_LENGTH:
+        raise LatexValidationError(
+            f"LaTeX expression too long ({len(result)} > {MAX_LATEX_LENGTH} characters)"
+        )
+    return result
+
+
+def is_renderable(latex_code):
+    """
+    Check whether a LaTeX expression passes validation.
+    Args:
+    latex_code: Raw LaTeX string
+    Returns:
+    bool: True if normalize_latex accepts it
+    """
+    try:
+        normalize_latex(latex_code)
+        return True
+    except LatexValidationError:
+        return False
+
+
+# Typical pix2tex / Gemini output used for fuzzing and benchmarking
+LATEX_CORPUS = [
+    "2x + 5 = 15",
+    "2x+5=15",
+    "x^{2}-5x+6=0",
+    "\\frac{d}{dx}\\left(x^{3}+2x\\right)",
+    "\\left(\\frac{a}{b}\\right)^{2}=\\frac{a^{2}}{b^{2}}",
+    "\\int_{0}^{1} x\\,dx=\\frac{1}{2}",
+    "\\sqrt{x+1}=3",
+    "\\begin{cases}x+y=5\\\\x-y=1\\end{cases}",
+    "\\begin{bmatrix}1 & 2\\\\3 & 4\\end{bmatrix}",
+    "P(A\\given B)=\\frac{P(A\\cap B)}{P(B)}",
+    "\\begin{equation}E=mc^{2}\\end{equation}",
+    "\\sum_{i=1}^{n} i=\\frac{n(n+1)}{2}",
+    "\\left\\{x\\mid x>0\\right\\}",
+    "\\text{area of circle} = \\pi r^{2}",
+    "\\lim_{x\\to 0}\\frac{\\sin x}{x}=1",
+    "3 \\cdot 4 \\! \\! = 12",
+    "50\\% of x",
+    "\\left( x+1",
+    "\\begin{matrix} a & b",
+]
+
+_FUZZ_ALPHABET = ["{", "}", "\\left(", "\\right)", "\\begin{cases}", "\\end{cases}",
+                  " ", "  ", "\\", "$", "%", "^", "_", "&", "\\\\", "\\!"]
+
+
+def _mutate(text, rng):
+    position = rng.randrange(len(text) + 1)
+    if rng.random() < 0.5 and text:
+        return text[:position] + text[position + 1:]
+    return text[:position] + rng.choice(_FUZZ_ALPHABET) + text[position:]
+
+
+# Example usage: fuzz the normalizer and benchmark it on the corpus
+if __name__ == "__main__":
+    rng = random.Random(0)
+    rejected = 0
+    checked = 0
+    for sample in LATEX_CORPUS:
+        for _ in range(500):
+            mutated = sample
+            for _ in range(rng.randint(1, 4)):
+                mutated = _mutate(mutated, rng)
+            checked += 1
+            try:
+                normalized = normalize_latex(mutated)
+            except LatexValidationError:
+                rejected += 1
+                continue
+            # Normalizing twice must not change anything, otherwise cache keys drift
+            try:
+                again = normalize_latex(normalized)
+            except LatexValidationError as e:
+                raise AssertionError((mutated, normalized, e))
+            assert again == normalized, (mutated, normalized)
+    print(f"Fuzzed {checked} inputs, rejected {rejected}, all accepted outputs idempotent")
+
+    iterations = 2000
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for sample in LATEX_CORPUS:
+            try:
+                normalize_latex(sample)
+            except LatexValidationError:
+                pass
+    elapsed = time.perf_counter() - start
+    per_call = elapsed / (iterations * len(LATEX_CORPUS)) * 1e6
+    print(f"normalize_latex: {per_call:.1f} µs per expression")
@@ -0,0 +1,322 @@
+# local_derivation.py
+import re
+import time
+from helpers.step_parser import SolutionStep
+from helpers.local_solver import (latex_to_sympy, run_with_budget, PREFERRED_VARIABLES,
+                                  SYMPY_AVAILABLE, TIME_BUDGET)
+
+if SYMPY_AVAILABLE:
+    import sympy
+
+# \frac{d}{dx} followed by the expression to differentiate
+_DERIVATIVE_RE = re.compile(r"^\\frac\{d\}\{d([A-Za-z])\}(.+)$", re.DOTALL)
+
+# Separators between the equations of a system
+_SYSTEM_SPLIT_RE = re.compile(r"\\\\|;|,")
+_SYSTEM_ENV_RE = re.compile(r"\\(?:begin|end)\{(?:cases|aligned|array|gathered|split)\}(?:\{[^{}]*\})?|&")
+
+OR = " \\text{ or } "
+
+# How explanations name elementary functions differentiated directly
+FUNCTION_NAMES = {"exp": "e^x", "log": "ln x", "sin": "sin x", "cos": "cos x", "tan": "tan x",
+                  "cot": "cot x", "sec": "sec x", "csc": "csc x"}
+
+
+def _tex(expr, order=None):
+    return sympy.latex(expr, order=order)
+
+
+def _equation(lhs, rhs):
+    return f"{_tex(lhs)} = {_tex(rhs)}"
+
+
+def _signed_move(term):
+    """
+    Describe moving a term across the equals sign, e.g. "Subtract 5 from both sides".
+    """
+    if term.could_extract_minus_sign():
+        return f"Add {_tex(-term)} to both sides"
+    return f"Subtract {_tex(term)} from both sides"
+
+
+def _numbered(steps):
+    return [SolutionStep(equation, explanation, number)
+            for number, (equation, explanation) in enumerate(steps, start=1)]
+
+
+def _single_variable(lhs, rhs):
+    symbols = (lhs - rhs).free_symbols
+    if len(symbols) != 1:
+        return None
+    variable = next(iter(symbols))
+    try:
+        poly = sympy.Poly(sympy.expand(lhs - rhs), variable)
+    except sympy.PolynomialError:
+        return None
+    if not poly.domain.is_QQ and not poly.domain.is_ZZ:
+        return None
+    return variable, poly
+
+
+def _linear_steps(lhs, rhs, x):
+    steps = []
+    # Clear numeric denominators, or expand brackets
+    denominators = [sympy.fraction(sympy.nsimplify(c))[1]
+                    for side in (lhs, rhs) for c in sympy.Poly(sympy.expand(side), x).all_coeffs()]
+    lcd = sympy.ilcm(*denominators) if len(denominators) > 1 else denominators[0]
+    if lcd != 1:
+        lhs, rhs = sympy.expand(lhs * lcd), sympy.expand(rhs * lcd)
+        steps.append((_equation(lhs, rhs), f"Multiply both sides by {lcd}"))
+    elif sympy.expand(lhs) != lhs or sympy.expand(rhs) != rhs:
+        lhs, rhs = sympy.expand(lhs), sympy.expand(rhs)
+        steps.append((_equation(lhs, rhs), "Expand the brackets"))
+
+    a_left, b_left = sympy.Poly(lhs, x).all_coeffs()[-2:] if sympy.Poly(lhs, x).degree() == 1 else (0, lhs)
+    a_right, b_right = sympy.Poly(rhs, x).all_coeffs()[-2:] if sympy.Poly(rhs, x).degree() == 1 else (0, rhs)
+
+    # Variable terms to the left, constants to the right
+    if a_right != 0:
+        steps.append((_equation((a_left - a_right) * x + b_left, b_right), _signed_move(a_right * x)))
+    a = a_left - a_right
+    if a == 0:
+        return None  # No unique solution; leave the explanation to Gemini
+    if b_left != 0:
+        steps.append((_equation(a * x, b_right - b_left), _signed_move(b_left)))
+    value = (b_right - b_left) / a
+    if a != 1:
+        steps.append((_equation(x, value), f"Divide both sides by {_tex(a)}"))
+    if not steps:
+        steps.append((_equation(x, value), "The equation is already solved"))
+    return steps
+
+
+def _quadratic_steps(lhs, rhs, x, poly):
+    steps = []
+    expr = poly.as_expr()
+    if rhs != 0 or sympy.expand(lhs) != lhs:
+        steps.append((f"{_tex(expr)} = 0", "Move all terms to one side"))
+    content = poly.content()
+    if content not in (0, 1) and poly.LC() != content:
+        expr = sympy.expand(expr / content)
+        steps.append((f"{_tex(expr)} = 0", f"Divide both sides by {_tex(content)}"))
+
+    roots = sympy.solve(expr, x)
+    factored = sympy.factor(expr)
+    if factored.is_Mul or factored.is_Pow:
+        # Rational roots: factor and use the zero product property
+        if _tex(factored) != _tex(expr):
+            steps.append((f"{_tex(factored)} = 0", "Factor the left side"))
+        factors = [f for f in sympy.Mul.make_args(factored) if f.has(x)]
+        factors = [f.base if f.is_Pow else f for f in factors]
+        if len(factors) > 1:
+            steps.append((OR.join(f"{_tex(f)} = 0" for f in factors), "Set each factor equal to zero"))
+    else:
+        a, b, c = sympy.Poly(expr, x).all_coeffs()
+        steps.append((
+            f"{_tex(x)} = \\frac{{-({_tex(b)}) \\pm \\sqrt{{({_tex(b)})^{{2}} - 4({_tex(a)})({_tex(c)})}}}}{{2({_tex(a)})}}",
+            "Apply the quadratic formula"
+        ))
+        discriminant = b ** 2 - 4 * a * c
+        steps.append((
+            f"{_tex(x)} = \\frac{{{_tex(-b)} \\pm \\sqrt{{{_tex(discriminant)}}}}}{{{_tex(2 * a)}}}",
+            "Simplify the discriminant" if discriminant >= 0 else "The discriminant is negative: complex roots"
+        ))
+    steps.append((OR.join(_equation(x, root) for root in roots),
+                  "Solve for " + _tex(x) if len(roots) == 1 else "Solve each equation"))
+    return steps
+
+
+def _linear_coefficients(lhs, rhs, x, y):
+    """
+    Rewrite lhs = rhs as a*x + b*y = c; returns (a, b, c) or None if not linear.
+    """
+    try:
+        poly = sympy.Poly(sympy.expand(lhs - rhs), x, y)
+    except sympy.PolynomialError:
+        return None
+    if poly.total_degree() > 1 or not (poly.domain.is_QQ or poly.domain.is_ZZ):
+        return None
+    return poly.coeff_monomial(x), poly.coeff_monomial(y), -poly.coeff_monomial(1)
+
+
+def _system_steps(equations):
+    symbols = set().union(*[(lhs - rhs).free_symbols for lhs, rhs in equations])
+    if len(symbols) != 2:
+        return None
+    names = {s.name: s for s in symbols}
+    ordered = [names[n] for n in PREFERRED_VARIABLES if n in names]
+    ordered += sorted(symbols - set(ordered), key=lambda s: s.name)
+    x, y = ordered[:2]
+    rows = [_linear_coefficients(lhs, rhs, x, y) for lhs, rhs in equations]
+    if None in rows:
+        return None
+    (a1, b1, c1), (a2, b2, c2) = rows
+    if a1 * b2 - a2 * b1 == 0:
+        return None  # No unique solution
+
+    def row(a, b, c):
+        return _equation(a * x + b * y, c)
+
+    steps = []
+    if [row(*r) for r in rows] != [_equation(lhs, rhs) for lhs, rhs in equations]:
+        steps.append((f"{row(a1, b1, c1)},\\quad {row(a2, b2, c2)}", "Write both equations in standard form"))
+
+    if b1 == 0 or b2 == 0:
+        # One equation already has no y term; solve it for x directly
+        (a, _, c), other, which = (rows[0], rows[1], "first") if b1 == 0 else (rows[1], rows[0], "second")
+        x_value = c / a
+        if a != 1:
+            steps.append((_equation(x, x_value), f"Solve the {which} equation for {_tex(x)}"))
+    else:
+        # Eliminate y: scale both equations to the same y coefficient and subtract
+        lcm = sympy.ilcm(*[sympy.fraction(b)[0] for b in (b1, b2)])
+        k1, k2 = lcm / b1, lcm / b2
+        if k1 != 1:
+            steps.append((row(k1 * a1, lcm, k1 * c1), f"Multiply the first equation by {_tex(k1)}"))
+        if k2 != 1:
+            steps.append((row(k2 * a2, lcm, k2 * c2), f"Multiply the second equation by {_tex(k2)}"))
+        a, c = k1 * a1 - k2 * a2, k1 * c1 - k2 * c2
+        steps.append((_equation(a * x, c), f"Subtract the equations to eliminate {_tex(y)}"))
+        x_value = c / a
+        if a != 1:
+            steps.append((_equation(x, x_value), f"Divide both sides by {_tex(a)}"))
+        other = rows[0]
+
+    a, b, c = other
+    steps.append((_equation(a * x_value + b * y, c), f"Substitute {_tex(x)} = {_tex(x_value)}"))
+    y_value = (c - a * x_value) / b
+    steps.append((_equation(y, y_value), f"Solve for {_tex(y)}"))
+    steps.append((f"{_equation(x, x_value)},\\quad {_equation(y, y_value)}", "Solution of the system"))
+    return steps
+
+
+def _rule(term, x):
+    """
+    Name the differentiation rule a single term needs.
+    """
+    coefficient, rest = term.as_independent(x, as_Mul=True)
+    if not term.has(x):
+        return "constant"
+    if coefficient != 1:
+        return _rule(rest, x)
+    if term.is_Mul:
+        numerator, denominator = sympy.fraction(term)
+        return "quotient" if denominator.has(x) and numerator.has(x) else "product"
+    if term.is_Pow:
+        if term.base == x and not term.exp.has(x):
+            return "power"
+        if term.exp == x and not term.base.has(x):
+            return "derivative of " + ("e^x" if term.base == sympy.E else "a^x")
+        return "chain"
+    if term.is_Function:
+        if term.args[0] != x:
+            return "chain"
+        name = type(term).__name__
+        return f"derivative of {FUNCTION_NAMES.get(name, name + ' x')}"
+    return "power" if term == x else "chain"
+
+
+def _derivative_steps(body, x):
+    """
+    Steps for d/dx of body, parsed unevaluated so terms keep their written order.
+    """
+    f = body
+    name = _tex(x)
+    lhs = f"\\frac{{d}}{{d{name}}}\\left({_tex(f, 'none')}\\right)"
+    # Evaluate each term on its own (-1*3 -> -3) without reordering the sum
+    terms = [t.func(*t.args) if t.args else t for t in sympy.Add.make_args(f)]
+    steps = []
+    if len(terms) > 1:
+        split = sympy.Add(*[sympy.Derivative(t, x) for t in terms], evaluate=False)
+        steps.append((f"{lhs} = {_tex(split, 'none')}", "Differentiate term by term"))
+    rules = sorted({_rule(t, x) for t in terms} - {"constant"})
+    # Constant terms vanish
+    derivatives = [d for d in (sympy.diff(t, x) for t in terms) if d != 0] or [sympy.Integer(0)]
+    derivative = sympy.Add(*derivatives, evaluate=False)
+    named = [f"the {rule} rule" for rule in rules if not rule.startswith("derivative")]
+    named += [f"the {rule}" for rule in rules if rule.startswith("derivative")]
+    explanation = "Apply " + " and ".join(named) if named else "The derivative of a constant is zero"
+    steps.append((f"{lhs} = {_tex(derivative, 'none')}", explanation))
+    simplified = sympy.simplify(sympy.diff(f, x))
+    if _tex(simplified) != _tex(derivative):
+        steps.append((f"{lhs} = {_tex(simplified)}", "Simplify"))
+    return steps
+
+
+def _derive(latex_code):
+    match = _DERIVATIVE_RE.match(latex_code)
+    if match:
+        body, rhs = latex_to_sympy(match.group(2), evaluate=False)
+        if rhs is not None:
+            return None
+        return _numbered(_derivative_steps(body, sympy.Symbol(match.group(1))))
+
+    parts = [p for p in _SYSTEM_SPLIT_RE.split(_SYSTEM_ENV_RE.sub("", latex_code)) if p.strip()]
+    if len(parts) == 2:
+        equations = [latex_to_sympy(part) for part in parts]
+        if any(rhs is None for _, rhs in equations):
+            return None
+        steps = _system_steps(equations)
+        return _numbered(steps) if steps else None
+    if len(parts) != 1:
+        return None
+
+    lhs, rhs = latex_to_sympy(latex_code)
+    if rhs is None:
+        return None
+    found = _single_variable(lhs, rhs)
+    if found is None:
+        return None
+    x, poly = found
+    if poly.degree() == 1:
+        steps = _linear_steps(lhs, rhs, x)
+    elif poly.degree() == 2:
+        steps = _quadratic_steps(lhs, rhs, x, poly)
+    else:
+        return None
+    return _numbered(steps) if steps else None
+
+
+def derive_steps(latex_code, time_budget=TIME_BUDGET):
+    """
+    Build a step-by-step derivation without calling an LLM.
+    Handles linear and quadratic equations in one variable, 2x2 linear
+    systems and derivatives written as \\frac{d}{dx}(...).
+    Args:
+    latex_code: Canonical LaTeX from normalize_latex
+    time_budget: Seconds allowed for SymPy
+    Returns:
+    list: SolutionStep objects ready for generate_manim_script, or None if
+    the equation is outside the supported classes
+    """
+    return run_with_budget(_derive, latex_code, time_budget)
+
+
+# Example usage: print the derivation for each supported class
+if __name__ == "__main__":
+    samples = [
+        "2x+5=15",
+        "3(x-2)=2x+7",
+        "\\frac{x}{3}+2=\\frac{1}{2}",
+        "x^2-5x+6=0",
+        "2x^2+4x-6=0",
+        "x^2+x-1=0",
+        "x^2+2x+5=0",
+        "\\begin{cases}2x+y=5\\\\x-y=1\\end{cases}",
+        "3x+2y=12,x=2",
+        "\\frac{d}{dx}(x^3+2x)",
+        "\\frac{d}{dx}(e^{x})",
+        "x^{2}=0",
+        "\\frac{d}{dx}\\left(x^2\\sin x\\right)",
+        "x^3=8",
+    ]
+    derive_steps("x=1")  # Warm up SymPy's caches
+    for latex in samples:
+        start = time.perf_counter()
+        steps = derive_steps(latex)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{latex}  ({elapsed:.1f} ms)")
+        for step in steps or []:
+            print(f"    {step.number}. {step.equation:<60} {step.explanation}")
+        if not steps:
+            print("    -> not handled locally")
@@ -0,0 +1,330 @@
+# local_solver.py
+import re
+import time
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+try:
+    import sympy
+    from sympy.parsing.sympy_parser import (parse_expr, standard_transformations,
+                                            implicit_multiplication_application, convert_xor)
+    SYMPY_AVAILABLE = True
+except ImportError:
+    SYMPY_AVAILABLE = False
+
+# Seconds a local solve may take before we fall back to Gemini
+TIME_BUDGET = 0.5
+
+# Solves allowed to run at once; a solve that overruns its budget keeps its
+# thread until it finishes, so this also caps the CPU runaway solves can use
+MAX_SOLVER_THREADS = 2
+
+# Variables we solve for first when an equation has several unknowns
+PREFERRED_VARIABLES = ("x", "y", "z", "t", "n", "a", "b")
+
+# LaTeX functions with a direct SymPy equivalent
+FUNCTIONS = {
+    "\\sin": "sin", "\\cos": "cos", "\\tan": "tan", "\\cot": "cot", "\\sec": "sec", "\\csc": "csc",
+    "\\arcsin": "asin", "\\arccos": "acos", "\\arctan": "atan",
+    "\\sinh": "sinh", "\\cosh": "cosh", "\\tanh": "tanh",
+    "\\ln": "log", "\\log": "log", "\\exp": "exp",
+}
+
+GREEK_LETTERS = {
+    "alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta", "iota", "kappa",
+    "mu", "nu", "xi", "rho", "sigma", "tau", "phi", "chi", "psi", "omega",
+}
+
+OPERATORS = {"\\cdot": "*", "\\times": "*", "\\div": "/", "\\pm": None}
+
+IGNORED_COMMANDS = {"\\left", "\\right", "\\,", "\\;", "\\:", "\\!", "\\ ", "\\quad", "\\qquad",
+                    "\\displaystyle"}
+
+_TOKEN_RE = re.compile(r"\\[A-Za-z]+|\\.|\s+|.", re.DOTALL)
+
+# Derivatives (\frac{d}{dx}, \frac{dy}{dx}, \frac{\partial f}{\partial x}); d would
+# otherwise be read as a variable and cancelled
+_DERIVATIVE_RE = re.compile(r"\\[dt]?frac\s*\{\s*(?:d|\\partial)[^{}]*(?:\{[^{}]*\}[^{}]*)*\}"
+                            r"\s*\{\s*(?:d|\\partial)\s*[A-Za-z]")
+
+# Function application (f(x), g(t), P(A), F(x, y)), which SymPy would read
+# as a product with the argument
+_FUNCTION_CALL_RE = re.compile(r"(?<![A-Za-z\\])(?:[fghFGHP]\s*(?:\\left)?\("
+                               r"|[A-Za-z]\s*(?:\\left)?\(\s*[A-Za-z](?:\s*,\s*[A-Za-z])*\s*(?:\\right)?\))")
+
+# Letters read as plain variables, not SymPy's constants and functions
+# (E, I, N, S, O, Q, ...); only a lowercase e is Euler's number
+_LETTERS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+_executor = None
+_executor_lock = threading.Lock()
+_running = 0
+
+
+class UnsupportedLatex(ValueError):
+    """Raised for LaTeX the local solver does not translate."""
+
+
+@dataclass(frozen=True)
+class LocalSolution:
+    """Exact answer found by SymPy."""
+    answer: str
+    variable: str = None
+    solutions: list = field(default_factory=list)
+    seconds: float = 0.0
+
+
+def _group(tokens, pos):
+    """
+    Translate the argument starting at pos: a {...} group or one token.
+    Returns (python source, next position).
+    """
+    while pos < len(tokens) and tokens[pos].isspace():
+        pos += 1
+    if pos >= len(tokens):
+        raise UnsupportedLatex("Missing argument")
+    if tokens[pos] != "{":
+        return "(" + _translate(tokens[pos:pos + 1]) + ")", pos + 1
+    depth = 0
+    for end in range(pos, len(tokens)):
+        depth += {"{": 1, "}": -1}.get(tokens[end], 0)
+        if depth == 0:
+            return "(" + _translate(tokens[pos + 1:end]) + ")", end + 1
+    raise UnsupportedLatex("Unbalanced braces")
+
+
+def _translate(tokens):
+    out = []
+    pos = 0
+    while pos < len(tokens):
+        token = tokens[pos]
+        pos += 1
+        if token.isspace() or token in IGNORED_COMMANDS:
+            continue
+        if token in ("\\frac", "\\dfrac", "\\tfrac"):
+            numerator, pos = _group(tokens, pos)
+            denominator, pos = _group(tokens, pos)
+            out.append(f"({numerator}/{denominator})")
+        elif token == "\\sqrt":
+            if pos < len(tokens) and tokens[pos] == "[":
+                end = tokens.index("]", pos)
+                index = _translate(tokens[pos + 1:end])
+                radicand, pos = _group(tokens, end + 1)
+                out.append(f"root({radicand},({index}))")
+            else:
+                radicand, pos = _group(tokens, pos)
+                out.append(f"sqrt({radicand})")
+        elif token == "^":
+            exponent, pos = _group(tokens, pos)
+            out.append(f"**{exponent}")
+        elif token == "_":
+            subscript, pos = _group(tokens, pos)
+            name = re.sub(r"\W", "", subscript)
+            if not out or not name or not re.search(r"[A-Za-z]$", out[-1]):
+                raise UnsupportedLatex("Subscript without a variable")
+            out[-1] += "_" + name
+        elif token in FUNCTIONS:
+            out.append(f" {FUNCTIONS[token]} ")
+        elif token in OPERATORS:
+            if OPERATORS[token] is None:
+                raise UnsupportedLatex(f"Unsupported operator {token}")
+            out.append(OPERATORS[token])
+        elif token == "\\pi":
+            out.append(" pi ")
+        elif token[1:] in GREEK_LETTERS and token.startswith("\\"):
+            out.append(f" {token[1:]} ")
+        elif token in ("{", "\\{"):
+            out.append("(")
+        elif token in ("}", "\\}"):
+            out.append(")")
+        elif token in ("[", "]"):
+            out.append("(" if token == "[" else ")")
+        elif token.startswith("\\"):
+            raise UnsupportedLatex(f"Unsupported command {token}")
+        elif re.fullmatch(r"[A-Za-z0-9.+\-*/()=!]", token):
+            out.append(token)
+        else:
+            raise UnsupportedLatex(f"Unsupported character {token!r}")
+    return "".join(out)
+
+
+def latex_to_sympy(latex_code, evaluate=True):
+    """
+    Translate canonical LaTeX (see normalize_latex) into SymPy objects.
+    Args:
+    latex_code: An equation or expression
+    evaluate: False keeps the written structure (no expanding or folding)
+    Returns:
+    tuple: (lhs, rhs) for an equation, (expression, None) otherwise
+    Raises:
+    UnsupportedLatex: For constructs outside elementary algebra
+    """
+    if _DERIVATIVE_RE.search(latex_code):
+        raise UnsupportedLatex("Derivative notation")
+    if _FUNCTION_CALL_RE.search(latex_code):
+        raise UnsupportedLatex("Function application")
+    source = _translate(_TOKEN_RE.findall(latex_code))
+    sides = source.split("=")
+    if len(sides) > 2 or not all(side.strip() for side in sides):
+        raise UnsupportedLatex("Expected at most one '='")
+
+    local_dict = {name: sympy.Symbol(name) for name in GREEK_LETTERS}
+    local_dict.update((letter, sympy.Symbol(letter)) for letter in _LETTERS)
+    local_dict["e"] = sympy.E
+    transformations = standard_transformations + (implicit_multiplication_application, convert_xor)
+    try:
+        parsed = [parse_expr(side, local_dict=local_dict, transformations=transformations,
+                             evaluate=evaluate)
+                  for side in sides]
+    except Exception as e:
+        raise UnsupportedLatex(f"SymPy could not parse {source!r}: {str(e)}")
+    return parsed[0], parsed[1] if len(parsed) == 2 else None
+
+
+def _pick_variable(symbols):
+    names = {symbol.name: symbol for symbol in symbols}
+    for name in PREFERRED_VARIABLES:
+        if name in names:
+            return names[name]
+    return sorted(symbols, key=lambda symbol: symbol.name)[0]
+
+
+def _format_value(value, prefix=""):
+    text = f"${prefix}{sympy.latex(value)}$"
+    if value.is_number and not value.is_Rational:
+        approximation = sympy.N(value, 6)
+        if approximation.is_real:
+            text += f" (≈ {approximation})"
+    return text
+
+
+def _is_finite(value):
+    return not value.has(sympy.zoo, sympy.nan, sympy.oo, -sympy.oo)
+
+
+def _solve(latex_code):
+    lhs, rhs = latex_to_sympy(latex_code)
+    if rhs is None:
+        # A bare expression: evaluate or simplify it
+        if lhs.free_symbols:
+            simplified = sympy.simplify(lhs)
+            if simplified == lhs or not _is_finite(simplified):
+                return None  # Already as simple as SymPy gets it; let Gemini explain it
+            return LocalSolution(f"${sympy.latex(lhs)} = {sympy.latex(simplified)}$",
+                                 solutions=[sympy.latex(simplified)])
+        if not _is_finite(lhs):
+            return None  # Division by zero and the like
+        value = sympy.nsimplify(sympy.simplify(lhs))
+        if not _is_finite(value):
+            return None
+        return LocalSolution(_format_value(value), solutions=[sympy.latex(value)])
+
+    if not (_is_finite(lhs) and _is_finite(rhs)):
+        return None
+
+    symbols = (lhs - rhs).free_symbols
+    if not symbols:
+        return None  # Nothing to solve for; let Gemini explain it
+    if (lhs - rhs).atoms(sympy.functions.elementary.trigonometric.TrigonometricFunction):
+        return None  # solve() only returns principal values of periodic equations
+    variable = _pick_variable(symbols)
+    solutions = [s for s in sympy.solve(sympy.Eq(lhs, rhs), variable) if _is_finite(s)]
+    if not solutions:
+        return None  # No solution found; could also be SymPy giving up
+    name = sympy.latex(variable)
+    answer = " or ".join(_format_value(s, f"{name} = ") for s in solutions)
+    return LocalSolution(answer, variable=name, solutions=[sympy.latex(s) for s in solutions])
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_SOLVER_THREADS, thread_name_prefix="local-solver")
+        return _executor
+
+
+def run_with_budget(func, latex_code, time_budget=TIME_BUDGET):
+    """
+    Run func(latex_code) on the solver threads, giving up after time_budget.
+    Returns:
+    The result, or None if func raised, overran the budget or every
+    solver thread is busy
+    """
+    global _running
+    if not SYMPY_AVAILABLE or not latex_code:
+        return None
+    with _executor_lock:
+        if _running >= MAX_SOLVER_THREADS:
+            print("Local solver busy; skipping")
+            return None
+        _running += 1
+
+    def run():
+        global _running
+        try:
+            return func(latex_code)
+        finally:
+            with _executor_lock:
+                _running -= 1
+
+    future = _get_executor().submit(run)
+    try:
+        return future.result(timeout=time_budget)
+    except TimeoutError:
+        print(f"Local solver exceeded {time_budget}s for {latex_code!r}")
+    except UnsupportedLatex as e:
+        print(f"Local solver skipped {latex_code!r}: {str(e)}")
+    except Exception as e:
+        print(f"Local solver failed on {latex_code!r}: {str(e)}")
+    return None
+
+
+def solve_locally(latex_code, time_budget=TIME_BUDGET):
+    """
+    Try to solve an equation exactly with SymPy within a time budget.
+    Args:
+    latex_code: Canonical LaTeX from normalize_latex
+    time_budget: Seconds to wait for SymPy
+    Returns:
+    LocalSolution: With the elapsed time, or None if the equation is
+    unsupported, unsolved, over budget or all solver threads are busy
+    """
+    start = time.perf_counter()
+    solution = run_with_budget(_solve, latex_code, time_budget)
+    if solution is None:
+        return None
+    return LocalSolution(solution.answer, solution.variable, solution.solutions,
+                         time.perf_counter() - start)
+
+
+# Example usage: which typical equations are solved locally, and how fast
+if __name__ == "__main__":
+    samples = [
+        "2x+5=15",
+        "x^{2}-5x+6=0",
+        "\\frac{x}{3}+2=\\frac{1}{2}",
+        "\\sqrt{x+1}=3",
+        "3(x-2)=2x+7",
+        "x^{2}=2",
+        "2^{x}=32",
+        "\\sin x=\\frac{1}{2}",
+        "y=mx+b",
+        "\\frac{3}{4}\\cdot\\frac{8}{9}",
+        "x_{1}+x_{2}=10",
+        "\\int_{0}^{1}x^{2}dx",
+        "\\lim_{x\\to0}\\frac{\\sin x}{x}",
+    ]
+    # Capital letters are variables, not SymPy's E (Euler's number) and I (sqrt(-1))
+    assert solve_locally("E=mc^{2}").solutions == ["c^{2} m"]
+    assert solve_locally("I=5x").solutions == ["\\frac{I}{5}"]
+    # Misreadings that must go to Gemini rather than give a wrong answer
+    for latex in ["\\frac{d}{dx}(x^{3}+2x)", "\\frac{dy}{dx}=2x", "f(x)=2x", "P(A)=0.5", "1/0", "2x+5"]:
+        assert solve_locally(latex) is None, latex
+    solve_locally("x=1")  # Warm up SymPy's caches
+    for latex in samples:
+        start = time.perf_counter()
+        result = solve_locally(latex)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{latex:>32}  {elapsed:7.1f} ms  {result.answer if result else '-> Gemini'}")
@@ -1,135 +1,173 @@
 # manim_animator.py
 import os
-import time
 import re
+import json
 import tempfile
-import subprocess
 from manim import *
+from helpers.latex_validator import normalize_latex, LatexValidationError
+from helpers.latex_preflight import preflight_solution
+from helpers.step_parser import extract_steps
+from helpers.animation_planner import plan_animation
+from helpers.quality_controller import RENDER_LOAD
+from helpers.render_output import prepare_job, SCENE_NAME
+from helpers.video_encoder import encode_video, encoded_path, concat_videos
+from helpers.renderer_select import resolve_renderer, renderer_args, renderer_env
+from helpers.parallel_render import render_parallel, MIN_CHUNKS
+from helpers.render_executor import run_render
+
+# Hold manifest written by "container" hold mode scripts, relative to their cwd
+HOLD_MANIFEST = "holds.json"
 
 def parse_solution_steps(explanation_text):
     """
     Extract clear mathematical steps from the explanation text.
-    Returns a list of dictionaries with equation and explanation parts.
+    Returns a list of SolutionStep objects with equation and explanation parts.
+    """
+    return extract_steps(explanation_text)
+
+def _scene_header(hold_mode="frozen", hold_manifest=HOLD_MANIFEST):
     """
-    lines = explanation_text.strip().split('\n')
-    steps = []
-    current_eq = ""
-    current_explanation = ""
+    Imports and the scene class up to the start of construct().
+    """
+    return """
+from manim import *
+import json
+
+# How static holds are produced:
+# "frozen"    - Manim renders the frame once and repeats it for the hold
+# "container" - one frame is rendered and encoded; its duration is stretched
+#               when the partial movies are joined (see _stretch_holds)
+HOLD_MODE = %s
+HOLD_MANIFEST = %s
+
+class MathSolutionAnimation(Scene):
+    def setup(self):
+        self.hold_manifest = []
     
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-            
-        # Check if line contains an equation (has = sign or mathematical symbols)
-        if '=' in line or any(symbol in line for symbol in ['+', '-', '×', '÷', '(', ')', '√', '^']):
-            # If we already have an equation stored, save it before starting a new one
-            if current_eq:
-                steps.append({
-                    "equation": current_eq,
-                    "explanation": current_explanation.strip()
-                })
-                current_explanation = ""
-            
-            # Extract the equation part (try to clean any prefixes like "Step 1:" etc.)
-            eq_match = re.search(r'(?:Step \d+:?\s*|[•*-]\s*)?(.+)', line)
-            if eq_match:
-                current_eq = eq_match.group(1).strip()
-            else:
-                current_eq = line
+    def hold(self, seconds):
+        # Keep the current frame on screen without re-rendering it
+        if HOLD_MODE == "container":
+            index = len(self.renderer.file_writer.partial_movie_files)
+            self.hold_manifest.append([index, seconds])
+            self.wait(1 / config.frame_rate, frozen_frame=True)
         else:
-            # This line is probably an explanation
-            current_explanation += line + " "
+            self.wait(seconds, frozen_frame=True)
     
-    # Don't forget to add the last equation
-    if current_eq:
-        steps.append({
-            "equation": current_eq,
-            "explanation": current_explanation.strip()
-        })
+    def tear_down(self):
+        if self.hold_manifest:
+            with open(HOLD_MANIFEST, "w") as f:
+                json.dump(self.hold_manifest, f)
     
-    return steps
+    def construct(self):""" % (repr(hold_mode), repr(hold_manifest))
 
-def generate_manim_script(latex_expression, solution_steps):
+def _intro_script(latex_expression, hold_mode="frozen", hold_manifest=HOLD_MANIFEST):
     """
-    Generate a Manim Python script for animating the solution.
+    Script for the title, the original equation and the steps heading.
     """
-    script = """
-from manim import *
-
-class MathSolutionAnimation(Scene):
-    def construct(self):
+    return _scene_header(hold_mode, hold_manifest) + """
         # Title
         title = Text("Step-by-Step Solution", color=BLUE).scale(0.8)
         title.to_edge(UP)
         self.play(Write(title))
-        self.wait(0.5)
+        self.hold(0.5)
         
         # Original equation
-        original_eq = MathTex(r"%s")
+        original_eq = MathTex(%s)
         original_eq.next_to(title, DOWN, buff=0.5)
         self.play(Write(original_eq))
-        self.wait(1)
+        self.hold(1)
         
         # Move original equation to top
         self.play(
             original_eq.animate.scale(0.8).to_corner(UL).shift(DOWN * 0.5 + RIGHT * 0.5)
         )
-        self.wait(0.5)
+        self.hold(0.5)
         
         # Create a heading for steps
         steps_title = Text("Solution Steps:", color=YELLOW).scale(0.7)
         steps_title.next_to(title, DOWN, buff=0.5)
         self.play(Write(steps_title))
-        self.wait(0.5)
+        self.hold(0.5)
         
         # Track the last equation and explanation for positioning
         last_obj = steps_title
         all_equations = []
+        page_objects = []
         
         # Create and display each step
-""" % latex_expression
-    
-    # Add code for each solution step
-    for i, step in enumerate(solution_steps):
-        equation = step.get("equation", "").strip()
-        explanation = step.get("explanation", "").strip()
-        
-        # Skip empty steps
-        if not equation:
-            continue
+""" % repr(latex_expression)
+
+def _restore_script(latex_expression):
+    """
+    Recreate the state left by the intro without animating it, so a chunk
+    can start from the first frame of a later page.
+    """
+    return """
+        # Restore the headings and original equation from the intro
+        title = Text("Step-by-Step Solution", color=BLUE).scale(0.8)
+        title.to_edge(UP)
+        original_eq = MathTex(%s)
+        original_eq.next_to(title, DOWN, buff=0.5)
+        original_eq.scale(0.8).to_corner(UL).shift(DOWN * 0.5 + RIGHT * 0.5)
+        steps_title = Text("Solution Steps:", color=YELLOW).scale(0.7)
+        steps_title.next_to(title, DOWN, buff=0.5)
+        self.add(title, original_eq, steps_title)
         
-        # Clean the equation for LaTeX
-        equation = equation.replace('\\', '\\\\')  # Escape backslashes
+        last_obj = steps_title
+        all_equations = []
+        page_objects = []
+""" % repr(latex_expression)
+
+def _clear_page_script(page_number, plan):
+    """
+    Script that fades out the current page before page_number is shown.
+    """
+    return """
+        # Page %d: clear the previous steps to keep everything in frame
+        self.play(FadeOut(VGroup(*page_objects)), run_time=%.2f)
+        page_objects = []
+        last_obj = steps_title
+        """ % (page_number, plan.page_transition_time)
+
+def _page_script(page_number, steps, first_step, plan):
+    """
+    Script for one page of steps.
+    """
+    script = ""
+    
+    for offset, step in enumerate(steps):
+        n = first_step + offset
         
         # Add the step to the script
-        step_script = """
+        script += """
         # Step %d
-        step%d_eq = MathTex(r"%s")
+        step%d_eq = MathTex(%s)
         step%d_eq.next_to(last_obj, DOWN, buff=0.5)
-        self.play(Write(step%d_eq))
+        self.play(Write(step%d_eq), run_time=%.2f)
         all_equations.append(step%d_eq)
+        page_objects.append(step%d_eq)
         last_obj = step%d_eq
-        self.wait(1)
-        """ % (i+1, i+1, equation, i+1, i+1, i+1, i+1)
-        
-        script += step_script
+        self.hold(%.2f)
+        """ % (n, n, repr(step.equation), n, n, plan.write_time, n, n, n, plan.step_hold)
         
         # Add explanation if available
-        if explanation:
-            explanation = explanation.replace('"', '\\"')  # Escape quotes
-            explanation_script = """
+        if step.explanation:
+            script += """
         # Explanation for step %d
-        step%d_exp = Text("%s", color=GRAY).scale(0.5)
+        step%d_exp = Text(%s, color=GRAY).scale(0.5)
         step%d_exp.next_to(step%d_eq, RIGHT, buff=0.5)
-        self.play(Write(step%d_exp))
+        self.play(Write(step%d_exp), run_time=%.2f)
+        page_objects.append(step%d_exp)
         last_obj = step%d_eq  # Keep positioning relative to equation
-        self.wait(1)
-            """ % (i+1, i+1, explanation, i+1, i+1, i+1, i+1)
-            script += explanation_script
-    
-    # Add final highlighting for the answer
-    script += """
+        self.hold(%.2f)
+            """ % (n, n, repr(step.explanation), n, n, n, plan.explanation_time, n, n, plan.explanation_hold)
+    return script
+
+def _outro_script():
+    """
+    Script that highlights the final answer.
+    """
+    return """
         # Highlight the final answer
         if all_equations:
             final_box = SurroundingRectangle(all_equations[-1], color=GREEN, buff=0.2)
@@ -140,14 +178,169 @@ class MathSolutionAnimation(Scene):
                 Create(final_box),
                 Write(final_text)
             )
-            self.wait(2)
+            self.hold(2)
     """
+
+def generate_manim_script(latex_expression, solution_steps, plan=None, hold_mode="frozen"):
+    """
+    Generate a Manim Python script for animating the solution.
+    Steps are laid out and timed by an AnimationPlan so the video length
+    stays within budget; one is built with default settings if not given.
+    Every pause is a self.hold(), which never re-renders static frames.
+    """
+    if plan is None:
+        plan = plan_animation(solution_steps)
+    
+    script = _intro_script(latex_expression, hold_mode)
+    
+    # Add code for each page of solution steps
+    step_number = 1
+    for page_number, page in enumerate(plan.pages, start=1):
+        if page_number > 1:
+            script += _clear_page_script(page_number, plan)
+        script += _page_script(page_number, page, step_number, plan)
+        step_number += len(page)
+    
+    # Add final highlighting for the answer
+    script += _outro_script()
     
     return script
 
-def create_solution_animation(latex_expression, explanation_text, output_dir="animations", quality="medium"):
+def chunk_manifest(index):
+    """
+    Hold manifest name for a chunk; chunks share a working directory.
+    """
+    return "holds_%d.json" % index
+
+def generate_chunk_scripts(latex_expression, solution_steps, plan=None, hold_mode="frozen"):
+    """
+    Split the animation from generate_manim_script into one script per page.
+    The first chunk also plays the intro; later chunks restore the intro's
+    final state instantly. Each chunk ends by clearing its page (or with the
+    final answer), so the joined chunks play exactly like the full scene.
+    """
+    if plan is None:
+        plan = plan_animation(solution_steps)
+    
+    scripts = []
+    step_number = 1
+    for page_number, page in enumerate(plan.pages, start=1):
+        index = page_number - 1
+        if page_number == 1:
+            script = _intro_script(latex_expression, hold_mode, chunk_manifest(index))
+        else:
+            script = _scene_header(hold_mode, chunk_manifest(index)) + _restore_script(latex_expression)
+        script += _page_script(page_number, page, step_number, plan)
+        step_number += len(page)
+        if page_number < len(plan.pages):
+            script += _clear_page_script(page_number + 1, plan)
+        else:
+            script += _outro_script()
+        scripts.append(script)
+    return scripts
+
+def _encode_output(video_path, encoding):
+    """
+    Apply the requested encoding preset, reusing an earlier encode if present.
+    Falls back to Manim's own output when encoding fails.
+    """
+    if not encoding:
+        return video_path
+    target = encoded_path(video_path, encoding)
+    if os.path.exists(target):
+        os.utime(target)
+        return target
+    return encode_video(video_path, encoding, target) or video_path
+
+def _stretch_holds(job, hold_manifest=HOLD_MANIFEST):
+    """
+    Rebuild a "container" hold mode video: each hold was rendered as a single
+    frame, and the concat demuxer now shows it for the full hold duration.
+    Returns True if the video was rebuilt.
+    """
+    manifest_path = os.path.join(job.work_dir, hold_manifest)
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path) as f:
+        durations = {index: seconds for index, seconds in json.load(f)}
+    
+    # Manim lists the partial movies it joined as: file 'file:/abs/path.mp4'
+    partial_dir = os.path.join(os.path.dirname(job.video_path), "partial_movie_files", SCENE_NAME)
+    list_path = os.path.join(partial_dir, "partial_movie_file_list.txt")
+    if not os.path.exists(list_path):
+        print(f"No partial movie list at {list_path}; keeping single-frame holds")
+        return False
+    with open(list_path) as f:
+        partial_movies = re.findall(r"^file '(?:file:)?(.*)'$", f.read(), re.MULTILINE)
+    
+    return concat_videos(partial_movies, job.video_path, durations) is not None
+
+def _render_job(job, manim_quality, fps, renderer, hold_manifest=HOLD_MANIFEST):
+    """
+    Run Manim on a job's script, which must already be written.
+    Returns True once the video exists at job.video_path.
+    """
+    # Build the command with proper paths
+    manim_cmd = [
+        "manim", 
+        job.script_path,
+        SCENE_NAME,
+        "-o", job.output_filename,
+        "--media_dir", job.media_dir,
+        "-q", manim_quality
+    ] + renderer_args(renderer)
+    if fps:
+        manim_cmd += ["--fps", str(fps)]
+    
+    print(f"Running command: {' '.join(manim_cmd)}")
+    
+    # Run Manim with bounded logs, memory and time limits; RENDER_LOAD lets
+    # the quality controller see how busy we are.
+    # Bytecode for one-off scripts is never reused, so don't write it.
+    with RENDER_LOAD:
+        result = run_render(
+            manim_cmd,
+            cwd=job.work_dir,
+            env=renderer_env(renderer, base_env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1")),
+            label=job.job_id
+        )
+    print(f"Render {job.job_id}: {result.wall_seconds:.1f}s wall, {result.cpu_seconds:.1f}s CPU, "
+          f"{result.peak_rss_mb:.0f} MB peak RSS")
+    
+    if result.timed_out:
+        print(f"Manim timed out; last output:\n{result.log}")
+        return False
+    
+    if result.out_of_memory:
+        print(f"Manim exceeded the render memory limit; last output:\n{result.log}")
+        return False
+    
+    if result.returncode != 0:
+        print(f"Manim error (code {result.returncode}); last output:\n{result.log}")
+        return False
+    
+    if not os.path.exists(job.video_path):
+        print(f"Manim finished but no video at expected path: {job.video_path}")
+        return False
+    
+    if _stretch_holds(job, hold_manifest):
+        print("Stretched single-frame holds to their full duration")
+    return True
+
+def create_solution_animation(latex_expression, explanation_text, output_dir="animations", quality="medium",
+                              target_duration=None, fps=None, encoding=None, hold_mode="frozen",
+                              renderer=None, parallel=False, solution_steps=None):
     """
     Create a Manim animation from LaTeX expression and explanation text.
+    target_duration bounds the video length in seconds (see plan_animation)
+    and fps overrides the frame rate implied by quality. encoding names an
+    ENCODING_PRESETS entry to re-encode Manim's output with; None keeps it.
+    hold_mode picks how static holds are produced (see _intro_script).
+    renderer is "cairo" or "opengl" (headless); None uses DEFAULT_RENDERER.
+    parallel renders each page in its own process (see parallel_render);
+    a number instead of True caps how many run at once.
+    solution_steps takes ready-made SolutionStep objects (e.g. from
+    derive_steps), in which case explanation_text is not parsed.
     Returns the path to the generated video file.
     """
     # Keep your existing quality_settings for resolution
@@ -170,103 +363,84 @@ def create_solution_animation(latex_expression, explanation_text, output_dir="an
     # Use the settings based on quality
     settings = quality_settings.get(quality.lower(), quality_settings["medium"])
     
-    # Parse solution steps
-    solution_steps = parse_solution_steps(explanation_text)
-    
-    # Create absolute paths for better reliability
-    base_dir = os.path.abspath(os.getcwd())
-    output_dir = os.path.join(base_dir, output_dir)
-    temp_dir = os.path.join(base_dir, "temp_manim")
-    
-    # Create output directory if it doesn't exist
-    os.makedirs(output_dir, exist_ok=True)
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    # Create a unique filename for this animation
-    timestamp = int(time.time())
-    script_filename = os.path.join(temp_dir, f"solution_script_{timestamp}.py")
-    output_filename = f"solution_{timestamp}.mp4"
-    
-    # Generate the Manim script
-    script_content = generate_manim_script(latex_expression, solution_steps)
-    
-    # Write the script to a file
-    with open(script_filename, "w") as f:
-        f.write(script_content)
+    # Reject unrenderable input before spending any time on a render
+    try:
+        latex_expression = normalize_latex(latex_expression)
+    except LatexValidationError as e:
+        print(f"Invalid LaTeX expression, skipping animation: {str(e)}")
+        return None
     
+    # Steps, TeX pre-flight, planning, renderer and job setup can all fail
+    # (TeX toolchain, unknown renderer, lock directory); report and return None
     try:
-        # Run Manim to generate the animation
-        print(f"Generating animation with Manim... Quality: {quality} ({manim_quality})")
+        # Parse solution steps, unless they were derived locally
+        if solution_steps is None:
+            solution_steps = parse_solution_steps(explanation_text)
         
-        # Build the command with proper paths
-        manim_cmd = [
-            "manim", 
-            script_filename,
-            "MathSolutionAnimation",
-            "-o", output_filename,
-            "--media_dir", output_dir,
-            "-q", manim_quality
-        ]
+        # Create absolute paths for better reliability
+        base_dir = os.path.abspath(os.getcwd())
+        output_dir = os.path.join(base_dir, output_dir)
+        temp_dir = os.path.join(base_dir, "temp_manim")
         
-        print(f"Running command: {' '.join(manim_cmd)}")
-        
-        # Use subprocess to run the Manim command with the correct quality flag
-        result = subprocess.run(
-            manim_cmd, 
-            capture_output=True, 
-            text=True
+        # Compile every equation in one batched TeX run so bad steps are
+        # repaired or dropped now instead of failing halfway through the render.
+        # Compiled SVGs land in Manim's Tex cache for the real render.
+        latex_expression, solution_steps = preflight_solution(
+            latex_expression, solution_steps, os.path.join(output_dir, "Tex")
         )
-        
-        # Print full output for debugging
-        print(f"Manim stdout: {result.stdout}")
-        print(f"Manim stderr: {result.stderr}")
-        
-        if result.returncode != 0:
-            print(f"Manim error (code {result.returncode}): {result.stderr}")
+        if latex_expression is None:
+            print("Original equation does not compile; skipping animation.")
             return None
         
-        # Find the path to the generated video (check multiple possible paths)
-        possible_paths = [
-            os.path.join(output_dir, "videos", "MathSolutionAnimation", output_filename),
-            os.path.join(output_dir, "videos", output_filename),
-            os.path.join(output_dir, output_filename)
-        ]
+        # Create output directory if it doesn't exist
+        os.makedirs(output_dir, exist_ok=True)
+        os.makedirs(temp_dir, exist_ok=True)
         
-        # Try to find the actual video file
-        video_path = None
-        for path in possible_paths:
-            if os.path.exists(path):
-                video_path = path
-                print(f"Found animation at: {video_path}")
-                break
+        # Fit the steps into the duration budget, then generate the Manim script
+        plan = plan_animation(solution_steps, target_duration=target_duration)
+        print(f"Animation plan: {len(plan.steps)} steps on {len(plan.pages)} page(s), ~{plan.estimated_duration:.1f}s")
+        script_content = generate_manim_script(latex_expression, solution_steps, plan, hold_mode)
         
-        if not video_path:
-            # List contents of output directory to help debug
-            print("Animation file not found. Contents of output directories:")
-            for root, dirs, files in os.walk(output_dir):
-                print(f"Directory: {root}")
-                for file in files:
-                    if file.endswith(".mp4"):
-                        found_path = os.path.join(root, file)
-                        print(f"Found MP4: {found_path}")
-                        # Use the first mp4 found if we can't find the exact file
-                        if not video_path and "solution" in file:
-                            video_path = found_path
-            
-            if not video_path:
-                print("No animation files found after generation.")
-                return None
+        # Each job gets a content-derived name and its own working directory
+        # (removed when the lock is released), so concurrent renders never
+        # collide and the output path is known upfront
+        renderer = resolve_renderer(renderer)
+        job = prepare_job(script_content, output_dir, temp_dir, manim_quality, fps,
+                          renderer if renderer != "cairo" else None)
         
-        return video_path
+        with job.lock():
+            # An identical render already finished; reuse it
+            if os.path.exists(job.video_path):
+                print(f"Reusing rendered animation: {job.video_path}")
+                os.utime(job.video_path)  # Keep it recent for LRU sweeps
+                return _encode_output(job.video_path, encoding)
+            
+            if parallel and len(plan.pages) >= MIN_CHUNKS:
+                # Render each page in its own Manim process and join the chunks
+                chunk_scripts = generate_chunk_scripts(latex_expression, solution_steps, plan, hold_mode)
+                print(f"Rendering {len(chunk_scripts)} chunks in parallel... Quality: {quality} ({manim_quality}), renderer: {renderer}")
+                rendered = render_parallel(
+                    job,
+                    chunk_scripts,
+                    lambda chunk, index: _render_job(chunk, manim_quality, fps, renderer, chunk_manifest(index)),
+                    max_workers=None if parallel is True else parallel
+                )
+                if not rendered:
+                    return None
+            else:
+                # Write the script to the job's working directory
+                job.write_script(script_content)
+                print(f"Generating animation with Manim... Quality: {quality} ({manim_quality}), renderer: {renderer}")
+                if not _render_job(job, manim_quality, fps, renderer):
+                    return None
+            
+            print(f"Found animation at: {job.video_path}")
+            return _encode_output(job.video_path, encoding)
     except Exception as e:
         print(f"Error generating animation: {str(e)}")
         import traceback
         traceback.print_exc()
         return None
-    finally:
-        # Clean up the script file
-        if os.path.exists(script_filename):
-            os.remove(script_filename)
 
 # Example usage
 if __name__ == "__main__":
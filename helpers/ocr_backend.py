@@ -0,0 +1,252 @@
+# ocr_backend.py
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import resource
+import tempfile
+import statistics
+import subprocess
+
+# "fp32" runs LatexOCR as shipped; "int8" quantizes its Linear layers
+# (nearly all encoder/decoder transformer weights) to int8 at load time.
+# The ResNet backbone is convolutional and stays in float32.
+OCR_BACKENDS = ("fp32", "int8")
+DEFAULT_OCR_BACKEND = os.environ.get("OCR_BACKEND", "fp32")
+
+# PyTorch thread pools for OCR; 0 leaves PyTorch's default (one per core)
+OCR_INTRA_OP_THREADS = int(os.environ.get("OCR_INTRA_OP_THREADS", "0"))
+OCR_INTER_OP_THREADS = int(os.environ.get("OCR_INTER_OP_THREADS", "0"))
+
+# Fixed equations the benchmark renders and reads back
+OCR_CORPUS = [
+    "2x+5=15",
+    "3(x-2)=2x+7",
+    "\\frac{x}{3}+2=\\frac{1}{2}",
+    "x^{2}-5x+6=0",
+    "2x^{2}+4x-6=0",
+    "\\sqrt{x+1}=3",
+    "\\frac{d}{dx}\\left(x^{3}+2x\\right)",
+    "\\int_{0}^{1}x^{2}\\,dx",
+    "\\sum_{i=1}^{n}i=\\frac{n(n+1)}{2}",
+    "\\lim_{x\\to0}\\frac{\\sin x}{x}=1",
+    "\\begin{cases}2x+y=5\\\\x-y=1\\end{cases}",
+    "y=mx+b",
+    "a^{2}+b^{2}=c^{2}",
+    "\\log_{2}(x)=5",
+    "e^{2x}=7",
+    "\\sin^{2}\\theta+\\cos^{2}\\theta=1",
+    "x=\\frac{-b\\pm\\sqrt{b^{2}-4ac}}{2a}",
+    "\\frac{3}{4}\\cdot\\frac{8}{9}",
+    "|2x-3|=7",
+    "F=ma",
+]
+
+# Rendered corpus images are kept here between benchmark runs
+CORPUS_DIR = os.path.join(tempfile.gettempdir(), "hackit_ocr_corpus")
+
+# Resolution the corpus is rendered at; close to a phone photo of a worksheet
+RENDER_DPI = 200
+
+# Seconds allowed to typeset one corpus equation
+RENDER_TIMEOUT = 30
+
+_TOKEN_RE = re.compile(r"\\[A-Za-z]+|\\.|\S")
+
+
+def configure_threads(intra_op_threads=None, inter_op_threads=None):
+    """
+    Set PyTorch's intra-op (per-operator) and inter-op thread pools.
+    The inter-op pool can only be sized before PyTorch first uses it, so
+    call this before loading the model.
+    Returns:
+    tuple: (intra-op threads, inter-op threads) now in effect
+    """
+    import torch
+    if intra_op_threads:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError as e:
+            print(f"Could not set inter-op threads (pool already started): {str(e)}")
+    return torch.get_num_threads(), torch.get_num_interop_threads()
+
+
+def quantize(ocr):
+    """
+    Apply dynamic int8 quantization to a LatexOCR model's Linear layers.
+    Weights are stored as int8; activations are quantized per batch at run
+    time, so no calibration data is needed.
+    """
+    import torch
+    try:
+        from torch.ao.quantization import quantize_dynamic
+    except ImportError:  # PyTorch < 1.10
+        from torch.quantization import quantize_dynamic
+    ocr.model = quantize_dynamic(ocr.model.cpu(), {torch.nn.Linear}, dtype=torch.qint8)
+    ocr.model.eval()
+    return ocr
+
+
+def load_model(backend=DEFAULT_OCR_BACKEND, intra_op_threads=OCR_INTRA_OP_THREADS,
+               inter_op_threads=OCR_INTER_OP_THREADS):
+    """
+    Construct a LatexOCR model for an inference backend.
+    Args:
+    backend: One of OCR_BACKENDS
+    intra_op_threads: Threads per operator; 0 or None keeps PyTorch's default
+    inter_op_threads: Threads running independent operators; 0 or None keeps the default
+    Returns:
+    LatexOCR: Ready to call on a PIL image
+    """
+    if backend not in OCR_BACKENDS:
+        raise ValueError(f"Unknown OCR backend {backend!r}; expected one of {OCR_BACKENDS}")
+    threads = configure_threads(intra_op_threads, inter_op_threads)
+    from pix2tex.cli import LatexOCR
+    ocr = LatexOCR()
+    if backend == "int8":
+        quantize(ocr)
+    print(f"Loaded OCR model ({backend}, {threads[0]} intra-op / {threads[1]} inter-op threads)")
+    return ocr
+
+
+def render_corpus(corpus=OCR_CORPUS, directory=CORPUS_DIR, dpi=RENDER_DPI):
+    """
+    Typeset each corpus equation to a PNG with latex and dvipng, reusing
+    images rendered by earlier runs.
+    Returns:
+    list: (latex, image path) pairs for the equations that rendered
+    """
+    os.makedirs(directory, exist_ok=True)
+    rendered = []
+    for latex in corpus:
+        name = hashlib.sha1(f"{latex}@{dpi}".encode("utf-8")).hexdigest()[:12]
+        image_path = os.path.join(directory, f"{name}.png")
+        if not os.path.exists(image_path):
+            with tempfile.TemporaryDirectory(dir=directory) as work_dir:
+                with open(os.path.join(work_dir, "eq.tex"), "w") as f:
+                    f.write("\\documentclass[preview,border=4pt]{standalone}\n"
+                            "\\usepackage{amsmath}\n\\usepackage{amssymb}\n"
+                            f"\\begin{{document}}\n$\\displaystyle {latex}$\n\\end{{document}}\n")
+                try:
+                    subprocess.run(["latex", "-interaction=nonstopmode", "-halt-on-error", "eq.tex"],
+                                   cwd=work_dir, capture_output=True, check=True, timeout=RENDER_TIMEOUT)
+                    subprocess.run(["dvipng", "-D", str(dpi), "-T", "tight", "-bg", "White",
+                                    "-o", image_path, "eq.dvi"],
+                                   cwd=work_dir, capture_output=True, check=True, timeout=RENDER_TIMEOUT)
+                except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError) as e:
+                    print(f"Could not render {latex!r}: {str(e)}")
+                    continue
+        rendered.append((latex, image_path))
+    return rendered
+
+
+def _edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, token in enumerate(a, start=1):
+        current = [i]
+        for j, other in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (token != other)))
+        previous = current
+    return previous[-1]
+
+
+def token_similarity(predicted, expected):
+    """
+    1 - token edit distance / length, over LaTeX tokens (spacing ignored).
+    """
+    a, b = _TOKEN_RE.findall(predicted or ""), _TOKEN_RE.findall(expected)
+    return 1.0 - _edit_distance(a, b) / max(len(a), len(b), 1)
+
+
+def run_benchmark(backend, intra_op_threads, inter_op_threads, corpus):
+    """
+    Load one configuration and time it over the rendered corpus.
+    Run in a fresh process per configuration (see benchmark): thread pools
+    can't be resized once used, and RSS must not include another model.
+    """
+    from PIL import Image
+    from helpers.equation_index import canonical_form
+
+    start = time.perf_counter()
+    ocr = load_model(backend, intra_op_threads, inter_op_threads)
+    load_seconds = time.perf_counter() - start
+    images = [(latex, Image.open(path).convert("RGB")) for latex, path in corpus]
+    ocr(images[0][1])  # Warm-up: first call allocates buffers
+
+    latencies, outputs, exact, similarity = [], [], 0, 0.0
+    for latex, image in images:
+        start = time.perf_counter()
+        predicted = ocr(image)
+        latencies.append(time.perf_counter() - start)
+        outputs.append(predicted)
+        exact += canonical_form(predicted) == canonical_form(latex)
+        similarity += token_similarity(predicted, latex)
+    latencies.sort()
+    return {
+        "backend": backend,
+        "threads": list(configure_threads()),
+        "load_seconds": load_seconds,
+        "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] * 1000,
+        "exact": exact / len(images),
+        "similarity": similarity / len(images),
+        "outputs": outputs,
+    }
+
+
+def benchmark(configs, corpus=OCR_CORPUS):
+    """
+    Compare OCR backends and thread settings on a fixed equation corpus.
+    Args:
+    configs: (backend, intra-op threads, inter-op threads) tuples
+    corpus: LaTeX equations to render and read back
+    Returns:
+    list: One result dict per configuration, with "agrees_fp32" set to the
+    share of outputs identical to the first fp32 configuration's
+    """
+    rendered = render_corpus(corpus)
+    if not rendered:
+        raise RuntimeError("No corpus equation could be rendered (are latex and dvipng installed?)")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for backend, intra, inter in configs:
+        # One process per configuration; the result is the last line of output
+        completed = subprocess.run(
+            [sys.executable, "-m", "helpers.ocr_backend", "--worker",
+             json.dumps([backend, intra, inter, rendered])],
+            cwd=root, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            print(f"{backend} ({intra}/{inter} threads) failed:\n{completed.stderr[-2000:]}")
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    reference = next((r["outputs"] for r in results if r["backend"] == "fp32"), None)
+    for result in results:
+        if reference:
+            same = sum(a == b for a, b in zip(result["outputs"], reference))
+            result["agrees_fp32"] = same / len(reference)
+    return results
+
+
+# Example usage: python -m helpers.ocr_backend  (needs pix2tex, latex and dvipng)
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--worker":
+        backend, intra, inter, corpus = json.loads(sys.argv[2])
+        print(json.dumps(run_benchmark(backend, intra, inter, corpus)))
+        sys.exit(0)
+
+    cores = os.cpu_count() or 1
+    thread_counts = sorted({1, 2, 4, cores} & set(range(1, cores + 1)))
+    configs = [(backend, threads, 1) for backend in OCR_BACKENDS for threads in thread_counts]
+    print(f"{'backend':>7} {'threads':>8} {'load s':>7} {'RSS MB':>7} {'p50 ms':>7} {'p95 ms':>7} "
+          f"{'exact':>6} {'tokens':>6} {'=fp32':>6}")
+    for r in benchmark(configs):
+        print(f"{r['backend']:>7} {r['threads'][0]:>4}/{r['threads'][1]:<3} {r['load_seconds']:7.1f} "
+              f"{r['rss_mb']:7.0f} {r['p50_ms']:7.0f} {r['p95_ms']:7.0f} {r['exact']:6.0%} "
+              f"{r['similarity']:6.0%} {r.get('agrees_fp32', 0):6.0%}")
@@ -0,0 +1,488 @@
+# ocr_preprocess.py
+import time
+from dataclasses import dataclass, field
+import numpy as np
+from PIL import Image, ImageEnhance, ImageFilter, ImageOps
+
+# Largest image handed to OCR: twice pix2tex's max input (672x192), leaving
+# headroom for its resizer network to pick the final scale
+OCR_MAX_SIZE = (1344, 384)
+
+# Lines of writing are never shrunk below this height to fit OCR_MAX_SIZE;
+# a page of them squeezed into 384 px would leave characters ~4 px wide
+OCR_MIN_LINE_HEIGHT = 40
+
+# Size of the downscaled copy the ink bounding box is searched on
+ANALYSIS_SIZE = (512, 512)
+
+# A pixel is ink if darker than this fraction of the paper (median) brightness
+INK_RATIO = 0.75
+
+# Share of ink pixels ignored on each side of the box, so specks and
+# shadows at the edge of a photo don't stretch it
+INK_OUTLIER_FRACTION = 0.005
+
+# Margin kept around the ink, as a fraction of the box's height
+CROP_MARGIN = 0.15
+
+# Bands of ink rows shorter than this fraction of the tallest (fraction
+# bars, dots, specks) are not counted as lines of writing
+MIN_LINE_FRACTION = 0.25
+
+# Skip cropping when the ink already fills this much of a small image
+SKIP_FILL_RATIO = 0.6
+
+# Height the cropped writing is scaled to before measuring sharpness, so
+# blur is judged relative to the size of the writing, not the photo
+QUALITY_HEIGHT = 32
+
+# Quality gate limits. Sharpness is the Laplacian variance over the squared
+# contrast: ~0.13 for crisp text, ~0.01 for a visibly soft but readable
+# photo, ~0.001 once strokes have merged. Noise is the estimated noise
+# standard deviation over the contrast: ~0.006 for a clean photo, ~0.04
+# for a very grainy but readable one, ~0.25 for pure noise.
+MIN_SHARPNESS = 0.004
+MAX_NOISE = 0.15
+MIN_CONTRAST = 30
+MIN_BRIGHTNESS = 40
+MIN_INK_COVERAGE = 0.002
+MAX_INK_COVERAGE = 0.5
+
+# Preprocessing applied before OCR: "none" for clean renders, screenshots
+# and scans, "light" (grayscale and contrast stretch) for ordinary photos,
+# "full" (preprocess_handwritten_image) for shadowed or grainy ones
+PREPROCESSING_MODES = ("none", "light", "full")
+
+# Mode selection limits. Bimodality is Otsu's between-class share of the
+# gray-level variance: ~0.98 for rendered text, ~0.85-0.9 for a photo,
+# ~0.7 once a shadow spreads the paper's brightness. Color is the mean
+# spread between a pixel's RGB channels: 0 for gray renders, ~20 for a
+# photo of paper under room light.
+CLEAN_BIMODALITY = 0.93
+CLEAN_NOISE = 0.012
+CLEAN_COLOR = 6
+FULL_BIMODALITY = 0.8
+FULL_NOISE = 0.04
+
+# Grayscale images with at least this share of pixels within BINARY_LEVEL
+# of black or white are already binarized (e.g. by a "full" pass) and get
+# "none"; downscaling for the measurements above would blur them into gray
+BINARY_FRACTION = 0.98
+BINARY_LEVEL = 5
+
+
+class UnusableImage(ValueError):
+    """Raised when an upload is too poor for OCR to have a chance."""
+
+
+@dataclass(frozen=True)
+class ImageQuality:
+    """Cheap quality measurements of an image, and what is wrong with it."""
+    sharpness: float
+    noise: float
+    contrast: float
+    brightness: float
+    ink_coverage: float
+    problems: list = field(default_factory=list)
+
+    @property
+    def ok(self):
+        return not self.problems
+
+
+@dataclass(frozen=True)
+class PreprocessingChoice:
+    """Preprocessing mode chosen for an image, and the statistics behind it."""
+    mode: str
+    bimodality: float
+    noise: float
+    color: float
+
+
+def preprocess_handwritten_image(img):
+    """
+    Optimize handwritten image for better OCR results
+    Args:
+    img: PIL Image object
+    Returns:
+    PIL Image: Processed image
+    """
+    # Convert to grayscale
+    if img.mode != 'L':
+        img = img.convert('L')
+
+    # Enhance contrast
+    enhancer = ImageEnhance.Contrast(img)
+    img = enhancer.enhance(2.0)  # Increase contrast
+
+    # Apply adaptive thresholding
+    img_array = np.array(img)
+
+    # Calculate adaptive threshold (signed, so dark regions don't wrap around)
+    blur_radius = 20
+    blurred = np.asarray(img.filter(ImageFilter.GaussianBlur(blur_radius)), dtype=np.int16)
+    threshold = blurred - 10  # Offset
+
+    # Apply threshold
+    binary = np.where(img_array > threshold, 255, 0).astype(np.uint8)
+    img = Image.fromarray(binary)
+
+    # Reduce noise with a median filter
+    img = img.filter(ImageFilter.MedianFilter(size=3))
+
+    # Sharpen edges
+    enhancer = ImageEnhance.Sharpness(img)
+    img = enhancer.enhance(1.5)
+
+    return img
+
+
+def normalize_mode(image):
+    """
+    Convert an image to "L" or "RGB", the modes the OCR pipeline works in.
+    Palette (GIF, PNG), bilevel (fax TIFF) and 16-bit (scanner TIFF, PNG)
+    images become grayscale or RGB; transparent regions become white paper.
+    Args:
+    image: PIL Image object
+    Returns:
+    PIL Image: The image itself if it is already "L" or "RGB"
+    """
+    if image.mode in ("L", "RGB") and "transparency" not in image.info:
+        return image
+    if image.mode.startswith("I") or image.mode == "F":
+        # 16- and 32-bit grayscale; convert("L") would clip everything above 255
+        pixels = np.asarray(image, dtype=np.float32)
+        if pixels.max() > 255:
+            pixels = pixels * (255 / 65535)
+        return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    grayscale = image.mode in ("1", "L", "LA", "La")
+    if image.mode in ("LA", "La", "RGBA", "RGBa", "PA") or "transparency" in image.info:
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    return image.convert("L" if grayscale else "RGB")
+
+
+def _analysis_copy(image, mode="L"):
+    """
+    Copy of an image no larger than ANALYSIS_SIZE, grayscale by default.
+    """
+    # reduce() has no palette, bilevel or 16-bit variant
+    image = normalize_mode(image)
+    # reduce() box-averages whole blocks, far cheaper than a full-size convert
+    factor = max(1, min(image.width // ANALYSIS_SIZE[0], image.height // ANALYSIS_SIZE[1]))
+    small = (image.reduce(factor) if factor > 1 else image).convert(mode)
+    small.thumbnail(ANALYSIS_SIZE, Image.BILINEAR)
+    return small
+
+
+def ink_box(image):
+    """
+    Find the bounding box of the writing on a downscaled grayscale copy.
+    Args:
+    image: PIL Image object
+    Returns:
+    tuple: (left, top, right, bottom) in full-resolution pixels, or None
+    if the image is blank
+    """
+    small = _analysis_copy(image)
+    pixels = np.asarray(small, dtype=np.float32)
+    rows, columns = np.nonzero(pixels < np.median(pixels) * INK_RATIO)
+    if len(rows) == 0:
+        return None
+    low, high = 100 * INK_OUTLIER_FRACTION, 100 * (1 - INK_OUTLIER_FRACTION)
+    top, bottom = np.percentile(rows, [low, high])
+    left, right = np.percentile(columns, [low, high])
+    scale_x, scale_y = image.width / small.width, image.height / small.height
+    margin = CROP_MARGIN * (bottom - top + 1)
+    return (
+        max(0, int((left - margin) * scale_x)),
+        max(0, int((top - margin) * scale_y)),
+        min(image.width, int(np.ceil((right + 1 + margin) * scale_x))),
+        min(image.height, int(np.ceil((bottom + 1 + margin) * scale_y))),
+    )
+
+
+def text_line_height(image):
+    """
+    Median height of the lines of writing, from the bands of ink rows on a
+    downscaled copy.
+    Args:
+    image: PIL Image object
+    Returns:
+    float: Height in full-resolution pixels, or None if the image is blank
+    """
+    small = _analysis_copy(image)
+    pixels = np.asarray(small, dtype=np.float32)
+    ink = pixels < np.median(pixels) * INK_RATIO
+    rows = ink.sum(axis=1) > INK_OUTLIER_FRACTION * small.width
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], rows.astype(np.int8), [0]))))
+    heights = edges[1::2] - edges[::2]
+    if not len(heights):
+        return None
+    line = np.median(heights[heights >= MIN_LINE_FRACTION * heights.max()])
+    return float(line) * image.height / small.height
+
+
+def auto_crop(image, max_size=OCR_MAX_SIZE):
+    """
+    Crop an image to its writing (plus a margin) and shrink it to at most
+    max_size, so OCR spends no time on blank paper or excess resolution.
+    Several lines of writing are only shrunk until they are
+    OCR_MIN_LINE_HEIGHT tall, even if that leaves the image above max_size.
+    Small images that are mostly writing are returned unchanged.
+    Args:
+    image: PIL Image object
+    max_size: Largest (width, height) to return, for a single line
+    Returns:
+    PIL Image: Cropped and resized image
+    """
+    fits = image.width <= max_size[0] and image.height <= max_size[1]
+    box = ink_box(image)
+    if box is None:
+        return image
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    if fits and area >= SKIP_FILL_RATIO * image.width * image.height:
+        return image
+    image = image.crop(box)
+    scale = min(1.0, max_size[0] / image.width, max_size[1] / image.height)
+    if scale < 1.0:
+        line = text_line_height(image)
+        if line:
+            scale = max(scale, min(1.0, OCR_MIN_LINE_HEIGHT / line))
+    if scale < 1.0:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.LANCZOS)
+    return image
+
+
+def estimate_noise(pixels):
+    """
+    Standard deviation of the noise in a grayscale array (Immerkaer's method:
+    a Laplacian-difference kernel that cancels smooth regions and edges).
+    """
+    residual = (pixels[:-2, :-2] - 2 * pixels[:-2, 1:-1] + pixels[:-2, 2:]
+                - 2 * pixels[1:-1, :-2] + 4 * pixels[1:-1, 1:-1] - 2 * pixels[1:-1, 2:]
+                + pixels[2:, :-2] - 2 * pixels[2:, 1:-1] + pixels[2:, 2:])
+    return float(np.sqrt(np.pi / 2) * np.abs(residual).mean() / 6)
+
+
+def assess_quality(image):
+    """
+    Measure blur, noise, contrast, brightness and ink coverage in a few milliseconds.
+    Meant for an image already cropped to its writing (see auto_crop).
+    Args:
+    image: PIL Image object
+    Returns:
+    ImageQuality: Measurements, with a user-facing reason per problem found
+    """
+    gray = _analysis_copy(image)
+    pixels = np.asarray(gray, dtype=np.float32)
+    low, brightness, high = np.percentile(pixels, [5, 50, 95])
+    contrast = float(high - low)
+    ink_coverage = float((pixels < brightness * INK_RATIO).mean())
+
+    width = max(3, round(gray.width * QUALITY_HEIGHT / gray.height))
+    scaled = np.asarray(gray.resize((width, QUALITY_HEIGHT), Image.BOX), dtype=np.float32)
+    laplacian = (4 * scaled[1:-1, 1:-1] - scaled[:-2, 1:-1] - scaled[2:, 1:-1]
+                 - scaled[1:-1, :-2] - scaled[1:-1, 2:])
+    sharpness = float(laplacian.var()) / max(contrast, 1.0) ** 2
+    noise = estimate_noise(pixels) / max(contrast, 1.0)
+
+    problems = []
+    if brightness < MIN_BRIGHTNESS:
+        problems.append("The image is too dark.")
+    elif ink_coverage < MIN_INK_COVERAGE or contrast < MIN_CONTRAST:
+        problems.append("No writing found; the image is blank or very faint.")
+    elif ink_coverage > MAX_INK_COVERAGE:
+        problems.append("The image is mostly dark; photograph the page against good light.")
+    elif sharpness < MIN_SHARPNESS:
+        problems.append("The image is too blurry to read.")
+    elif noise > MAX_NOISE:
+        problems.append("The image is too grainy to read.")
+    return ImageQuality(sharpness, noise, contrast, float(brightness), ink_coverage, problems)
+
+
+def bimodality(pixels):
+    """
+    Share of the gray-level variance explained by splitting the histogram
+    into ink and paper at Otsu's threshold: 1 for two flat colors, lower
+    as shading and noise fill in the levels between them.
+    """
+    histogram = np.bincount(pixels.astype(np.uint8).ravel(), minlength=256) / pixels.size
+    levels = np.arange(256)
+    weight = np.cumsum(histogram)
+    cumulative_mean = np.cumsum(histogram * levels)
+    mean = cumulative_mean[-1]
+    total_variance = (histogram * (levels - mean) ** 2).sum()
+    if total_variance == 0:
+        return 1.0
+    between = (mean * weight - cumulative_mean) ** 2 / np.maximum(weight * (1 - weight), 1e-12)
+    return float(between.max() / total_variance)
+
+
+def choose_preprocessing(image):
+    """
+    Pick how much preprocessing an image needs before OCR, from its
+    histogram bimodality, noise level and color. Binarized images get
+    "none", so preprocessing an image twice changes nothing.
+    Meant for an image already cropped to its writing (see auto_crop).
+    Args:
+    image: PIL Image object
+    Returns:
+    PreprocessingChoice: One of PREPROCESSING_MODES, with the measurements
+    """
+    pixels = np.asarray(_analysis_copy(image), dtype=np.float32)
+    low, high = np.percentile(pixels, [5, 95])
+    noise = estimate_noise(pixels) / max(float(high - low), 1.0)
+    split = bimodality(pixels)
+    if image.mode in ("L", "1", "I", "F"):
+        color = 0.0
+    else:
+        rgb = np.asarray(_analysis_copy(image, "RGB"), dtype=np.int16)
+        color = float((rgb.max(axis=2) - rgb.min(axis=2)).mean())
+
+    if image.mode in ("L", "1"):
+        histogram = image.histogram()
+        extremes = sum(histogram[:BINARY_LEVEL + 1]) + sum(histogram[255 - BINARY_LEVEL:])
+        binary = extremes >= BINARY_FRACTION * image.width * image.height
+    else:
+        binary = False
+
+    if binary or (split >= CLEAN_BIMODALITY and noise <= CLEAN_NOISE and color <= CLEAN_COLOR):
+        mode = "none"
+    elif split < FULL_BIMODALITY or noise > FULL_NOISE:
+        mode = "full"
+    else:
+        mode = "light"
+    return PreprocessingChoice(mode, split, noise, color)
+
+
+def apply_preprocessing(image, mode):
+    """
+    Apply one of PREPROCESSING_MODES to an image.
+    """
+    if mode == "light":
+        return ImageOps.autocontrast(image.convert("L"), cutoff=1)
+    if mode == "full":
+        return preprocess_handwritten_image(image)
+    if mode == "none":
+        return image
+    raise ValueError(f"Unknown preprocessing mode {mode!r}; expected one of {PREPROCESSING_MODES}")
+
+
+def prepare_for_ocr(image, preprocessing="auto"):
+    """
+    Convert an upload to "L" or "RGB", crop it to its writing, reject it
+    early if OCR has no chance and apply the preprocessing it needs. Run it once per image: extract_latex
+    takes prepared=True for images that already went through it.
+    Args:
+    image: PIL Image object
+    preprocessing: One of PREPROCESSING_MODES, or "auto" to choose per image
+    Returns:
+    PIL Image: The image to run OCR on
+    Raises:
+    UnusableImage: With feedback for the user when the image is hopeless
+    """
+    image = auto_crop(normalize_mode(image))
+    quality = assess_quality(image)
+    if not quality.ok:
+        raise UnusableImage(" ".join(quality.problems))
+    if preprocessing == "auto":
+        preprocessing = choose_preprocessing(image).mode
+    return apply_preprocessing(image, preprocessing)
+
+
+# Example usage: python -m helpers.ocr_preprocess  (from the repo root)
+# auto_crop, the quality gate and preprocessing choice, and OCR latency on a
+# phone-sized photo with and without auto_crop (needs pix2tex for the last part)
+if __name__ == "__main__":
+    from PIL import ImageDraw, ImageFont
+    from helpers.solver_core import load_ocr_model
+
+    photo = Image.new("RGB", (4032, 3024), (236, 232, 224))
+    try:
+        font = ImageFont.truetype("DejaVuSans.ttf", 160)
+    except OSError:
+        font = ImageFont.load_default()
+    ImageDraw.Draw(photo).text((1300, 1400), "2x + 5 = 15", fill=(30, 30, 40), font=font)
+
+    start = time.perf_counter()
+    cropped = auto_crop(photo)
+    crop_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    auto_crop(cropped)
+    skip_ms = (time.perf_counter() - start) * 1000
+    print(f"auto_crop: {photo.size} -> {cropped.size} in {crop_ms:.1f} ms ({skip_ms:.1f} ms when skipped)")
+
+    # A page of writing is only shrunk until its lines are OCR_MIN_LINE_HEIGHT tall
+    page = Image.new("RGB", (2480, 3508), "white")
+    try:
+        page_font = ImageFont.truetype("DejaVuSans.ttf", 60)
+    except OSError:
+        page_font = ImageFont.load_default()
+    for i in range(20):
+        ImageDraw.Draw(page).text((200, 200 + 150 * i), f"{i + 2}x + {3 * i + 1} = {5 * i + 7}",
+                                  fill="black", font=page_font)
+    cropped_page = auto_crop(page)
+    print(f"auto_crop: 20-line page {page.size} -> {cropped_page.size}, "
+          f"lines {text_line_height(cropped_page):.0f} px tall")
+
+    # Quality gate verdicts and cost
+    samples = {
+        "clean": photo,
+        "soft (blur 6)": photo.filter(ImageFilter.GaussianBlur(6)),
+        "blurry (blur 20)": photo.filter(ImageFilter.GaussianBlur(20)),
+        "dark": photo.point(lambda v: v * 0.12),
+        "blank": Image.new("RGB", photo.size, (236, 232, 224)),
+        "noise": Image.fromarray(np.random.default_rng(0).integers(0, 255, (600, 800), dtype=np.uint8)),
+    }
+    for label, sample in samples.items():
+        start = time.perf_counter()
+        try:
+            prepare_for_ocr(sample)
+            verdict = "OK"
+        except UnusableImage as e:
+            verdict = str(e)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{label:>17}: {elapsed:6.1f} ms  {verdict}")
+
+    # Preprocessing chosen for a render, a photo and a shadowed photo
+    render = Image.new("RGB", (900, 240), "white")
+    ImageDraw.Draw(render).text((40, 40), "2x + 5 = 15", fill="black", font=font)
+    shading = np.linspace(0, 140, render.width, dtype=np.float32)[None, :, None]
+    grain = np.random.default_rng(0).normal(0, 6, (render.height, render.width, 3))
+    tinted = np.asarray(render, dtype=np.float32) * [0.92, 0.9, 0.84] + 20
+    samples = {
+        "render": render,
+        "photo": Image.fromarray(np.clip(tinted - shading / 6 + grain, 0, 255).astype(np.uint8)),
+        "shadowed photo": Image.fromarray(np.clip(tinted - shading + grain, 0, 255).astype(np.uint8)),
+    }
+    for label, sample in samples.items():
+        start = time.perf_counter()
+        choice = choose_preprocessing(auto_crop(sample))
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{label:>17}: {elapsed:6.1f} ms  {choice.mode:<5} (bimodality {choice.bimodality:.2f}, "
+              f"noise {choice.noise:.3f}, color {choice.color:.0f})")
+        # A prepared image needs nothing more
+        assert choose_preprocessing(prepare_for_ocr(sample)).mode == "none", label
+
+    # Modes that GIF, fax TIFF, 16-bit scans and transparent PNGs decode to
+    for mode in ("P", "1", "I;16", "I", "LA", "RGBA", "PA", "CMYK"):
+        sample = photo.convert(mode) if mode != "I;16" else \
+            Image.fromarray((np.asarray(photo.convert("L"), dtype=np.uint16) * 257))
+        assert normalize_mode(sample).mode in ("L", "RGB"), mode
+        assert prepare_for_ocr(sample).mode in ("L", "RGB"), mode
+        choice = choose_preprocessing(auto_crop(sample))
+        print(f"{mode:>17}: {sample.size} -> {auto_crop(sample).size}, {choice.mode}")
+
+    try:
+        model = load_ocr_model()
+    except Exception as e:
+        print(f"OCR model unavailable, skipping the latency comparison: {str(e)}")
+    else:
+        model(cropped)  # Warm up
+        for label, prepare in (("original", lambda image: image), ("auto_crop", auto_crop)):
+            start = time.perf_counter()
+            latex = model(prepare(photo))
+            print(f"{label:>10}: {(time.perf_counter() - start) * 1000:7.0f} ms  {latex}")
@@ -0,0 +1,283 @@
+# ocr_workers.py
+import gc
+import os
+import sys
+import time
+import queue
+import signal
+import atexit
+import threading
+import multiprocessing
+from helpers.ocr_backend import load_model, DEFAULT_OCR_BACKEND
+
+# Forked OCR workers; 0 runs OCR in-process instead (see solver_core)
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", "0"))
+
+# Seconds to wait for the server to load the model and fork every worker
+START_TIMEOUT = 600
+
+# Seconds one image may take before the caller gives up on it
+OCR_TIMEOUT = 120
+
+# Seconds between checks for crashed workers in the server
+MONITOR_INTERVAL = 1.0
+
+# /proc/<pid>/smaps_rollup fields reported per worker, in kB
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def memory_usage(pid):
+    """
+    Resident, proportional, shared and private memory of a process in MB.
+    Pages still shared copy-on-write with the server count as shared, and
+    Pss splits them evenly between the processes sharing them.
+    Returns:
+    dict: Empty where /proc/<pid>/smaps_rollup isn't available
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = {}
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in SMAPS_FIELDS:
+                    fields[name] = int(value.split()[0]) / 1024
+    except (OSError, ValueError):
+        return {}
+    return {
+        "rss_mb": round(fields.get("Rss", 0), 1),
+        "pss_mb": round(fields.get("Pss", 0), 1),
+        "shared_mb": round(fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0), 1),
+        "private_mb": round(fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0), 1),
+    }
+
+
+def _worker_loop(model, conn):
+    """
+    Runs in a forked worker: answer OCR requests until told to stop or the
+    caller's end of the pipe closes.
+    """
+    conn.send(("ready", os.getpid()))
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message[0] == "stop":
+            break
+        _, request_id, image = message
+        start = time.perf_counter()
+        try:
+            conn.send(("ok", request_id, model(image), time.perf_counter() - start))
+        except Exception as e:
+            conn.send(("error", request_id, str(e), time.perf_counter() - start))
+
+
+def _serve(conns, backend, threads_per_worker):
+    """
+    The fork server: load the model once, then fork one worker per pipe.
+    Workers inherit the weights copy-on-write; the server never runs
+    inference itself, so no thread pool is running when it forks.
+    """
+    # Let multiprocessing's exit handler terminate the (daemonic) workers
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    model = load_model(backend, threads_per_worker, 1)
+    # Move everything loaded so far out of the collector's reach: collections
+    # write to object headers, which would copy the shared pages
+    gc.freeze()
+
+    context = multiprocessing.get_context("fork")
+
+    def fork(conn):
+        process = context.Process(target=_worker_loop, args=(model, conn), daemon=True)
+        process.start()
+        return process
+
+    caller = os.getppid()
+    processes = [fork(conn) for conn in conns]
+    while os.getppid() == caller:  # Exit with the process that started us
+        time.sleep(MONITOR_INTERVAL)
+        for index, process in enumerate(processes):
+            if not process.is_alive():
+                print(f"OCR worker {process.pid} exited ({process.exitcode}); forking a replacement")
+                processes[index] = fork(conns[index])
+
+
+class _Worker:
+    """Caller-side handle for one forked worker."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.pid = None
+        self.requests = 0
+        self.busy_seconds = 0.0
+
+
+class OcrWorkerPool:
+    """
+    OCR on pre-forked workers that share one copy of the model weights.
+    Callable like a LatexOCR model, so it can be passed to extract_latex.
+    """
+
+    def __init__(self, workers=None, backend=DEFAULT_OCR_BACKEND, threads_per_worker=None,
+                 timeout=OCR_TIMEOUT):
+        self.workers = workers or OCR_WORKERS or 1
+        self.backend = backend
+        # Split the cores between workers rather than oversubscribing them
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.workers)
+        self.timeout = timeout
+        self._server = None
+        self._workers = []
+        self._idle = queue.Queue()
+        self._request_ids = iter(range(sys.maxsize))
+        self._lock = threading.Lock()
+        self.started = None
+
+    def start(self):
+        """
+        Start the fork server and wait until every worker is ready.
+        """
+        pipes = [multiprocessing.Pipe() for _ in range(self.workers)]
+        # A freshly spawned server, not a fork of this (threaded) process
+        context = multiprocessing.get_context("spawn")
+        self._server = context.Process(
+            target=_serve,
+            args=([child for _, child in pipes], self.backend, self.threads_per_worker),
+            name="ocr-fork-server"
+        )
+        self._server.start()
+        for _, child in pipes:
+            child.close()
+
+        deadline = time.monotonic() + START_TIMEOUT
+        for parent, _ in pipes:
+            worker = _Worker(parent)
+            try:
+                if not parent.poll(max(0, deadline - time.monotonic())):
+                    raise TimeoutError("OCR workers did not start in time")
+                _, worker.pid = parent.recv()
+            except (EOFError, TimeoutError) as e:
+                self.close()
+                raise RuntimeError(f"OCR fork server failed to start: {str(e) or 'server exited'}")
+            self._workers.append(worker)
+            self._idle.put(worker)
+        self.started = time.monotonic()
+        atexit.register(self.close)
+        print(f"Started {self.workers} OCR workers ({self.backend}, {self.threads_per_worker} threads each)")
+        return self
+
+    def __call__(self, image):
+        """
+        Run OCR on an idle worker, waiting for one if all are busy.
+        Returns:
+        str: The raw LaTeX the model produced
+        """
+        worker = self._idle.get()
+        try:
+            return self._request(worker, image)
+        finally:
+            self._idle.put(worker)
+
+    def _drain(self, worker):
+        """
+        Discard what arrived while the worker was idle: the ready message of
+        a replacement forked since its last request, late answers to
+        requests that timed out.
+        """
+        while worker.conn.poll(0):
+            message = worker.conn.recv()
+            if message[0] == "ready":
+                worker.pid = message[1]
+
+    def _request(self, worker, image):
+        with self._lock:
+            request_id = next(self._request_ids)
+        self._drain(worker)
+        worker.conn.send(("ocr", request_id, image))
+        deadline = time.monotonic() + self.timeout
+        resent = False
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not worker.conn.poll(remaining):
+                raise TimeoutError(f"OCR worker {worker.pid} took longer than {self.timeout}s")
+            message = worker.conn.recv()
+            if message[0] == "ready":
+                # The worker died and the server forked a replacement. It may
+                # have died before reading the image, so give it one more try
+                worker.pid = message[1]
+                if resent:
+                    raise RuntimeError("OCR worker crashed while reading the image")
+                resent = True
+                worker.conn.send(("ocr", request_id, image))
+                continue
+            status, response_id, value, seconds = message
+            if response_id != request_id:
+                continue  # Late answer to a request that already timed out
+            worker.requests += 1
+            worker.busy_seconds += seconds
+            if status == "error":
+                raise RuntimeError(f"OCR failed: {value}")
+            return value
+
+    def report(self):
+        """
+        Per-worker memory and throughput, plus the server's memory.
+        Returns:
+        dict: "workers" (pid, requests, images per busy second, memory),
+        "server" memory and overall images per second since start
+        """
+        elapsed = time.monotonic() - self.started if self.started else 0
+        workers = []
+        for worker in self._workers:
+            workers.append(dict(
+                pid=worker.pid,
+                requests=worker.requests,
+                images_per_busy_second=round(worker.requests / worker.busy_seconds, 2) if worker.busy_seconds else 0,
+                **memory_usage(worker.pid)
+            ))
+        total = sum(worker.requests for worker in self._workers)
+        return {
+            "workers": workers,
+            "server": memory_usage(self._server.pid) if self._server else {},
+            "images_per_second": round(total / elapsed, 2) if elapsed else 0,
+        }
+
+    def close(self):
+        for worker in self._workers:
+            try:
+                worker.conn.send(("stop",))
+                worker.conn.close()
+            except OSError:
+                pass
+        self._workers = []
+        if self._server is not None and self._server.is_alive():
+            self._server.terminate()
+            self._server.join(timeout=5)
+        self._server = None
+
+
+# Example usage: python -m helpers.ocr_workers [workers] [images]
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+    from helpers.ocr_backend import render_corpus
+    from PIL import Image
+
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    images = [Image.open(path).convert("RGB") for _, path in render_corpus()]
+    if not images:
+        sys.exit("No corpus images (are latex and dvipng installed?)")
+
+    pool = OcrWorkerPool(workers).start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(pool, (images[i % len(images)] for i in range(count))))
+    elapsed = time.perf_counter() - start
+    report = pool.report()
+    print(f"{count} images on {workers} workers: {count / elapsed:.2f} images/s")
+    print(f"server: {report['server']}")
+    for worker in report["workers"]:
+        print(f"worker: {worker}")
+    rss = sum(w.get("rss_mb", 0) for w in report["workers"])
+    pss = sum(w.get("pss_mb", 0) for w in report["workers"])
+    print(f"workers' RSS sums to {rss:.0f} MB but only {pss:.0f} MB proportionally (the rest is shared)")
+    pool.close()
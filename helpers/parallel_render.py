@@ -0,0 +1,108 @@
+# parallel_render.py
+import os
+import shutil
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor
+from helpers.storage_manager import in_flight
+from helpers.video_encoder import concat_videos
+
+# Chunks rendered at once; each one is a separate single-threaded Manim process
+MAX_WORKERS = os.cpu_count() or 1
+
+# Fewer sections than this are rendered as one scene; process startup and
+# the extra concat outweigh the gain
+MIN_CHUNKS = 2
+
+# Manim's compiled-SVG caches inside a media directory (tex_dir, text_dir)
+MEDIA_CACHE_DIRS = ("Tex", "texts")
+
+
+def share_cached_svgs(source_dir, target_dir, copy=False):
+    """
+    Hard-link compiled SVGs from one Manim media directory's caches into
+    another's, skipping files the target already has.
+    Args:
+    source_dir: Media directory to take SVGs from
+    target_dir: Media directory to add them to
+    copy: Copy files that cannot be linked (e.g. across filesystems)
+    Returns:
+    int: Number of files added
+    """
+    added = 0
+    for cache in MEDIA_CACHE_DIRS:
+        source = os.path.join(source_dir, cache)
+        if not os.path.isdir(source):
+            continue
+        target = os.path.join(target_dir, cache)
+        os.makedirs(target, exist_ok=True)
+        for name in fnmatch.filter(os.listdir(source), "*.svg"):
+            source_path = os.path.join(source, name)
+            target_path = os.path.join(target, name)
+            try:
+                # Linking never replaces an existing file, so readers of
+                # the target cache can't see a half-written SVG
+                os.link(source_path, target_path)
+                added += 1
+            except FileExistsError:
+                pass
+            except OSError:
+                if copy and not os.path.exists(target_path):
+                    shutil.copy2(source_path, target_path)
+                    added += 1
+    return added
+
+
+def render_chunks(chunks, render, max_workers=None):
+    """
+    Render chunk jobs concurrently.
+    Args:
+    chunks: RenderJob objects whose scripts are already written
+    render: Function (chunk, index) -> bool that runs Manim for one chunk
+    max_workers: Concurrent renders; defaults to MAX_WORKERS
+    Returns:
+    list: Chunk video paths in playback order, or None if any chunk failed
+    """
+    workers = max(min(max_workers or MAX_WORKERS, len(chunks)), 1)
+    # Threads are enough: each worker just waits on its own Manim process
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="render-chunk") as pool:
+        results = list(pool.map(render, chunks, range(len(chunks))))
+    if not all(results):
+        failed = [chunk.job_id for chunk, ok in zip(chunks, results) if not ok]
+        print(f"Chunk render failed: {', '.join(failed)}")
+        return None
+    return [chunk.video_path for chunk in chunks]
+
+
+def render_parallel(job, chunk_scripts, render, max_workers=None):
+    """
+    Render a scene split into independent sections and join the results.
+    Call while holding job.lock(). Each chunk renders into a private media
+    directory seeded with the shared Tex/texts caches (filled by the TeX
+    pre-flight), and SVGs it compiles are added to the shared caches after.
+    Args:
+    job: RenderJob for the complete video
+    chunk_scripts: Manim scripts, one per section, in playback order; each
+    starts from a reconstructed copy of the previous section's final frame
+    render: Function (chunk, index) -> bool that runs Manim for one chunk
+    max_workers: Concurrent renders; defaults to MAX_WORKERS
+    Returns:
+    str: job.video_path, or None if a chunk or the concat failed
+    """
+    chunks = [job.chunk(index) for index in range(len(chunk_scripts))]
+    try:
+        with in_flight(*[chunk.media_dir for chunk in chunks]):
+            for chunk, script in zip(chunks, chunk_scripts):
+                share_cached_svgs(job.media_dir, chunk.media_dir, copy=True)
+                chunk.write_script(script)
+            video_paths = render_chunks(chunks, render, max_workers)
+            for chunk in chunks:
+                share_cached_svgs(chunk.media_dir, job.media_dir)
+            if video_paths is None:
+                return None
+            # Chunks share codec settings, so they are joined without re-encoding
+            os.makedirs(os.path.dirname(job.video_path), exist_ok=True)
+            return concat_videos(video_paths, job.video_path)
+    finally:
+        # Only the joined video is kept
+        for chunk in chunks:
+            shutil.rmtree(chunk.media_dir, ignore_errors=True)
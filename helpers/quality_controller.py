@@ -0,0 +1,121 @@
+# quality_controller.py
+import os
+import time
+import threading
+from typing import Optional
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+# Renders in flight (per process) before we start degrading quality
+MAX_QUEUE_DEPTH = max((os.cpu_count() or 2) // 2, 1)
+
+# 1-minute load average per core above which the CPU counts as saturated
+CPU_SATURATION = 0.9
+
+# Quality and frame rate used for fast previews under load
+PREVIEW_QUALITY = "low"
+PREVIEW_FPS = 15
+
+# How long a background upgrade waits for capacity before giving up
+UPGRADE_WAIT_SECONDS = 300
+UPGRADE_POLL_SECONDS = 2
+
+
+class RenderLoad:
+    """Counts renders currently running in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = 0
+
+    @property
+    def active(self):
+        return self._active
+
+    def __enter__(self):
+        with self._lock:
+            self._active += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self._active -= 1
+        return False
+
+
+# Shared by every session served by this process
+RENDER_LOAD = RenderLoad()
+
+# Upgrades run one at a time so they never compete with interactive renders
+_upgrade_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render-upgrade")
+
+
+@dataclass(frozen=True)
+class RenderDecision:
+    """Quality to render now, and whether to upgrade to the request later."""
+    quality: str
+    fps: Optional[int] = None
+    upgrade: bool = False
+
+
+def cpu_load():
+    """
+    Return the 1-minute load average per core, or 0.0 where unavailable.
+    """
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 0.0
+
+
+def is_overloaded(extra_renders=0):
+    """
+    Check whether the node is too busy for a full-quality render.
+    Args:
+    extra_renders: Renders about to start that are not yet counted
+    Returns:
+    bool: True under high queue depth or CPU saturation
+    """
+    return (RENDER_LOAD.active + extra_renders >= MAX_QUEUE_DEPTH
+            or cpu_load() >= CPU_SATURATION)
+
+
+def choose_render_quality(requested):
+    """
+    Pick the quality for a render given the current load.
+    Args:
+    requested: Quality the user asked for ("low", "medium" or "high")
+    Returns:
+    RenderDecision: The requested quality when there is capacity, otherwise
+    a low-fps preview flagged for a background upgrade
+    """
+    requested = requested.lower()
+    if requested == PREVIEW_QUALITY or not is_overloaded():
+        return RenderDecision(requested)
+    return RenderDecision(PREVIEW_QUALITY, fps=PREVIEW_FPS, upgrade=True)
+
+
+def _wait_for_capacity():
+    deadline = time.monotonic() + UPGRADE_WAIT_SECONDS
+    while is_overloaded():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(UPGRADE_POLL_SECONDS)
+    return True
+
+
+def schedule_upgrade(render, *args, **kwargs):
+    """
+    Run render(*args, **kwargs) in the background once capacity allows.
+    Args:
+    render: Function producing the full-quality video path
+    Returns:
+    Future: Resolves to render's result, or None if the node stayed busy
+    """
+    def run():
+        if not _wait_for_capacity():
+            print("Skipping quality upgrade: render capacity never became available")
+            return None
+        return render(*args, **kwargs)
+
+    return _upgrade_executor.submit(run)
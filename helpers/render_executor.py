@@ -0,0 +1,253 @@
+# render_executor.py
+import os
+import sys
+import time
+import signal
+import resource
+import threading
+import subprocess
+from collections import deque
+from dataclasses import dataclass
+
+# Lines of combined stdout/stderr kept per render; older lines are dropped
+LOG_LINES = 400
+
+# Wall-clock seconds before a render's whole process group is killed
+RENDER_TIMEOUT = 600
+
+# CPU seconds per render process (RLIMIT_CPU; latex and ffmpeg children
+# each get their own). Kept apart from the wall-clock timeout: a render on a
+# busy machine waits more than it computes, while ffmpeg's encoder threads
+# can use more CPU than wall time. Check render_stats() before lowering it.
+RENDER_CPU_SECONDS = 900
+
+# Resident memory allowed for a render's whole process group (Manim, latex,
+# ffmpeg); a watchdog kills the group above it. Not an RLIMIT_AS: numpy,
+# OpenBLAS and Cairo reserve far more address space than they touch.
+MEMORY_LIMIT_BYTES = 4 * 1024 ** 3
+
+# Seconds between memory checks of a running render
+MEMORY_POLL_SECONDS = 0.5
+
+# Stats kept for the most recent renders
+STATS_HISTORY = 1000
+
+_stats = deque(maxlen=STATS_HISTORY)
+_stats_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class RenderResult:
+    """Outcome and resource usage of one render process."""
+    returncode: int
+    log: str
+    timed_out: bool
+    out_of_memory: bool
+    wall_seconds: float
+    cpu_seconds: float
+    peak_rss_mb: float
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.timed_out and not self.out_of_memory
+
+
+def _limits(cpu_limit):
+    limits = [(resource.RLIMIT_CORE, 0)]
+    if cpu_limit:
+        limits.append((resource.RLIMIT_CPU, int(cpu_limit)))
+    return limits
+
+
+def _group_rss(pgid):
+    """
+    Resident bytes of every process in a process group, from /proc/<pid>/stat.
+    Returns None where /proc is unavailable (not Linux).
+    """
+    try:
+        pids = [pid for pid in os.listdir("/proc") if pid.isdigit()]
+    except OSError:
+        return None
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue  # Exited meanwhile
+        # Fields after the parenthesized command name: state, ppid, pgrp, ... rss is the 22nd
+        fields = stat.rsplit(")", 1)[-1].split()
+        if len(fields) > 21 and int(fields[2]) == pgid:
+            total += int(fields[21]) * page_size
+    return total
+
+
+def _apply_limits(pid, limits):
+    """
+    Apply rlimits to a running process (Linux). Done from the parent rather
+    than in preexec_fn, which is unsafe in threaded servers like Streamlit.
+    Returns False if prlimit is unavailable.
+    """
+    if not hasattr(resource, "prlimit"):
+        return False
+    for limit, value in limits:
+        try:
+            resource.prlimit(pid, limit, (value, value))
+        except (OSError, ValueError) as e:
+            print(f"Could not apply resource limit {limit}: {str(e)}")
+    return True
+
+
+def run_render(cmd, cwd=None, env=None, timeout=RENDER_TIMEOUT, cpu_limit=RENDER_CPU_SECONDS,
+               memory_limit=MEMORY_LIMIT_BYTES, log_lines=LOG_LINES, label=None):
+    """
+    Run a render command with bounded logs, resource limits and accounting.
+    Args:
+    cmd: Command list, e.g. a manim invocation
+    cwd: Working directory
+    env: Environment; defaults to os.environ
+    timeout: Wall-clock seconds before the process group is killed
+    cpu_limit: RLIMIT_CPU seconds for each process
+    memory_limit: Resident bytes of the whole process group before it is killed
+    log_lines: Lines of output kept; the rest is streamed past
+    label: Name recorded with the stats, e.g. the job id
+    Returns:
+    RenderResult: Exit status, log tail, peak RSS and CPU seconds
+    """
+    limits = _limits(cpu_limit)
+    has_prlimit = hasattr(resource, "prlimit")
+
+    def limit_self():
+        for limit, value in limits:
+            resource.setrlimit(limit, (value, value))
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        errors="replace",
+        cwd=cwd,
+        env=env,
+        # Own process group, so a timeout also kills ffmpeg/latex children
+        start_new_session=True,
+        preexec_fn=None if has_prlimit else limit_self
+    )
+    if has_prlimit:
+        _apply_limits(process.pid, limits)
+
+    # Stream output into a ring buffer instead of holding all of it in memory
+    log = deque(maxlen=log_lines)
+
+    def read_output():
+        for line in process.stdout:
+            log.append(line.rstrip("\n"))
+
+    reader = threading.Thread(target=read_output, name="render-log", daemon=True)
+    reader.start()
+
+    timed_out = threading.Event()
+    out_of_memory = threading.Event()
+    finished = threading.Event()
+
+    def kill(reason):
+        reason.set()
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def watch_memory():
+        while not finished.wait(MEMORY_POLL_SECONDS):
+            rss = _group_rss(process.pid)
+            if rss is None:
+                return
+            if rss > memory_limit:
+                print(f"Render {label or process.pid} uses {rss / 1024 ** 2:.0f} MB; killing it")
+                kill(out_of_memory)
+                return
+
+    timer = threading.Timer(timeout, kill, args=(timed_out,))
+    timer.daemon = True
+    timer.start()
+    if memory_limit:
+        threading.Thread(target=watch_memory, name="render-memory", daemon=True).start()
+    try:
+        # wait4 reports this child's own peak RSS and CPU time
+        _, status, usage = os.wait4(process.pid, 0)
+    finally:
+        finished.set()
+        timer.cancel()
+    process.returncode = os.waitstatus_to_exitcode(status)
+    reader.join(timeout=5)
+    process.stdout.close()
+
+    result = RenderResult(
+        returncode=process.returncode,
+        log="\n".join(log),
+        timed_out=timed_out.is_set(),
+        out_of_memory=out_of_memory.is_set(),
+        wall_seconds=time.perf_counter() - start,
+        cpu_seconds=usage.ru_utime + usage.ru_stime,
+        # ru_maxrss is in KB on Linux and bytes on macOS
+        peak_rss_mb=usage.ru_maxrss / (1024 ** 2 if sys.platform == "darwin" else 1024),
+    )
+    with _stats_lock:
+        _stats.append({
+            "label": label,
+            "ok": result.ok,
+            "wall_seconds": result.wall_seconds,
+            "cpu_seconds": result.cpu_seconds,
+            "peak_rss_mb": result.peak_rss_mb,
+        })
+    return result
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def render_stats():
+    """
+    Summarize resource usage of recent renders for capacity planning.
+    Returns:
+    dict: Render count, failures and p50/p95/max of peak RSS, CPU and wall time
+    """
+    with _stats_lock:
+        stats = list(_stats)
+    summary = {"renders": len(stats), "failed": sum(1 for s in stats if not s["ok"])}
+    if not stats:
+        return summary
+    for key in ("peak_rss_mb", "cpu_seconds", "wall_seconds"):
+        values = [s[key] for s in stats]
+        summary[key] = {
+            "p50": round(_percentile(values, 0.5), 2),
+            "p95": round(_percentile(values, 0.95), 2),
+            "max": round(max(values), 2),
+        }
+    return summary
+
+
+# Example usage: a runaway process is killed and accounted for
+if __name__ == "__main__":
+    fine = run_render([sys.executable, "-c", "print('\\n'.join(map(str, range(10000))))"],
+                      log_lines=3, label="chatty")
+    print(f"chatty: ok={fine.ok} log tail={fine.log.splitlines()}")
+
+    hog = run_render([sys.executable, "-c", "import time; x = b'x' * 512 * 1024 ** 2; time.sleep(30)"],
+                     memory_limit=256 * 1024 ** 2, label="memory hog")
+    print(f"memory hog: ok={hog.ok} out_of_memory={hog.out_of_memory} peak={hog.peak_rss_mb:.0f} MB "
+          f"wall={hog.wall_seconds:.1f}s")
+
+    # Reserving address space is fine; only touched memory counts
+    reserve = run_render([sys.executable, "-c", "import mmap; m = mmap.mmap(-1, 2 * 1024 ** 3)"],
+                         memory_limit=256 * 1024 ** 2, label="reserve")
+    print(f"reserve: ok={reserve.ok}")
+
+    hang = run_render([sys.executable, "-c", "import time; time.sleep(60)"], timeout=1, label="hang")
+    print(f"hang: ok={hang.ok} timed_out={hang.timed_out} wall={hang.wall_seconds:.1f}s")
+
+    print(render_stats())
@@ -0,0 +1,220 @@
+# render_output.py
+import os
+import time
+import fcntl
+import shutil
+import hashlib
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from helpers.storage_manager import in_flight, MEDIA_LOCK_NAME, LOCK_DIR_NAME
+
+# Manim writes videos to videos/<module>/<height>p<fps>/ for each quality flag
+QUALITY_FORMATS = {
+    "l": (480, 15),
+    "m": (720, 30),
+    "h": (1080, 60),
+}
+
+# Scene class rendered from every generated script
+SCENE_NAME = "MathSolutionAnimation"
+
+
+@dataclass(frozen=True)
+class RenderJob:
+    """Paths for one render, all derived from the job's content hash."""
+    job_id: str
+    work_dir: str
+    script_path: str
+    lock_path: str
+    media_dir: str
+    output_filename: str
+    video_path: str
+
+    @property
+    def module_name(self):
+        return os.path.splitext(os.path.basename(self.script_path))[0]
+
+    @property
+    def video_dir(self):
+        return os.path.join(self.media_dir, "videos", self.module_name)
+
+    @contextmanager
+    def lock(self):
+        """
+        Hold an exclusive lock on this job so identical concurrent requests
+        render once and the rest reuse the result. The working directory is
+        removed before the lock is released, and everything the render reads
+        or writes is protected from storage sweeps meanwhile, in this and
+        any other process (see helpers.storage_manager).
+        """
+        with _open_locked(self.lock_path, fcntl.LOCK_EX):
+            # Shared, so parallel jobs don't wait for each other; the sweeper
+            # needs it exclusively to touch the Tex/texts caches
+            with _open_locked(os.path.join(self.media_dir, MEDIA_LOCK_NAME), fcntl.LOCK_SH):
+                try:
+                    with in_flight(self.lock_path, self.work_dir, self.video_dir,
+                                   os.path.join(self.media_dir, "Tex"),
+                                   os.path.join(self.media_dir, "texts")):
+                        yield
+                finally:
+                    self.cleanup()
+
+    def chunk(self, index):
+        """
+        Job for one section of this render (see helpers.parallel_render).
+        Chunks share the working directory and lock of their parent job but
+        render into their own media directory inside it, so concurrent
+        Manim processes never write the same Tex/texts cache files.
+        """
+        module_name = f"{self.module_name}_chunk{index}"
+        output_filename = f"{module_name}.mp4"
+        quality_dir = os.path.basename(os.path.dirname(self.video_path))
+        media_dir = os.path.join(self.work_dir, f"chunk{index}_media")
+        return RenderJob(
+            job_id=f"{self.job_id}_chunk{index}",
+            work_dir=self.work_dir,
+            script_path=os.path.join(self.work_dir, f"{module_name}.py"),
+            lock_path=self.lock_path,
+            media_dir=media_dir,
+            output_filename=output_filename,
+            video_path=os.path.join(media_dir, "videos", module_name, quality_dir, output_filename),
+        )
+
+    def write_script(self, script_content):
+        """
+        Write the Manim script into the job's working directory.
+        Call while holding the lock so a concurrent job cannot remove it.
+        """
+        os.makedirs(self.work_dir, exist_ok=True)
+        with open(self.script_path, "w") as f:
+            f.write(script_content)
+
+    def cleanup(self):
+        """
+        Remove the job's working directory (script and bytecode).
+        """
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+@contextmanager
+def _open_locked(path, operation):
+    """
+    Open (creating if needed) and flock a lock file. The sweeper deletes
+    stale lock files while holding them, so after waiting for the lock make
+    sure the path still names the file we locked, and retry if not.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    while True:
+        lock_file = open(path, "a")
+        try:
+            fcntl.flock(lock_file, operation)
+            try:
+                current = os.stat(path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current == os.fstat(lock_file.fileno()).st_ino:
+                break
+        except BaseException:
+            lock_file.close()
+            raise
+        lock_file.close()
+    try:
+        yield lock_file
+    finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+
+def job_id_for(script_content, manim_quality, fps=None, renderer=None):
+    """
+    Content hash identifying a render.
+    Args:
+    script_content: Generated Manim script
+    manim_quality: Manim quality flag ("l", "m" or "h")
+    fps: Frame rate override, if any
+    renderer: Manim renderer, if not the default
+    Returns:
+    str: 16 hex characters
+    """
+    hasher = hashlib.sha256()
+    hasher.update(script_content.encode())
+    hasher.update(f"|{manim_quality}|{fps or ''}".encode())
+    if renderer:
+        hasher.update(f"|{renderer}".encode())
+    return hasher.hexdigest()[:16]
+
+
+def quality_folder(manim_quality, fps=None):
+    """
+    Name of the folder Manim renders a quality into, e.g. "720p30".
+    """
+    height, default_fps = QUALITY_FORMATS.get(manim_quality, QUALITY_FORMATS["m"])
+    return f"{height}p{float(fps or default_fps):g}"
+
+
+def prepare_job(script_content, output_dir, temp_dir, manim_quality, fps=None, renderer=None):
+    """
+    Resolve the isolated working directory and output path for a render.
+    Args:
+    script_content: Generated Manim script
+    output_dir: Manim media directory shared by all jobs
+    temp_dir: Parent directory for per-job working directories
+    manim_quality: Manim quality flag
+    fps: Frame rate override, if any
+    renderer: Manim renderer, if not the default
+    Returns:
+    RenderJob: Paths for the job; video_path is where Manim will write the
+    video, so no searching is needed afterwards
+    """
+    job_id = job_id_for(script_content, manim_quality, fps, renderer)
+    module_name = f"solution_{job_id}"
+    work_dir = os.path.join(temp_dir, job_id)
+    output_filename = f"{module_name}.mp4"
+    return RenderJob(
+        job_id=job_id,
+        work_dir=work_dir,
+        script_path=os.path.join(work_dir, f"{module_name}.py"),
+        lock_path=os.path.join(temp_dir, LOCK_DIR_NAME, f"{job_id}.lock"),
+        media_dir=output_dir,
+        output_filename=output_filename,
+        video_path=os.path.join(output_dir, "videos", module_name,
+                                quality_folder(manim_quality, fps), output_filename),
+    )
+
+
+# Example usage: stress test concurrent jobs with a fake renderer
+if __name__ == "__main__":
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    root = tempfile.mkdtemp(prefix="render_output_stress_")
+    renders = []
+    renders_lock = threading.Lock()
+
+    def fake_render(index):
+        # Every fourth request repeats an earlier script
+        script = f"scene {index % (3 if index % 4 == 0 else 1000)}"
+        job = prepare_job(script, os.path.join(root, "media"), os.path.join(root, "tmp"), "l")
+        with job.lock():
+            if not os.path.exists(job.video_path):
+                job.write_script(script)
+                with renders_lock:
+                    renders.append(job.job_id)
+                os.makedirs(os.path.dirname(job.video_path), exist_ok=True)
+                time.sleep(0.01)
+                with open(job.video_path, "w") as f:
+                    f.write(script)
+        with open(job.video_path) as f:
+            assert f.read() == script, "job resolved another job's video"
+        return job.video_path
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        paths = list(pool.map(fake_render, range(400)))
+    elapsed = time.perf_counter() - start
+
+    assert len(renders) == len(set(renders)), "identical jobs rendered twice"
+    print(f"{len(paths)} requests, {len(set(paths))} distinct videos, "
+          f"{len(renders)} renders in {elapsed:.2f}s")
+    shutil.rmtree(root)
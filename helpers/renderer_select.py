@@ -0,0 +1,212 @@
+# renderer_select.py
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+# Renderers Manim can drive from the CLI
+RENDERERS = ("cairo", "opengl")
+
+# Deployments pick their backend with MANIM_RENDERER after running the benchmark below
+DEFAULT_RENDERER = os.environ.get("MANIM_RENDERER", "cairo").lower()
+
+# Headless OpenGL backends for PyOpenGL/moderngl; both rasterize on the CPU
+# through Mesa (llvmpipe) when no GPU is present
+GL_PLATFORMS = ("egl", "osmesa")
+DEFAULT_GL_PLATFORM = os.environ.get("PYOPENGL_PLATFORM", "egl")
+
+# Seconds allowed for the OpenGL availability probe
+PROBE_TIMEOUT = 30
+
+_PROBE_SCRIPT = """
+import moderngl
+ctx = moderngl.create_standalone_context(backend=%r)
+print(ctx.info["GL_RENDERER"])
+"""
+
+_probe_results = {}
+
+
+def renderer_env(renderer, gl_platform=None, base_env=None):
+    """
+    Environment for a Manim process using the given renderer.
+    Args:
+    renderer: "cairo" or "opengl"
+    gl_platform: Headless GL platform for OpenGL ("egl" or "osmesa")
+    base_env: Environment to extend; defaults to os.environ
+    Returns:
+    dict: Environment variables for subprocess
+    """
+    env = dict(os.environ if base_env is None else base_env)
+    if renderer != "opengl":
+        return env
+    # Never open a window, and use Mesa's software rasterizer even if a
+    # (slow or shared) GPU driver is installed
+    env.pop("DISPLAY", None)
+    env["PYOPENGL_PLATFORM"] = gl_platform or DEFAULT_GL_PLATFORM
+    env["LIBGL_ALWAYS_SOFTWARE"] = "1"
+    env["GALLIUM_DRIVER"] = "llvmpipe"
+    return env
+
+
+def renderer_args(renderer):
+    """
+    Manim CLI arguments selecting the renderer.
+    OpenGL opens a preview window unless told to write a movie instead.
+    """
+    if renderer == "opengl":
+        return ["--renderer=opengl", "--write_to_movie"]
+    return ["--renderer=cairo"]
+
+
+def opengl_available(gl_platform=None):
+    """
+    Check once per platform whether a headless OpenGL context can be created.
+    Returns:
+    bool: True if moderngl created a context with the headless environment
+    """
+    gl_platform = gl_platform or DEFAULT_GL_PLATFORM
+    if gl_platform not in _probe_results:
+        try:
+            result = subprocess.run(
+                [sys.executable, "-c", _PROBE_SCRIPT % gl_platform],
+                capture_output=True,
+                text=True,
+                timeout=PROBE_TIMEOUT,
+                env=renderer_env("opengl", gl_platform)
+            )
+            available = result.returncode == 0
+            if available:
+                print(f"Headless OpenGL ({gl_platform}): {result.stdout.strip()}")
+            else:
+                print(f"Headless OpenGL ({gl_platform}) unavailable: {result.stderr.strip()[-300:]}")
+        except subprocess.TimeoutExpired:
+            print(f"Headless OpenGL ({gl_platform}) probe timed out")
+            available = False
+        _probe_results[gl_platform] = available
+    return _probe_results[gl_platform]
+
+
+def resolve_renderer(requested=None, gl_platform=None):
+    """
+    Pick the renderer to use, falling back to Cairo when OpenGL cannot run.
+    Args:
+    requested: "cairo", "opengl" or None for DEFAULT_RENDERER
+    gl_platform: Headless GL platform to probe for OpenGL
+    Returns:
+    str: A key of RENDERERS
+    """
+    renderer = (requested or DEFAULT_RENDERER).lower()
+    if renderer not in RENDERERS:
+        raise ValueError(f"Unknown renderer: {renderer}")
+    if renderer == "opengl" and not opengl_available(gl_platform):
+        print("Falling back to the Cairo renderer")
+        return "cairo"
+    return renderer
+
+
+def _count_frames(video_path):
+    """
+    Count video frames with ffprobe, or return None if it is unavailable.
+    """
+    if shutil.which("ffprobe") is None:
+        return None
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-count_packets",
+         "-show_entries", "stream=nb_read_packets", "-of", "csv=p=0", video_path],
+        capture_output=True,
+        text=True
+    )
+    try:
+        return int(result.stdout.strip())
+    except ValueError:
+        return None
+
+
+def benchmark_renderer(script_path, renderer, media_dir, manim_quality="m", gl_platform=None):
+    """
+    Render a script once and measure it.
+    Returns:
+    dict: "seconds", "frames", "fps" and "peak_rss_mb", or None on failure
+    """
+    output_filename = f"bench_{renderer}.mp4"
+    cmd = ["manim", script_path, "MathSolutionAnimation", "-o", output_filename,
+           "--media_dir", media_dir, "-q", manim_quality, "--disable_caching"]
+    cmd += renderer_args(renderer)
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        cwd=os.path.dirname(script_path),
+        env=renderer_env(renderer, gl_platform)
+    )
+    # wait4 reports the peak RSS of this child alone (in KB on Linux)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    if os.waitstatus_to_exitcode(status) != 0:
+        return None
+
+    video_path = next(
+        (os.path.join(root, output_filename)
+         for root, _, files in os.walk(media_dir) if output_filename in files),
+        None
+    )
+    frames = _count_frames(video_path) if video_path else None
+    return {
+        "seconds": elapsed,
+        "frames": frames,
+        "fps": frames / elapsed if frames else None,
+        "peak_rss_mb": usage.ru_maxrss / 1024,
+    }
+
+
+# Example usage: compare renderers on typical solution scenes
+#   python -m helpers.renderer_select [l|m|h]
+if __name__ == "__main__":
+    from helpers.manim_animator import generate_manim_script, parse_solution_steps
+
+    scenes = {
+        "linear": ("2x + 5 = 15", """
+            Step 1: $2x + 5 = 15$
+            Subtract 5 from both sides.
+            Step 2: $2x = 10$
+            Divide both sides by 2.
+            Step 3: $x = 5$
+            """),
+        "quadratic": ("x^2 - 5x + 6 = 0", """
+            Step 1: $x^2 - 5x + 6 = 0$
+            Factor the quadratic.
+            Step 2: $(x - 2)(x - 3) = 0$
+            Set each factor to zero.
+            Step 3: $x - 2 = 0$ or $x - 3 = 0$
+            Step 4: $x = 2$ or $x = 3$
+            Step 5: $\\{2, 3\\}$
+            """),
+    }
+    manim_quality = sys.argv[1] if len(sys.argv) > 1 else "m"
+    renderers = ["cairo"] + [f"opengl/{p}" for p in GL_PLATFORMS]
+
+    root = tempfile.mkdtemp(prefix="renderer_bench_")
+    try:
+        for name, (equation, explanation) in scenes.items():
+            script_path = os.path.join(root, f"bench_{name}.py")
+            with open(script_path, "w") as f:
+                f.write(generate_manim_script(equation, parse_solution_steps(explanation)))
+            for label in renderers:
+                renderer, _, gl_platform = label.partition("/")
+                if renderer == "opengl" and not opengl_available(gl_platform):
+                    print(f"{name:>10} {label:>14}: unavailable")
+                    continue
+                stats = benchmark_renderer(script_path, renderer, os.path.join(root, "media", label),
+                                           manim_quality, gl_platform or None)
+                if stats is None:
+                    print(f"{name:>10} {label:>14}: render failed")
+                    continue
+                fps = f"{stats['fps']:6.1f} fps" if stats["fps"] else "     ? fps"
+                print(f"{name:>10} {label:>14}: {stats['seconds']:6.2f}s  {fps}  "
+                      f"{stats['peak_rss_mb']:7.1f} MB peak RSS")
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,53 @@
+# rerun_benchmark.py
+import os
+import sys
+import time
+import statistics
+
+# The Streamlit app, next to the helpers package
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+# Reruns timed after the first (cold) run
+DEFAULT_RUNS = 20
+
+# Seconds allowed for one script run; the cold run imports the heavy models
+RUN_TIMEOUT = 300
+
+
+def time_reruns(app_path=APP_PATH, runs=DEFAULT_RUNS, debug_mode=False):
+    """
+    Time Streamlit script runs of the app without a browser.
+    Args:
+    app_path: Streamlit entry script
+    runs: Warm reruns to time after the first run
+    debug_mode: Run with the sidebar debug panel enabled
+    Returns:
+    tuple: (cold run seconds, list of warm rerun seconds)
+    """
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(app_path, default_timeout=RUN_TIMEOUT)
+    app.session_state["debug_mode"] = debug_mode
+    start = time.perf_counter()
+    app.run()
+    cold = time.perf_counter() - start
+    if app.exception:
+        raise RuntimeError(f"App raised during the first run: {app.exception}")
+
+    warm = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        app.run()
+        warm.append(time.perf_counter() - start)
+    return cold, warm
+
+
+# Example usage: python -m helpers.rerun_benchmark [runs]
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RUNS
+    for debug_mode in (False, True):
+        cold, warm = time_reruns(runs=runs, debug_mode=debug_mode)
+        label = "debug" if debug_mode else "normal"
+        print(f"{label:>6}: first run {cold * 1000:8.1f} ms, "
+              f"reruns median {statistics.median(warm) * 1000:6.1f} ms, "
+              f"max {max(warm) * 1000:6.1f} ms over {runs} runs")
@@ -0,0 +1,254 @@
+# session_store.py
+import os
+import sys
+import time
+import uuid
+import shelve
+import tempfile
+import threading
+import weakref
+from collections import namedtuple
+
+# In-memory budget for one session's follow-up history; older turns spill
+MAX_HISTORY_BYTES = 64 * 1024
+
+# Artifacts (e.g. explanations) larger than this live on disk, not in memory
+MAX_ARTIFACT_BYTES = 16 * 1024
+
+# Spilled records untouched for this long are pruned
+SPILL_TTL_SECONDS = 24 * 3600
+
+# Directory for the per-process spill files
+SPILL_DIR = os.path.join(tempfile.gettempdir(), "hackit_sessions")
+
+# One follow-up question and its answer; a tuple keeps per-turn overhead small
+Turn = namedtuple("Turn", "question answer")
+
+_stores = weakref.WeakSet()
+
+
+def _text_bytes(*texts):
+    return sum(sys.getsizeof(text) for text in texts)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SpillFile:
+    """Process-wide key-value file (shelve) shared by every session store."""
+
+    def __init__(self, directory=SPILL_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self._remove_orphans(directory)
+        # dbm files must not be shared between processes, so each gets its own
+        self.path = os.path.join(directory, f"spill_{os.getpid()}")
+        self._lock = threading.Lock()
+        self._shelf = shelve.open(self.path, flag="n")
+
+    @staticmethod
+    def _remove_orphans(directory):
+        """
+        Delete spill files left behind by processes that no longer exist.
+        """
+        for name in os.listdir(directory):
+            pid = name.split(".")[0][len("spill_"):]
+            if name.startswith("spill_") and pid.isdigit() and not _pid_alive(int(pid)):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    def put(self, key, value):
+        with self._lock:
+            self._shelf[key] = (time.time(), value)
+
+    def get(self, key, default=None):
+        with self._lock:
+            record = self._shelf.get(key)
+        return default if record is None else record[1]
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._shelf.keys() if k.startswith(prefix)]:
+                del self._shelf[key]
+
+    def prune(self, max_age=SPILL_TTL_SECONDS):
+        """
+        Drop records older than max_age (abandoned sessions).
+        Returns the number of records removed.
+        """
+        cutoff = time.time() - max_age
+        with self._lock:
+            stale = [key for key, (stored, _) in self._shelf.items() if stored < cutoff]
+            for key in stale:
+                del self._shelf[key]
+        return len(stale)
+
+
+_spill = None
+_spill_lock = threading.Lock()
+
+
+def shared_spill_file():
+    """
+    The SpillFile for this process, opened (and pruned) on first use.
+    """
+    global _spill
+    with _spill_lock:
+        if _spill is None:
+            _spill = SpillFile()
+        return _spill
+
+
+class SessionStore:
+    """
+    Follow-up history and large artifacts for one user session, with the
+    in-memory part capped by size and the rest kept in a SpillFile.
+    """
+
+    def __init__(self, spill=None, max_history_bytes=MAX_HISTORY_BYTES,
+                 max_artifact_bytes=MAX_ARTIFACT_BYTES):
+        self.session_id = uuid.uuid4().hex
+        self.max_history_bytes = max_history_bytes
+        self.max_artifact_bytes = max_artifact_bytes
+        self._spill = spill
+        self._lock = threading.Lock()
+        self._history = []
+        self._history_bytes = 0
+        self._spilled_turns = 0
+        self._artifacts = {}
+        self._spilled_artifacts = {}
+        _stores.add(self)
+
+    @property
+    def spill(self):
+        if self._spill is None:
+            self._spill = shared_spill_file()
+            self._spill.prune()
+        return self._spill
+
+    @property
+    def history(self):
+        """Turns still held in memory, oldest first."""
+        return list(self._history)
+
+    @property
+    def spilled_turn_count(self):
+        return self._spilled_turns
+
+    def add_turn(self, question, answer):
+        """
+        Record a follow-up turn, spilling the oldest turns over the budget.
+        """
+        with self._lock:
+            self._history.append(Turn(question, answer))
+            self._history_bytes += _text_bytes(question, answer)
+            # Always keep the latest turn in memory, however large
+            while self._history_bytes > self.max_history_bytes and len(self._history) > 1:
+                turn = self._history.pop(0)
+                self._history_bytes -= _text_bytes(*turn)
+                self.spill.put(f"{self.session_id}/turn/{self._spilled_turns}", tuple(turn))
+                self._spilled_turns += 1
+
+    def spilled_turns(self):
+        """
+        Load the turns moved to disk, oldest first.
+        """
+        turns = []
+        for index in range(self._spilled_turns):
+            record = self.spill.get(f"{self.session_id}/turn/{index}")
+            if record is not None:  # May have been pruned
+                turns.append(Turn(*record))
+        return turns
+
+    def set_artifact(self, name, value):
+        """
+        Store a text artifact, on disk if it is larger than max_artifact_bytes.
+        """
+        with self._lock:
+            self._artifacts.pop(name, None)
+            self._spilled_artifacts.pop(name, None)
+            size = _text_bytes(value)
+            if size > self.max_artifact_bytes:
+                self.spill.put(f"{self.session_id}/artifact/{name}", value)
+                self._spilled_artifacts[name] = size
+            else:
+                self._artifacts[name] = value
+
+    def get_artifact(self, name, default=None):
+        if name in self._artifacts:
+            return self._artifacts[name]
+        if name in self._spilled_artifacts:
+            return self.spill.get(f"{self.session_id}/artifact/{name}", default)
+        return default
+
+    def clear(self):
+        """
+        Forget the history and artifacts, including anything spilled.
+        """
+        with self._lock:
+            if self._spilled_turns or self._spilled_artifacts:
+                self.spill.delete_prefix(f"{self.session_id}/")
+            self._history = []
+            self._history_bytes = 0
+            self._spilled_turns = 0
+            self._artifacts = {}
+            self._spilled_artifacts = {}
+
+    def memory_usage(self):
+        """
+        Approximate footprint of this session.
+        Returns:
+        dict: Bytes and counts held in memory and spilled to disk
+        """
+        artifact_bytes = sum(_text_bytes(value) for value in self._artifacts.values())
+        return {
+            "history_turns": len(self._history),
+            "history_bytes": self._history_bytes,
+            "spilled_turns": self._spilled_turns,
+            "artifact_bytes": artifact_bytes,
+            "spilled_artifact_bytes": sum(self._spilled_artifacts.values()),
+            "memory_bytes": self._history_bytes + artifact_bytes,
+        }
+
+
+def session_memory_report():
+    """
+    Memory accounting across every live session in this process.
+    Returns:
+    dict: Session count, total and largest in-memory bytes, spilled turns
+    """
+    usages = [store.memory_usage() for store in list(_stores)]
+    return {
+        "sessions": len(usages),
+        "memory_bytes": sum(u["memory_bytes"] for u in usages),
+        "largest_session_bytes": max((u["memory_bytes"] for u in usages), default=0),
+        "spilled_turns": sum(u["spilled_turns"] for u in usages),
+    }
+
+
+# Example usage: many chatty sessions stay within their memory budget
+if __name__ == "__main__":
+    spill = SpillFile(tempfile.mkdtemp(prefix="session_store_"))
+    stores = [SessionStore(spill=spill) for _ in range(200)]
+    answer = "Subtract 5 from both sides, then divide by 2. " * 40
+    for turn in range(50):
+        for store in stores:
+            store.add_turn(f"Question {turn}?", answer)
+    stores[0].set_artifact("explanation_text", answer * 20)
+
+    first = stores[0]
+    assert len(first.spilled_turns()) + len(first.history) == 50
+    assert first.spilled_turns()[0].question == "Question 0?"
+    assert first.get_artifact("explanation_text") == answer * 20
+    print(first.memory_usage())
+    print(session_memory_report())
+    first.clear()
+    assert first.spilled_turns() == [] and first.get_artifact("explanation_text") is None
@@ -0,0 +1,90 @@
+# solver_core.py
+import threading
+from helpers.latex_validator import normalize_latex
+from helpers.ocr_preprocess import prepare_for_ocr
+from helpers.ocr_backend import load_model
+from helpers.ocr_workers import OcrWorkerPool, OCR_WORKERS
+
+# Gemini model used for solutions, explanations and follow-up questions
+GEMINI_MODEL_NAME = "gemini-1.5-flash"
+
+_ocr_model = None
+_ocr_lock = threading.Lock()
+_gemini_lock = threading.Lock()
+
+
+def load_ocr_model():
+    """
+    Load the LatexOCR model once per process; later calls reuse it.
+    The backend and thread counts come from OCR_BACKEND,
+    OCR_INTRA_OP_THREADS and OCR_INTER_OP_THREADS (see ocr_backend).
+    With OCR_WORKERS set, this is an OcrWorkerPool of forked workers
+    sharing one copy of the weights instead of an in-process model.
+    """
+    global _ocr_model
+    with _ocr_lock:
+        if _ocr_model is None:
+            _ocr_model = OcrWorkerPool(OCR_WORKERS).start() if OCR_WORKERS else load_model()
+        return _ocr_model
+
+
+def ocr_worker_report():
+    """
+    Memory and throughput of the OCR workers, or None for in-process OCR.
+    """
+    model = _ocr_model
+    return model.report() if hasattr(model, "report") else None
+
+
+def extract_latex(image, model=None, prepared=False):
+    """
+    Run OCR on an image and canonicalize the result.
+    Args:
+    image: PIL image containing an equation
+    model: LatexOCR instance; defaults to the shared one
+    prepared: True if the image already went through prepare_for_ocr
+    Returns:
+    tuple: (raw OCR output, normalized LaTeX)
+    Raises:
+    UnusableImage: If the photo is too blurry, dark, noisy or empty to read
+    LatexValidationError: If the OCR output cannot be rendered
+    """
+    # Cropping to the writing first saves the model from encoding blank paper,
+    # and hopeless photos are turned away before the model is even loaded.
+    # Only shadowed or grainy photos get the full (slow) preprocessing.
+    if not prepared:
+        image = prepare_for_ocr(image)
+    model = model or load_ocr_model()
+    raw_latex = model(image)
+    return raw_latex, normalize_latex(raw_latex) if raw_latex else ""
+
+
+def configure_gemini(api_key, model_name=GEMINI_MODEL_NAME):
+    """
+    Create a Gemini model client for an API key.
+    """
+    import google.generativeai as genai
+    # genai.configure sets process-wide state; keep configure+construct atomic
+    with _gemini_lock:
+        genai.configure(api_key=api_key)
+        return genai.GenerativeModel(model_name)
+
+
+def gemini_response(prompt, gemini_model):
+    """
+    Send a prompt to Gemini and return the response text.
+    """
+    return gemini_model.generate_content(prompt).text
+
+
+def solution_prompt(latex_code):
+    return f"Solve this equation and provide the final numerical or algebraic answer: {latex_code}"
+
+
+def explanation_prompt(latex_code):
+    return (
+        f"Explain step by step how to solve this equation: {latex_code}\n\n"
+        "Format each step as a clear equation on its own line.\n"
+        "After each equation step, briefly explain the operation performed.\n"
+        "Make sure each step follows logically from the previous one."
+    )
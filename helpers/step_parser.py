@@ -0,0 +1,273 @@
+# step_parser.py
+import re
+import time
+from typing import Optional
+from dataclasses import dataclass, replace
+from helpers.latex_validator import normalize_latex, LatexValidationError
+
+
+@dataclass(frozen=True)
+class SolutionStep:
+    """One step of a worked solution: an equation and the prose that follows it."""
+    equation: str
+    explanation: str = ""
+    number: Optional[int] = None
+
+    def with_equation(self, equation):
+        return replace(self, equation=equation)
+
+
+# Math is bounded in length so an unmatched delimiter cannot make the scan quadratic
+_TOKEN_RE = re.compile(r"""
+    \$\$(?P<display>[^$]{1,1000}?)\$\$                    # $$ ... $$
+  | \\\[(?P<bracket>.{1,1000}?)\\\]                       # \[ ... \]
+  | \$(?P<inline>[^$\n]{1,500}?)\$                        # $ ... $
+  | \\\((?P<paren>.{1,500}?)\\\)                          # \( ... \)
+  | (?P<newline>\n)
+  | (?P<text>[^$\\\n]+|.)
+""", re.VERBOSE | re.DOTALL)
+
+# "Step 3:", "**Step 3.**", "3)", "- ", "### " and similar line prefixes
+_PREFIX_RE = re.compile(r"""
+    ^\s*(?:\#{1,6}\s*)?(?:[-*•]\s+)?(?:[*_]{1,2})?\s*
+    (?:step\s*(?P<step>\d+)|(?P<item>\d+)[.)](?!\d))?
+    \s*[:.)-]?\s*(?:[*_]{1,2})?\s*
+""", re.VERBOSE | re.IGNORECASE)
+
+# Relations that make a math fragment an equation worth animating
+_RELATION_RE = re.compile(r"=|<|>|\\(?:neq|ne|le|leq|ge|geq|approx|equiv|Rightarrow|implies)(?![A-Za-z])")
+
+# Characters allowed in an undelimited equation line
+_BARE_MATH_RE = re.compile(r"^[\w\s+\-*/^=<>().,|\\{}\[\]'!×÷−√²³]+$")
+
+# Words (3+ letters, not part of a LaTeX command) mark a line as prose
+_WORD_RE = re.compile(r"(?<![\\A-Za-z])[A-Za-z]{3,}")
+_MATH_WORDS = {"sin", "cos", "tan", "cot", "sec", "csc", "log", "exp", "lim", "sqrt", "max", "min"}
+
+_UNICODE_MATH = {"×": "\\times ", "÷": "\\div ", "−": "-", "√": "\\sqrt ", "²": "^{2}", "³": "^{3}"}
+_UNICODE_RE = re.compile("|".join(_UNICODE_MATH))
+_MARKDOWN_RE = re.compile(r"[*_`]{1,3}")
+_SPACE_BEFORE_PUNCT_RE = re.compile(r"\s+([.,;:])")
+
+
+def _clean_equation(equation):
+    """
+    Normalize an equation candidate, or return None if it cannot render.
+    """
+    equation = _UNICODE_RE.sub(lambda m: _UNICODE_MATH[m.group()], equation)
+    equation = equation.strip().rstrip(".,;")
+    try:
+        return normalize_latex(equation)
+    except LatexValidationError:
+        return None
+
+
+def _clean_prose(prose):
+    prose = " ".join(_MARKDOWN_RE.sub("", prose).split())
+    return _SPACE_BEFORE_PUNCT_RE.sub(r"\1", prose).rstrip(":,;").strip()
+
+
+def _is_bare_equation(text):
+    """
+    Decide whether an undelimited line is an equation rather than prose.
+    """
+    if not _RELATION_RE.search(text) or not _BARE_MATH_RE.match(text):
+        return False
+    words = [w for w in _WORD_RE.findall(text) if w.lower() not in _MATH_WORDS]
+    return not words
+
+
+def _split_lines(text):
+    """
+    Tokenize the explanation in one regex pass.
+    Yields lists of (kind, value) tokens, one list per logical line; display
+    math always forms its own line.
+    """
+    line = []
+    for match in _TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        if kind == "newline":
+            yield line
+            line = []
+        elif kind in ("display", "bracket"):
+            if line:
+                yield line
+            yield [("display", match.group(kind))]
+            line = []
+        elif kind in ("inline", "paren"):
+            line.append(("inline", match.group(kind)))
+        else:
+            line.append(("text", match.group(kind)))
+    if line:
+        yield line
+
+
+def extract_steps(explanation_text):
+    """
+    Extract ordered solution steps from an LLM explanation.
+    Equations come from $$...$$, \\[...\\] and $...$ blocks containing a
+    relation, or from undelimited lines made only of math. On a line, the
+    prose leading up to each equation becomes its explanation; lines of
+    prose after an equation are added to it. Prose before the first
+    equation is dropped, and a numbered heading without an equation
+    introduces the next step.
+    Args:
+    explanation_text: Markdown/LaTeX explanation, e.g. from Gemini
+    Returns:
+    list: SolutionStep objects in order
+    """
+    steps = []
+    current_eq = None
+    current_number = None
+    explanation = []
+    pending_number = None
+    pending_prose = []
+
+    def flush():
+        if current_eq:
+            steps.append(SolutionStep(current_eq, " ".join(explanation).strip(), current_number))
+
+    for tokens in _split_lines(explanation_text or ""):
+        if not tokens:
+            continue
+
+        numbered = False
+        prose = ""
+        if tokens[0][0] == "display":
+            pairs = [(tokens[0][1], "")]
+        else:
+            # Strip step numbering and markdown from the start of the line
+            first_kind, first_value = tokens[0]
+            if first_kind == "text":
+                prefix = _PREFIX_RE.match(first_value)
+                if prefix.group("step") or prefix.group("item"):
+                    pending_number = int(prefix.group("step") or prefix.group("item"))
+                    numbered = True
+                tokens = [("text", first_value[prefix.end():])] + tokens[1:]
+
+            if any(kind == "inline" and _RELATION_RE.search(value) for kind, value in tokens):
+                # Split the prose per equation: "The answer is $x = 5$ and
+                # $y = 3$." gives x = 5 ("The answer is") and y = 3 ("and");
+                # math without a relation stays in the sentence
+                pairs = []
+                buffer = []
+                for kind, value in tokens:
+                    if kind == "inline" and _RELATION_RE.search(value):
+                        pairs.append((value, "".join(buffer)))
+                        buffer = []
+                    else:
+                        buffer.append(value.strip() if kind == "inline" else value)
+                tail = "".join(buffer)
+                if _MARKDOWN_RE.sub("", tail).strip(" .,;:"):
+                    equation, last = pairs[-1]
+                    pairs[-1] = (equation, f"{last} {tail}")
+            else:
+                # "Subtract 5 from both sides: 2x = 10" or a bare "2x = 10"
+                prose = "".join(value for kind, value in tokens)
+                head, sep, tail = prose.rpartition(":")
+                candidate = tail if sep else prose
+                candidate = _MARKDOWN_RE.sub("", candidate).strip()
+                if candidate and _is_bare_equation(candidate):
+                    pairs = [(candidate, head if sep else "")]
+                    prose = ""
+                else:
+                    pairs = []
+
+        # Prose of an equation that can't render moves on to the next one
+        cleaned = []
+        carried = [_clean_prose(prose)] if prose else []
+        for equation, text in pairs:
+            text = _clean_prose(text)
+            equation = _clean_equation(equation)
+            if equation:
+                cleaned.append((equation, " ".join(carried + [text]).strip()))
+                carried = []
+            elif text:
+                carried.append(text)
+        prose = " ".join(p for p in carried if p)
+
+        if not cleaned:
+            if prose and (numbered or pending_prose):
+                pending_prose.append(prose)
+            elif prose and current_eq:
+                explanation.append(prose)
+            continue
+
+        for equation, text in cleaned:
+            flush()
+            current_eq = equation
+            current_number = pending_number
+            pending_number = None
+            explanation = pending_prose + ([text] if text else [])
+            pending_prose = []
+        if prose:
+            explanation.append(prose)
+
+    # A trailing heading with no equation of its own still describes the last step
+    explanation.extend(pending_prose)
+    flush()
+    return steps
+
+
+# Real Gemini explanations (lightly trimmed) with the equations we expect
+GEMINI_CORPUS = [
+    ("""Here's how to solve the equation step by step:
+
+**Step 1:** $2x + 5 = 15$
+Subtract 5 from both sides of the equation.
+
+**Step 2:** $2x = 10$
+Divide both sides by 2.
+
+**Step 3:** $x = 5$
+This is the solution.""",
+     ["2x+5=15", "2x=10", "x=5"]),
+    ("""1. Start with the equation:
+$$x^2 - 5x + 6 = 0$$
+2. Factor the quadratic (we need two numbers that multiply to 6 and add to -5):
+$$(x - 2)(x - 3) = 0$$
+3. Set each factor equal to zero:
+$$x - 2 = 0 \\quad \\text{or} \\quad x - 3 = 0$$
+4. Solve for x:
+$$x = 2 \\quad \\text{or} \\quad x = 3$$""",
+     ["x^2-5x+6=0", "(x-2)(x-3)=0", "x-2=0\\quad\\text{or}\\quad x-3=0", "x=2\\quad\\text{or}\\quad x=3"]),
+    ("""To solve 3(x - 4) = 2x + 1:
+
+3(x - 4) = 2x + 1
+Distribute the 3 on the left-hand side (this gives 3x - 12).
+3x - 12 = 2x + 1
+Subtract 2x from both sides.
+x - 12 = 1
+Add 12 to both sides.
+x = 13
+
+The solution is x = 13.""",
+     ["3(x-4)=2x+1", "3x-12=2x+1", "x-12=1", "x=13"]),
+    ("""* **Step 1: Differentiate each term.** We use the power rule, \\( \\frac{d}{dx} x^n = n x^{n-1} \\).
+\\[ \\frac{d}{dx}(x^3 + 2x) = 3x^2 + 2 \\]
+* **Step 2: State the result.** The derivative of $x^3 + 2x$ is $3x^2 + 2$.""",
+     ["\\frac{d}{dx}x^n=nx^{n-1}", "\\frac{d}{dx}(x^3+2x)=3x^2+2"]),
+    ("""Step 1: Subtract 5 from both sides: 2x = 10
+Step 2: Divide by 2: x = 5
+Where x is the unknown value (ratio -> answer).""",
+     ["2x=10", "x=5"]),
+]
+
+
+# Example usage: python -m helpers.step_parser (checks the corpus and
+# benchmarks the parser)
+if __name__ == "__main__":
+    for text, expected in GEMINI_CORPUS:
+        found = [step.equation for step in extract_steps(text)]
+        assert found == expected, (found, expected)
+        print(f"ok: {found}")
+    steps = extract_steps("The answer is $x = 5$ and $y = 3$.")
+    assert [(step.equation, step.explanation) for step in steps] == [("x=5", "The answer is"), ("y=3", "and")], steps
+
+    long_text = "\n\n".join(text for text, _ in GEMINI_CORPUS) * 50
+    iterations = 20
+    start = time.perf_counter()
+    for _ in range(iterations):
+        extract_steps(long_text)
+    elapsed = (time.perf_counter() - start) / iterations
+    print(f"extract_steps: {elapsed * 1000:.2f} ms for {len(long_text)} characters")
@@ -0,0 +1,319 @@
+# storage_manager.py
+import os
+import re
+import time
+import fcntl
+import shutil
+import fnmatch
+import tempfile
+import threading
+from contextlib import contextmanager, nullcontext, ExitStack
+from dataclasses import dataclass
+
+# Total bytes kept across all managed areas before LRU eviction starts
+DEFAULT_QUOTA_BYTES = 2 * 1024 ** 3
+
+# Files touched this recently are never deleted, even if otherwise eligible
+GRACE_SECONDS = 120
+
+# Seconds between background sweeps
+SWEEP_INTERVAL = 600
+
+# Prefix for temp files created by image_helper.create_temp_file
+UPLOAD_PREFIX = "hackit_upload_"
+
+# Per-job lock files (temp_manim/locks/<job id>.lock). A job holds its lock
+# while it renders, in whichever process; the sweeper skips the job's files
+# while the lock is held and deletes a lock file only while holding it.
+LOCK_DIR_NAME = "locks"
+
+# Lock file in the media directory that running jobs hold shared; the
+# shared Tex/texts caches are only swept while nobody holds it
+MEDIA_LOCK_NAME = "render.lock"
+
+_JOB_ID_RE = re.compile(r"(?<![0-9a-f])([0-9a-f]{16})(?![0-9a-f])")
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+_manager = None
+_manager_lock = threading.Lock()
+
+
+@contextmanager
+def in_flight(*paths):
+    """
+    Mark paths (files or directories) as used by a running job so sweeps
+    leave them alone until the block exits.
+    """
+    paths = [os.path.abspath(path) for path in paths]
+    with _in_flight_lock:
+        for path in paths:
+            _in_flight[path] = _in_flight.get(path, 0) + 1
+    try:
+        yield
+    finally:
+        with _in_flight_lock:
+            for path in paths:
+                _in_flight[path] -= 1
+                if not _in_flight[path]:
+                    del _in_flight[path]
+
+
+def is_in_flight(path):
+    """
+    Check whether path is, or lies inside, a path marked in flight in this
+    process. Jobs in other processes are seen through their lock files.
+    """
+    path = os.path.abspath(path)
+    with _in_flight_lock:
+        return any(path == busy or path.startswith(busy + os.sep) for busy in _in_flight)
+
+
+@contextmanager
+def lock_if_free(path, create=False):
+    """
+    Try to take an exclusive flock on a lock file without waiting.
+    Yields True while it is held (or if the file doesn't exist and create
+    is False), False if someone else holds it.
+    """
+    try:
+        if create:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_RDWR | (os.O_CREAT if create else 0), 0o644)
+    except FileNotFoundError:
+        yield True
+        return
+    except OSError:
+        yield False
+        return
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            free = True
+        except OSError:
+            free = False
+        yield free
+    finally:
+        os.close(fd)
+
+
+@dataclass(frozen=True)
+class StorageArea:
+    """A directory (optionally filtered by a filename pattern) we clean up."""
+    name: str
+    path: str
+    max_age: float
+    pattern: str = "*"
+    # Directory of per-job lock files guarding files named after a job id
+    lock_dir: str = None
+    # Lock file running jobs hold shared while they use this area
+    shared_lock: str = None
+
+
+def default_areas(base_dir=None):
+    """
+    Storage areas used by the app, relative to the working directory.
+    """
+    base_dir = os.path.abspath(base_dir or os.getcwd())
+    day = 24 * 3600
+    media_lock = os.path.join(base_dir, "animations", MEDIA_LOCK_NAME)
+    lock_dir = os.path.join(base_dir, "temp_manim", LOCK_DIR_NAME)
+    return [
+        StorageArea("tex", os.path.join(base_dir, "animations", "Tex"), 30 * day, shared_lock=media_lock),
+        StorageArea("texts", os.path.join(base_dir, "animations", "texts"), 30 * day, shared_lock=media_lock),
+        StorageArea("videos", os.path.join(base_dir, "animations", "videos"), 7 * day, lock_dir=lock_dir),
+        StorageArea("temp_manim", os.path.join(base_dir, "temp_manim"), day, lock_dir=lock_dir),
+        StorageArea("uploads", tempfile.gettempdir(), 3600, UPLOAD_PREFIX + "*"),
+    ]
+
+
+class StorageManager:
+    """Sweeps managed areas by age and, over quota, by least recent use."""
+
+    def __init__(self, areas=None, quota_bytes=DEFAULT_QUOTA_BYTES, grace_seconds=GRACE_SECONDS):
+        self.areas = areas if areas is not None else default_areas()
+        self.quota_bytes = quota_bytes
+        self.grace_seconds = grace_seconds
+        self.last_sweep = None
+        self._lock = threading.Lock()
+
+    def _files(self, area):
+        """
+        Yield (path, size, last_used) for files in an area.
+        """
+        if not os.path.isdir(area.path):
+            return
+        # Uploads live directly in the system temp dir; don't walk all of it
+        walker = [(area.path, [], os.listdir(area.path))] if area.pattern != "*" else os.walk(area.path)
+        for root, _, files in walker:
+            for name in files:
+                if not fnmatch.fnmatch(name, area.pattern):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if not os.path.isfile(path):
+                    continue
+                yield path, stat.st_size, max(stat.st_atime, stat.st_mtime)
+
+    def _job_lock(self, area, path):
+        """
+        Lock file of the job a path in area belongs to, or None.
+        """
+        if not area.lock_dir:
+            return None
+        match = _JOB_ID_RE.search(os.path.relpath(path, area.path))
+        return os.path.join(area.lock_dir, f"{match.group(1)}.lock") if match else None
+
+    def _remove(self, area, path, now, last_used):
+        """
+        Delete a file unless it is in flight, its job is running in any
+        process, or it is inside the grace period. A lock file is deleted
+        while holding it, so no one can be waiting on it.
+        Returns True if it was removed.
+        """
+        if now - last_used < self.grace_seconds or is_in_flight(path):
+            return False
+        lock_path = self._job_lock(area, path)
+        try:
+            if lock_path is None:
+                os.remove(path)
+                return True
+            with lock_if_free(lock_path) as free:
+                if not free:
+                    return False
+                os.remove(path)
+                return True
+        except OSError:
+            return False
+
+    def _prune_empty_dirs(self, area):
+        if area.pattern != "*" or not os.path.isdir(area.path):
+            return
+        for root, dirs, files in os.walk(area.path, topdown=False):
+            if root == area.path or dirs or files or is_in_flight(root):
+                continue
+            lock_path = self._job_lock(area, root)
+            with lock_if_free(lock_path) if lock_path else nullcontext(True) as free:
+                if free:
+                    try:
+                        os.rmdir(root)
+                    except OSError:
+                        pass
+
+    def sweep(self):
+        """
+        Delete expired files, then least recently used ones while over quota.
+        Returns:
+        dict: Files and bytes removed
+        """
+        with self._lock, ExitStack() as held:
+            now = time.time()
+            removed_files = 0
+            removed_bytes = 0
+            survivors = []
+
+            # Shared caches are left alone while any job (in any process) renders
+            free = {}
+            for area in self.areas:
+                if area.shared_lock and area.shared_lock not in free:
+                    free[area.shared_lock] = held.enter_context(lock_if_free(area.shared_lock, create=True))
+            blocked = {area.name for area in self.areas if area.shared_lock and not free[area.shared_lock]}
+
+            # Age-based expiry per area
+            for index, area in enumerate(self.areas):
+                for path, size, last_used in self._files(area):
+                    if (area.name not in blocked and now - last_used > area.max_age
+                            and self._remove(area, path, now, last_used)):
+                        removed_files += 1
+                        removed_bytes += size
+                    else:
+                        survivors.append((last_used, size, path, index))
+
+            # LRU eviction across all areas until under quota
+            total = sum(size for _, size, _, _ in survivors)
+            if total > self.quota_bytes:
+                for last_used, size, path, index in sorted(survivors):
+                    if total <= self.quota_bytes:
+                        break
+                    area = self.areas[index]
+                    if area.name not in blocked and self._remove(area, path, now, last_used):
+                        total -= size
+                        removed_files += 1
+                        removed_bytes += size
+
+            for area in self.areas:
+                if area.name not in blocked:
+                    self._prune_empty_dirs(area)
+            self.last_sweep = now
+            if removed_files:
+                print(f"Storage sweep removed {removed_files} files ({removed_bytes / 1024 ** 2:.1f} MB)")
+            return {"files": removed_files, "bytes": removed_bytes}
+
+    def usage(self):
+        """
+        Report disk usage per managed area and for the disk holding them.
+        Returns:
+        dict: area name -> {"files", "bytes"}, plus "total_bytes",
+        "quota_bytes", "disk_free_bytes" and "last_sweep"
+        """
+        report = {}
+        total = 0
+        for area in self.areas:
+            files = 0
+            size_sum = 0
+            for _, size, _ in self._files(area):
+                files += 1
+                size_sum += size
+            report[area.name] = {"files": files, "bytes": size_sum}
+            total += size_sum
+        disk_root = next((a.path for a in self.areas if os.path.isdir(a.path)), os.getcwd())
+        report["total_bytes"] = total
+        report["quota_bytes"] = self.quota_bytes
+        report["disk_free_bytes"] = shutil.disk_usage(disk_root).free
+        report["last_sweep"] = self.last_sweep
+        return report
+
+
+def shared_storage_manager():
+    """
+    The StorageManager for this process, shared by every session and request.
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = StorageManager()
+        return _manager
+
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def start_background_sweeper(manager=None, interval=SWEEP_INTERVAL):
+    """
+    Sweep periodically in a daemon thread; only one sweeper runs per process.
+    Args:
+    manager: StorageManager to sweep with; defaults to the shared one
+    Returns:
+    threading.Thread: The sweeper thread
+    """
+    global _sweeper
+    manager = manager or shared_storage_manager()
+    with _sweeper_lock:
+        if _sweeper is not None and _sweeper.is_alive():
+            return _sweeper
+
+        def run():
+            while True:
+                try:
+                    manager.sweep()
+                except Exception as e:
+                    print(f"Storage sweep failed: {str(e)}")
+                time.sleep(interval)
+
+        _sweeper = threading.Thread(target=run, name="storage-sweeper", daemon=True)
+        _sweeper.start()
+        return _sweeper
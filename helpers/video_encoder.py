@@ -0,0 +1,158 @@
+# video_encoder.py
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+# ffmpeg settings per preset; "container" is the output file extension
+ENCODING_PRESETS = {
+    "preview": {
+        "container": "mp4",
+        "args": ["-c:v", "libx264", "-preset", "ultrafast", "-tune", "animation",
+                 "-crf", "30", "-pix_fmt", "yuv420p", "-movflags", "+faststart"],
+    },
+    "standard": {
+        "container": "mp4",
+        "args": ["-c:v", "libx264", "-preset", "veryfast", "-tune", "animation",
+                 "-crf", "23", "-pix_fmt", "yuv420p", "-movflags", "+faststart"],
+    },
+    "archive": {
+        "container": "mp4",
+        "args": ["-c:v", "libx264", "-preset", "slow", "-tune", "animation",
+                 "-crf", "18", "-pix_fmt", "yuv420p", "-movflags", "+faststart"],
+    },
+    "webm": {
+        "container": "webm",
+        "args": ["-c:v", "libvpx-vp9", "-crf", "35", "-b:v", "0", "-deadline", "realtime",
+                 "-cpu-used", "8", "-row-mt", "1"],
+    },
+    "gif": {
+        "container": "gif",
+        "args": ["-vf", "fps=12,scale=480:-1:flags=lanczos,split[a][b];"
+                        "[a]palettegen=stats_mode=diff[p];[b][p]paletteuse=dither=bayer",
+                 "-loop", "0"],
+    },
+}
+
+# Seconds allowed for a single ffmpeg invocation
+ENCODE_TIMEOUT = 300
+
+
+def encoded_path(video_path, preset):
+    """
+    Output path for a preset, next to the source video.
+    e.g. solution_ab12.mp4 -> solution_ab12.preview.mp4
+    """
+    container = ENCODING_PRESETS[preset]["container"]
+    stem = os.path.splitext(video_path)[0]
+    return f"{stem}.{preset}.{container}"
+
+
+def _run_ffmpeg(args):
+    result = subprocess.run(
+        ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error"] + args,
+        capture_output=True,
+        text=True,
+        timeout=ENCODE_TIMEOUT
+    )
+    if result.returncode != 0:
+        print(f"ffmpeg error (code {result.returncode}): {result.stderr}")
+        return False
+    return True
+
+
+def encode_video(video_path, preset="standard", output_path=None, threads=None):
+    """
+    Re-encode a rendered video with a tunable preset.
+    Args:
+    video_path: Video produced by Manim
+    preset: Key of ENCODING_PRESETS
+    output_path: Destination; defaults to encoded_path(video_path, preset)
+    threads: Encoder threads; defaults to every core
+    Returns:
+    str: Path to the encoded file, or None if encoding failed
+    """
+    if preset not in ENCODING_PRESETS:
+        raise ValueError(f"Unknown encoding preset: {preset}")
+    if shutil.which("ffmpeg") is None:
+        print("ffmpeg not found; keeping Manim's encoding")
+        return None
+
+    output_path = output_path or encoded_path(video_path, preset)
+    threads = threads or os.cpu_count() or 1
+    # Write to a temp name first so readers never see a half-written file
+    partial_path = output_path + ".part"
+    args = ["-i", video_path, "-threads", str(threads)] + ENCODING_PRESETS[preset]["args"]
+    args += ["-an", "-f", ENCODING_PRESETS[preset]["container"], partial_path]
+    if not _run_ffmpeg(args):
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        return None
+    os.replace(partial_path, output_path)
+    return output_path
+
+
+def concat_videos(video_paths, output_path, durations=None):
+    """
+    Join videos with identical codec settings without re-encoding.
+    Args:
+    video_paths: Videos in playback order, e.g. Manim partial movies
+    output_path: Destination file
+    durations: Optional {index: seconds}; each listed clip is shown for that
+    long, so a single-frame clip becomes a hold without encoding more frames
+    Returns:
+    str: output_path, or None if ffmpeg failed
+    """
+    durations = durations or {}
+    if not video_paths:
+        return None
+    if shutil.which("ffmpeg") is None:
+        print("ffmpeg not found; cannot concatenate videos")
+        return None
+
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as list_file:
+        for index, path in enumerate(video_paths):
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+            if index in durations:
+                list_file.write(f"duration {durations[index]:.3f}\n")
+    try:
+        partial_path = output_path + ".part"
+        ext = os.path.splitext(output_path)[1].lstrip(".") or "mp4"
+        args = ["-f", "concat", "-safe", "0", "-i", list_file.name, "-c", "copy"]
+        if ext == "mp4":
+            args += ["-movflags", "+faststart"]
+        args += ["-f", ext, partial_path]
+        if not _run_ffmpeg(args):
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            return None
+        os.replace(partial_path, output_path)
+        return output_path
+    finally:
+        os.remove(list_file.name)
+
+
+# Example usage: benchmark every preset on a rendered video
+#   python -m helpers.video_encoder animations/videos/<job>/720p30/<job>.mp4
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m helpers.video_encoder <video.mp4>")
+        sys.exit(1)
+
+    source = sys.argv[1]
+    source_bytes = os.path.getsize(source)
+    print(f"Source: {source} ({source_bytes / 1024:.0f} KB)")
+    with tempfile.TemporaryDirectory() as out_dir:
+        for name in ENCODING_PRESETS:
+            target = os.path.join(out_dir, f"bench.{name}.{ENCODING_PRESETS[name]['container']}")
+            start = time.perf_counter()
+            result = encode_video(source, name, target)
+            elapsed = time.perf_counter() - start
+            if result:
+                size = os.path.getsize(result)
+                print(f"{name:>8}: {elapsed:6.2f}s  {size / 1024:8.0f} KB  ({size / source_bytes:.0%} of source)")
+            else:
+                print(f"{name:>8}: failed")